@@ -1,10 +1,18 @@
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request
+from flask_compress import Compress
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager
 from dotenv import load_dotenv
 from flasgger import Swagger
+from pydantic import ValidationError
+from werkzeug.exceptions import HTTPException
+import logging
 import os
 
+from utils.auth_decorators import JWTManagerConCache
+from utils.db import ERROR_FK_INEXISTENTE, IntegrityError
+from utils.helpers import ErrorDominio, api_response, iniciar_logging_en_cola
+from utils.serializacion import ORJSONProvider
+
 # Importar blueprints
 from blueprints.usuarios import usuarios_bp
 from blueprints.productos import productos_bp
@@ -21,15 +29,30 @@ from blueprints.ventas import ventas_bp
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Los logs se escriben desde un hilo en segundo plano
+iniciar_logging_en_cola()
+
 # Inicia la aplicación Flask
 app = Flask(__name__)
+# jsonify y request.get_json usan orjson, igual que api_response
+app.json = ORJSONProvider(app)
 
 # Configuración de la Aplicación
 app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY", "clave-super-secreta")  # Clave JWT
 app.config['SECRET_KEY'] = os.getenv("FLASK_SECRET_KEY", "super-secret-flask-key-por-defecto")
 
-jwt = JWTManager(app)
+# Compresión de respuestas (Content-Encoding). Las menores a 1 KiB no se comprimen.
+app.config["COMPRESS_ALGORITHM"] = ["br", "zstd", "gzip"]
+app.config["COMPRESS_LEVEL"] = 4
+app.config["COMPRESS_BR_LEVEL"] = 4
+app.config["COMPRESS_MIN_SIZE"] = 1024
+
+# Las firmas de los JWT ya verificados se recuerdan unos segundos (ver JWTManagerConCache)
+jwt = JWTManagerConCache(app)
 CORS(app)
+Compress(app)
 
 # --- Configuración de Flasgger (Swagger UI) ---
 swagger_config = {
@@ -98,6 +121,31 @@ def revoked_token_response(jwt_header, jwt_payload):
 def forbidden(error):
     return jsonify({"success": False, "message": "Acceso denegado: No tienes permiso para realizar esta acción."}), 403
 
+# --- Errores esperados lanzados por los endpoints (404, 409, ...) ---
+@app.errorhandler(ErrorDominio)
+def error_dominio(error):
+    return api_response(message=error.mensaje, status_code=error.status_code)
+
+# --- Errores no controlados dentro de los endpoints ---
+@app.errorhandler(IntegrityError)
+def integrity_error(error):
+    logger.warning("Restricción de integridad violada en %s %s: %s", request.method, request.path, error)
+    if error.args and error.args[0] == ERROR_FK_INEXISTENTE:
+        return api_response(message="Un registro referenciado no existe.", status_code=400)
+    return api_response(message="La operación entra en conflicto con datos existentes.", status_code=409)
+
+@app.errorhandler(ValidationError)
+def validation_error(error):
+    return api_response(message="Los datos enviados no son válidos.", status_code=400)
+
+@app.errorhandler(Exception)
+def unhandled_error(error):
+    # Los errores HTTP (404, 405, abort(...)) conservan su respuesta normal
+    if isinstance(error, HTTPException):
+        return error
+    logger.exception("Error no controlado en %s %s", request.method, request.path)
+    return api_response(message="Error interno del servidor.", status_code=500)
+
 if __name__ == '__main__':
     port = int(os.getenv("FLASK_RUN_PORT", 5000))
     debug_mode = os.getenv("FLASK_DEBUG", "True").lower() == "true"
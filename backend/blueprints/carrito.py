@@ -156,7 +156,6 @@ def agregar_producto_al_carrito():
 
     except Exception as e:
         print(f"DEBUG_CARRITO_AGREGAR_ERROR: {e}")
-        conn.rollback()
         return api_response(message="Error interno del servidor al agregar producto al carrito.", status_code=500, error=str(e))
 
 @carrito_bp.route('/', methods=['GET'])
@@ -339,7 +338,6 @@ def actualizar_cantidad_producto_en_carrito(id_producto):
 
     except Exception as e:
         print(f"DEBUG_CARRITO_ACTUALIZAR_ERROR: {e}")
-        conn.rollback()
         return api_response(message="Error interno del servidor al actualizar el carrito.", status_code=500, error=str(e))
 
 @carrito_bp.route('/<int:id_producto>', methods=['DELETE'])
@@ -391,7 +389,6 @@ def eliminar_producto_del_carrito(id_producto):
 
     except Exception as e:
         print(f"DEBUG_CARRITO_ELIMINAR_ERROR: {e}")
-        conn.rollback()
         return api_response(message="Error interno del servidor al eliminar producto del carrito.", status_code=500, error=str(e))
 
 @carrito_bp.route('/vaciar', methods=['DELETE'])
@@ -434,7 +431,6 @@ def vaciar_mi_carrito():
 
     except Exception as e:
         print(f"DEBUG_CARRITO_VACIAR_ERROR: {e}")
-        conn.rollback()
         return api_response(message="Error interno del servidor al vaciar el carrito.", status_code=500, error=str(e))
 
 
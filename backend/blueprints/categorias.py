@@ -4,6 +4,7 @@ from utils.db import conectar_db
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from utils.auth_decorators import Administrador_requerido # Solo el administrador debería gestionar categorías
 from utils.helpers import api_response, db_session, limpiar_string
+from utils.cache import invalidar_productos
 
 # Define el Blueprint para categorías
 categorias_bp = Blueprint('categorias_bp', __name__)
@@ -244,7 +245,15 @@ def actualizar_categoria(id_categoria):
             cursor.execute(query_updated, (id_categoria,))
             updated_category = cursor.fetchone()
 
-            return api_response(data=updated_category, message="Categoría actualizada exitosamente.", status_code=200)
+            # Las lecturas de productos incluyen nombre_categoria: sus entradas en caché quedan viejas
+            productos_afectados = []
+            if nombre_categoria:
+                cursor.execute("SELECT id_producto FROM productos WHERE id_categoria = %s", (id_categoria,))
+                productos_afectados = [fila['id_producto'] for fila in cursor.fetchall()]
+
+        if productos_afectados:
+            invalidar_productos(productos_afectados)
+        return api_response(data=updated_category, message="Categoría actualizada exitosamente.", status_code=200)
 
     except Exception as e:
         print(f"DEBUG_CATEGORIA_UPDATE_ERROR: {e}")
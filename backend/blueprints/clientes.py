@@ -3,7 +3,7 @@ import pymysql.cursors
 from utils.db import conectar_db
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from utils.auth_decorators import Administrador_requerido # Solo el administrador puede gestionar otros clientes
-from utils.helpers import api_response, db_session, limpiar_string
+from utils.helpers import api_response, db_session, invalidar_id_cliente, limpiar_string
 
 # Define el Blueprint para clientes
 clientes_bp = Blueprint('clientes_bp', __name__)
@@ -432,8 +432,9 @@ def actualizar_cliente_por_id(id_cliente):
     try:
         with db_session() as (conn, cursor):
             # 1. Verificar si el perfil de cliente existe
-            cursor.execute("SELECT id_cliente FROM clientes WHERE id_cliente = %s", (id_cliente,))
-            if not cursor.fetchone():
+            cursor.execute("SELECT id_usuario FROM clientes WHERE id_cliente = %s", (id_cliente,))
+            cliente = cursor.fetchone()
+            if not cliente:
                 return api_response(message="Perfil de cliente no encontrado.", status_code=404)
             
             update_query = "UPDATE clientes SET " + ", ".join(update_fields) + " WHERE id_cliente = %s"
@@ -489,8 +490,9 @@ def eliminar_cliente_por_id(id_cliente):
     try:
         with db_session() as (conn, cursor):
             # Verificar si el perfil de cliente existe
-            cursor.execute("SELECT id_cliente FROM clientes WHERE id_cliente = %s", (id_cliente,))
-            if not cursor.fetchone():
+            cursor.execute("SELECT id_usuario FROM clientes WHERE id_cliente = %s", (id_cliente,))
+            cliente = cursor.fetchone()
+            if not cliente:
                 return api_response(message="Perfil de cliente no encontrado.", status_code=404)
             
             delete_query = "DELETE FROM clientes WHERE id_cliente = %s"
@@ -499,6 +501,7 @@ def eliminar_cliente_por_id(id_cliente):
             if cursor.rowcount == 0:
                 return api_response(message="Perfil de cliente no encontrado o no se pudo eliminar.", status_code=404)
 
+            invalidar_id_cliente(cliente['id_usuario'])
             return api_response(message="Perfil de cliente eliminado exitosamente.", status_code=200)
 
     except Exception as e:
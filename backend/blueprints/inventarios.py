@@ -4,6 +4,7 @@ from utils.db import conectar_db
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from utils.auth_decorators import Administrador_requerido, Administrador_o_Empleado_requerido
 from utils.helpers import api_response, db_session, limpiar_string
+from utils.cache import invalidar_producto
 
 
 inventarios_bp = Blueprint('inventarios_bp', __name__)
@@ -90,11 +91,13 @@ def actualizar_stock_producto(id_producto):
             # Opcional: Registrar el movimiento en una tabla de auditoría de inventario si existiera
             # (No implementado aquí para simplificar, pero es una buena práctica para el futuro)
 
-            return api_response(data={
-                "id_producto": id_producto,
-                "nombre_producto": producto['nombre_producto'],
-                "stock": nuevo_stock
-            }, message="Stock del producto actualizado exitosamente.", status_code=200)
+        # El stock forma parte del catálogo en caché
+        invalidar_producto(id_producto)
+        return api_response(data={
+            "id_producto": id_producto,
+            "nombre_producto": producto['nombre_producto'],
+            "stock": nuevo_stock
+        }, message="Stock del producto actualizado exitosamente.", status_code=200)
 
     except Exception as e:
         print(f"DEBUG_INVENTORY_UPDATE_ERROR: {e}")
@@ -1,14 +1,16 @@
+import logging
 from flask import Blueprint, jsonify, request
-import pymysql.cursors
-from utils.db import conectar_db
+from utils.db import conectar_db, DBError
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from utils.auth_decorators import Administrador_requerido
 from utils.helpers import api_response, db_session, limpiar_string
-import uuid # Para generar IDs de transacción simulados
+from utils.ids import nuevo_transaccion_id
 
 # Define el Blueprint para pagos
 pagos_bp = Blueprint('pagos_bp', __name__)
 
+logger = logging.getLogger(__name__)
+
 # --- Rutas para la gestión de pagos ---
 
 @pagos_bp.route('/procesar', methods=['POST'])
@@ -116,7 +118,7 @@ def procesar_pago():
             # En un sistema real, aquí interactuarías con Stripe, PayPal, etc.
             # Para esta simulación, asumimos que el pago siempre es "Aprobado".
             estado_pago = 'Aprobado'
-            transaccion_id = str(uuid.uuid4()) # ID de transacción simulado
+            transaccion_id = nuevo_transaccion_id() # ID de transacción simulado
             # --- Fin de simulación ---
 
             # 3. Registrar el pago
@@ -144,13 +146,12 @@ def procesar_pago():
             }
             return api_response(data=response_data, message="Pago procesado exitosamente.", status_code=200)
 
-    except pymysql.Error as db_error:
-        conn.rollback()
-        print(f"DEBUG_PAGO_DB_ERROR: {db_error}")
+    except DBError as db_error:
+        # db_session() ya hizo rollback y devolvió la conexión al pool
+        logger.exception("Error de base de datos al procesar el pago del pedido %s", id_pedido)
         return api_response(message="Error de base de datos al procesar el pago.", status_code=500, error=str(db_error))
     except Exception as e:
-        print(f"DEBUG_PAGO_PROCESAR_ERROR: {e}")
-        conn.rollback()
+        logger.exception("Error al procesar el pago del pedido %s", id_pedido)
         return api_response(message="Error interno del servidor al procesar el pago.", status_code=500, error=str(e))
 
 @pagos_bp.route('/<int:id_pago>', methods=['GET'])
@@ -209,7 +210,7 @@ def obtener_detalle_pago(id_pago):
             return api_response(data=pago_info, message="Detalles del pago obtenidos exitosamente.", status_code=200)
 
     except Exception as e:
-        print(f"DEBUG_PAGO_GET_BY_ID_ERROR: {e}")
+        logger.exception("Error al obtener el pago %s", id_pago)
         return api_response(message="Error interno del servidor al obtener el detalle del pago.", status_code=500, error=str(e))
 
 @pagos_bp.route('/admin', methods=['GET'])
@@ -243,7 +244,7 @@ def obtener_todos_los_pagos_admin():
             return api_response(data=pagos, message="Lista de todos los pagos obtenida exitosamente.", status_code=200)
 
     except Exception as e:
-        print(f"DEBUG_PAGO_GET_ALL_ADMIN_ERROR: {e}")
+        logger.exception("Error al obtener todos los pagos")
         return api_response(message="Error interno del servidor al obtener todos los pagos.", status_code=500, error=str(e))
 
 @pagos_bp.route('/<int:id_pago>/estado', methods=['PUT'])
@@ -319,6 +320,5 @@ def actualizar_estado_pago_admin(id_pago):
             return api_response(data=updated_pago, message="Estado del pago actualizado exitosamente.", status_code=200)
 
     except Exception as e:
-        print(f"DEBUG_PAGO_UPDATE_ADMIN_ERROR: {e}")
-        conn.rollback()
+        logger.exception("Error al actualizar el estado del pago %s", id_pago)
         return api_response(message="Error interno del servidor al actualizar el estado del pago.", status_code=500, error=str(e))
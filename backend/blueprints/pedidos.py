@@ -1,13 +1,188 @@
+import logging
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from operator import itemgetter
 from flask import Blueprint, jsonify, request
-import pymysql.cursors
-from utils.db import conectar_db
+from utils.db import conectar_db, DBError
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from utils.auth_decorators import Administrador_requerido
-from utils.helpers import api_response, db_session, limpiar_string
+from utils.helpers import (api_response, con_etag, db_session, etag_coincide,
+                           limpiar_string, obtener_id_cliente, obtener_limite, respuesta_no_modificada, valor_etag)
+from utils.cache import TTL_PRODUCTO, clave_producto, guardar_muchos, obtener_muchos
 
 # Define el Blueprint para pedidos
 pedidos_bp = Blueprint('pedidos_bp', __name__)
 
+logger = logging.getLogger(__name__)
+
+# Extrae (id_producto, cantidad) de cada ítem del pedido
+_id_y_cantidad = itemgetter('id_producto', 'cantidad')
+
+# Consultas SQL del módulo, definidas una sola vez al importarlo. Las que llevan
+# {placeholders}, {casos} o {filtro} se completan con .format() según la cantidad de valores.
+SQL_PERFIL_CLIENTE = "SELECT id_cliente, direccion, ciudad, telefono FROM clientes WHERE id_usuario = %s"
+SQL_PEDIDO_DE_CLIENTE = "SELECT * FROM pedidos WHERE id_pedido = %s AND id_cliente = %s"
+SQL_IDS_DETALLE_POR_PEDIDO = "SELECT id_detalle_pedido, id_producto FROM detalle_pedidos WHERE id_pedido = %s"
+SQL_INFO_PRODUCTOS = "SELECT id_producto, nombre AS nombre_producto FROM productos WHERE id_producto IN ({placeholders})"
+SQL_DETALLES_DE_PEDIDOS = """
+    SELECT id_pedido, id_detalle_pedido, id_producto, cantidad, precio_unitario
+    FROM detalle_pedidos
+    WHERE id_pedido IN ({placeholders})
+"""
+SQL_BLOQUEAR_PRODUCTOS = """
+    SELECT p.id_producto, p.precio_venta, p.nombre AS nombre_producto, i.cantidad_disponible
+    FROM productos p
+    JOIN inventarios i ON p.id_producto = i.id_producto
+    WHERE p.id_producto IN ({placeholders})
+    FOR UPDATE
+"""
+SQL_INSERTAR_PEDIDO = """
+    INSERT INTO pedidos (id_cliente, fecha_pedido, estado_pedido, total_pedido, direccion_envio, ciudad_envio, telefono_contacto)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+SQL_INSERTAR_DETALLE = """
+    INSERT INTO detalle_pedidos (id_pedido, id_producto, cantidad, precio_unitario)
+    VALUES (%s, %s, %s, %s)
+"""
+SQL_DESCONTAR_INVENTARIO = """
+    UPDATE inventarios
+    SET cantidad_disponible = cantidad_disponible - CASE id_producto {casos} END
+    WHERE id_producto IN ({placeholders})
+"""
+SQL_PEDIDOS_DE_CLIENTE = "SELECT * FROM pedidos WHERE id_cliente = %s AND {filtro} ORDER BY fecha_pedido DESC, id_pedido DESC LIMIT %s"
+SQL_PEDIDOS = "SELECT * FROM pedidos WHERE {filtro} ORDER BY fecha_pedido DESC, id_pedido DESC LIMIT %s"
+SQL_PEDIDO_CON_DETALLES = """
+    SELECT p.*, dp.id_detalle_pedido, dp.id_producto, dp.cantidad, dp.precio_unitario
+    FROM pedidos p
+    LEFT JOIN detalle_pedidos dp ON dp.id_pedido = p.id_pedido
+    WHERE p.id_pedido = %s
+"""
+_COLUMNAS_DETALLE = ('id_detalle_pedido', 'id_producto', 'cantidad', 'precio_unitario')
+SQL_ACTUALIZAR_ESTADO = "UPDATE pedidos SET estado_pedido = %s WHERE id_pedido = %s"
+SQL_ELIMINAR_PEDIDO = "DELETE FROM pedidos WHERE id_pedido = %s"
+
+# --- Funciones auxiliares ---
+
+def _obtener_id_cliente(cursor, id_usuario):
+    """
+    id_cliente del usuario autenticado. Se toma del token (claim 'id_cliente')
+    y para tokens emitidos sin ese claim se usa la búsqueda memorizada de helpers.
+    """
+    id_cliente = get_jwt().get('id_cliente')
+    if id_cliente is not None:
+        return id_cliente
+    return obtener_id_cliente(cursor, id_usuario)
+
+def _leer_parametros_paginacion():
+    """
+    Lee ?before=<fecha ISO>&before_id=<id>&limit=<n> para la paginación por
+    cursor (keyset) de los listados. Lanza ValueError si algún valor es inválido.
+    """
+    before = request.args.get('before')
+    before_id = request.args.get('before_id')
+    limite = obtener_limite(request.args.get('limit'))
+    try:
+        fecha = datetime.fromisoformat(before) if before else None
+        before_id = int(before_id) if before_id else None
+    except ValueError:
+        raise ValueError("Los parámetros 'before' (fecha ISO) y 'before_id' (entero) no son válidos.")
+    return fecha, before_id, limite
+
+def _filtro_keyset(fecha, before_id):
+    """Condición SQL y parámetros para continuar después del último pedido recibido."""
+    if fecha is None:
+        return "1 = 1", ()
+    if before_id is None:
+        return "fecha_pedido < %s", (fecha,)
+    return "(fecha_pedido < %s OR (fecha_pedido = %s AND id_pedido < %s))", (fecha, fecha, before_id)
+
+def _siguiente_cursor(ultimo_pedido, cantidad, limite):
+    """Cursor de la página siguiente, o None si esta fue la última."""
+    if ultimo_pedido is None or cantidad < limite:
+        return None
+    return {'before': ultimo_pedido['fecha_pedido'].isoformat(), 'before_id': ultimo_pedido['id_pedido']}
+
+def _etag_pedido(pedido):
+    """
+    ETag de un pedido. Los detalles no cambian después de crearlo, así que solo
+    dependen del pedido su estado y su total.
+    """
+    return valor_etag(pedido['id_pedido'], pedido['estado_pedido'], pedido['total_pedido'])
+
+# La caché de productos solo guarda el nombre, que se muestra en los listados. El
+# precio de un pedido nunca sale de ella: una lectura sin bloqueo puede volver a
+# guardar un precio viejo después de la invalidación de un PUT.
+def _leer_info_productos_cache(ids_productos):
+    """Devuelve {id_producto: {nombre_producto}} con lo que haya en caché."""
+    valores = obtener_muchos([clave_producto(id_producto) for id_producto in ids_productos])
+    return {
+        id_producto: {'nombre_producto': valor['nombre_producto']}
+        for id_producto, valor in zip(ids_productos, valores) if valor is not None
+    }
+
+def _guardar_info_productos_cache(filas):
+    guardar_muchos({
+        clave_producto(fila['id_producto']): {'nombre_producto': fila['nombre_producto']}
+        for fila in filas
+    }, TTL_PRODUCTO)
+
+def _obtener_info_productos(cursor, ids_productos):
+    """Nombre de los productos indicados, consultando la base de datos solo por los que no estén en caché."""
+    info = _leer_info_productos_cache(ids_productos)
+    faltantes = [id_producto for id_producto in ids_productos if id_producto not in info]
+    if faltantes:
+        placeholders = ', '.join(['%s'] * len(faltantes))
+        cursor.execute(SQL_INFO_PRODUCTOS.format(placeholders=placeholders), faltantes)
+        filas = cursor.fetchall()
+        _guardar_info_productos_cache(filas)
+        info.update({fila['id_producto']: fila for fila in filas})
+    return info
+
+def _agregar_nombres_productos(cursor, detalles):
+    """Completa 'nombre_producto' en cada detalle a partir de la caché de productos."""
+    info_productos = _obtener_info_productos(cursor, list({detalle['id_producto'] for detalle in detalles}))
+    for detalle in detalles:
+        info = info_productos.get(detalle['id_producto'])
+        detalle['nombre_producto'] = info['nombre_producto'] if info else None
+
+def _adjuntar_detalles(cursor, pedidos):
+    """
+    Agrega la clave 'detalles' a cada pedido de la lista usando una sola consulta
+    para todos ellos (en lugar de una consulta por pedido).
+    """
+    if not pedidos:
+        return
+    ids_pedidos = [pedido['id_pedido'] for pedido in pedidos]
+    placeholders = ', '.join(['%s'] * len(ids_pedidos))
+    cursor.execute(SQL_DETALLES_DE_PEDIDOS.format(placeholders=placeholders), ids_pedidos)
+    detalles = cursor.fetchall()
+    _agregar_nombres_productos(cursor, detalles)
+
+    detalles_por_pedido = defaultdict(list)
+    for detalle in detalles:
+        detalles_por_pedido[detalle.pop('id_pedido')].append(detalle)
+    for pedido in pedidos:
+        pedido['detalles'] = detalles_por_pedido[pedido['id_pedido']]
+
+def _obtener_pedido_con_detalles(cursor, id_pedido):
+    """
+    Lee un pedido y sus detalles con una sola consulta (LEFT JOIN) y devuelve el
+    pedido con la clave 'detalles', o None si no existe.
+    """
+    cursor.execute(SQL_PEDIDO_CON_DETALLES, (id_pedido,))
+    filas = cursor.fetchall()
+    if not filas:
+        return None
+    pedido = {columna: valor for columna, valor in filas[0].items() if columna not in _COLUMNAS_DETALLE}
+    detalles = [
+        {columna: fila[columna] for columna in _COLUMNAS_DETALLE}
+        for fila in filas if fila['id_detalle_pedido'] is not None
+    ]
+    _agregar_nombres_productos(cursor, detalles)
+    pedido['detalles'] = detalles
+    return pedido
+
 # --- Rutas para la gestión de pedidos (Clientes) ---
 
 @pedidos_bp.route('/', methods=['POST'])
@@ -101,46 +276,68 @@ def crear_pedido():
     ciudad_envio = limpiar_string(data.get('ciudad_envio'))
     telefono_contacto = limpiar_string(data.get('telefono_contacto'))
 
-    total_pedido = 0.0
+    # Validar los datos de cada producto antes de consultar la base de datos
+    try:
+        pares = [_id_y_cantidad(item) for item in productos_en_pedido]
+    except (KeyError, TypeError):
+        return api_response(message="Cada producto debe incluir 'id_producto' y 'cantidad'.", status_code=400)
+
+    cantidades_por_producto = {}
+    for id_producto, cantidad in pares:
+        if type(id_producto) is not int or id_producto <= 0:
+            return api_response(message="ID de producto inválido en la lista de productos.", status_code=400)
+        if type(cantidad) is not int or cantidad <= 0:
+            return api_response(message="Cantidad inválida para el producto ID " + str(id_producto) + ".", status_code=400)
+        cantidades_por_producto[id_producto] = cantidades_por_producto.get(id_producto, 0) + cantidad
+
+    total_pedido = Decimal('0')
     detalles_para_insertar = []
 
     try:
-        with db_session() as (conn, cursor):
-            # 1. Obtener id_cliente del usuario actual
-            cursor.execute("SELECT id_cliente, direccion, ciudad, telefono FROM clientes WHERE id_usuario = %s", (current_user_id,))
-            cliente_info = cursor.fetchone()
-
-            if not cliente_info:
-                return api_response(message="Perfil de cliente no encontrado. Por favor, complete su perfil.", status_code=400)
-
-            id_cliente = cliente_info['id_cliente']
-
-            # Usar la dirección del perfil del cliente si no se proporciona en el pedido
-            if not direccion_envio:
-                direccion_envio = cliente_info['direccion']
-            if not ciudad_envio:
-                ciudad_envio = cliente_info['ciudad']
-            if not telefono_contacto:
-                telefono_contacto = cliente_info['telefono']
-            
-            # Validar y calcular el total del pedido, y verificar el inventario
-            for item in productos_en_pedido:
-                id_producto = item.get('id_producto')
-                cantidad = item.get('cantidad')
-
-                if not id_producto or not isinstance(id_producto, int) or id_producto <= 0:
+        with db_session(lotes=True) as (conn, cursor):
+            # 1. Obtener id_cliente del usuario actual (del token si está disponible).
+            # El perfil solo se consulta si falta el id_cliente o algún dato de envío
+            id_cliente = get_jwt().get('id_cliente')
+            necesita_perfil = id_cliente is None or not (direccion_envio and ciudad_envio and telefono_contacto)
+
+            # 2. Obtener precio y stock de todos los productos en una sola consulta
+            # (con bloqueo para evitar condiciones de carrera). El precio siempre se lee
+            # de la fila bloqueada, nunca de la caché
+            ids_productos = tuple(cantidades_por_producto)
+            placeholders = ', '.join(['%s'] * len(ids_productos))
+            productos_query = SQL_BLOQUEAR_PRODUCTOS.format(placeholders=placeholders)
+
+            if necesita_perfil:
+                # Perfil y productos viajan en un solo envío (dos conjuntos de resultados)
+                cursor.execute(SQL_PERFIL_CLIENTE + ";\n" + productos_query, (current_user_id, *ids_productos))
+                cliente_info = cursor.fetchone()
+                cursor.nextset()
+                filas = cursor.fetchall()
+
+                if not cliente_info:
                     conn.rollback()
-                    return api_response(message="ID de producto inválido en la lista de productos.", status_code=400)
-                if not cantidad or not isinstance(cantidad, int) or cantidad <= 0:
-                    conn.rollback()
-                    return api_response(message="Cantidad inválida para el producto ID " + str(id_producto) + ".", status_code=400)
+                    return api_response(message="Perfil de cliente no encontrado. Por favor, complete su perfil.", status_code=400)
+
+                id_cliente = cliente_info['id_cliente']
+
+                # Usar la dirección del perfil del cliente si no se proporciona en el pedido
+                if not direccion_envio:
+                    direccion_envio = cliente_info['direccion']
+                if not ciudad_envio:
+                    ciudad_envio = cliente_info['ciudad']
+                if not telefono_contacto:
+                    telefono_contacto = cliente_info['telefono']
+            else:
+                cursor.execute(productos_query, ids_productos)
+                filas = cursor.fetchall()
 
-                # Obtener precio y stock del producto (con bloqueo para evitar condiciones de carrera)
-                cursor.execute(
-                    "SELECT p.precio_venta, i.cantidad_disponible FROM productos p JOIN inventarios i ON p.id_producto = i.id_producto WHERE p.id_producto = %s FOR UPDATE",
-                    (id_producto,)
-                )
-                product_info = cursor.fetchone()
+            # Las filas bloqueadas están al día: refrescan los nombres en caché
+            _guardar_info_productos_cache(filas)
+            productos_info = {row['id_producto']: row for row in filas}
+
+            # Validar el inventario y calcular el total del pedido
+            for id_producto, cantidad in cantidades_por_producto.items():
+                product_info = productos_info.get(id_producto)
 
                 if not product_info:
                     conn.rollback()
@@ -158,56 +355,57 @@ def crear_pedido():
                     'id_producto': id_producto,
                     'cantidad': cantidad,
                     'precio_unitario': precio_unitario,
-                    'nombre_producto': product_info.get('nombre_producto', 'N/A') # para la respuesta
+                    'nombre_producto': product_info['nombre_producto'] # para la respuesta
                 })
 
-            # 2. Insertar el nuevo pedido
-            insert_pedido_query = """
-                INSERT INTO pedidos (id_cliente, total_pedido, direccion_envio, ciudad_envio, telefono_contacto)
-                VALUES (%s, %s, %s, %s, %s)
-            """
-            cursor.execute(insert_pedido_query, (id_cliente, total_pedido, direccion_envio, ciudad_envio, telefono_contacto))
+            # 3. Insertar el nuevo pedido
+            # Fecha y estado se envían explícitamente para no tener que releer la fila
+            pedido_creado = {
+                'id_cliente': id_cliente,
+                'fecha_pedido': datetime.now().replace(microsecond=0),
+                'estado_pedido': 'Pendiente',
+                'total_pedido': total_pedido,
+                'direccion_envio': direccion_envio,
+                'ciudad_envio': ciudad_envio,
+                'telefono_contacto': telefono_contacto
+            }
+            cursor.execute(SQL_INSERTAR_PEDIDO, tuple(pedido_creado.values()))
             id_pedido = cursor.lastrowid
 
-            # 3. Insertar los detalles del pedido y actualizar el inventario
-            detalles_respuesta = []
-            for item_detalle in detalles_para_insertar:
-                id_producto = item_detalle['id_producto']
-                cantidad = item_detalle['cantidad']
-                precio_unitario = item_detalle['precio_unitario']
-
-                insert_detalle_query = """
-                    INSERT INTO detalle_pedidos (id_pedido, id_producto, cantidad, precio_unitario)
-                    VALUES (%s, %s, %s, %s)
-                """
-                cursor.execute(insert_detalle_query, (id_pedido, id_producto, cantidad, precio_unitario))
-                id_detalle_pedido = cursor.lastrowid
-
-                # Actualizar inventario (ya bloqueado por FOR UPDATE)
-                update_inventario_query = "UPDATE inventarios SET cantidad_disponible = cantidad_disponible - %s WHERE id_producto = %s"
-                cursor.execute(update_inventario_query, (cantidad, id_producto))
-                
-                detalles_respuesta.append({
-                    'id_detalle_pedido': id_detalle_pedido,
-                    'id_producto': id_producto,
-                    'cantidad': cantidad,
-                    'precio_unitario': precio_unitario,
-                    'nombre_producto': item_detalle['nombre_producto']
-                })
-            
-            # 4. Obtener información completa del pedido para la respuesta
-            cursor.execute("SELECT * FROM pedidos WHERE id_pedido = %s", (id_pedido,))
-            pedido_creado = cursor.fetchone()
+            # 4. Insertar todos los detalles del pedido en una sola sentencia
+            cursor.executemany(SQL_INSERTAR_DETALLE, [
+                (id_pedido, d['id_producto'], d['cantidad'], d['precio_unitario'])
+                for d in detalles_para_insertar
+            ])
+
+            # Actualizar el inventario de todos los productos en una sola sentencia
+            # (filas ya bloqueadas por FOR UPDATE)
+            casos = ' '.join(['WHEN %s THEN %s'] * len(detalles_para_insertar))
+            update_inventario_query = SQL_DESCONTAR_INVENTARIO.format(casos=casos, placeholders=placeholders)
+            params_casos = [valor for d in detalles_para_insertar for valor in (d['id_producto'], d['cantidad'])]
+            cursor.execute(update_inventario_query, (*params_casos, *ids_productos))
+            if cursor.rowcount != len(detalles_para_insertar):
+                conn.rollback()
+                return api_response(message="No se pudo actualizar el inventario de todos los productos. Intenta nuevamente.", status_code=409)
+
+            # Recuperar los IDs generados (un detalle por producto)
+            cursor.execute(SQL_IDS_DETALLE_POR_PEDIDO, (id_pedido,))
+            ids_detalle = {row['id_producto']: row['id_detalle_pedido'] for row in cursor.fetchall()}
+
+            detalles_respuesta = [
+                {'id_detalle_pedido': ids_detalle[d['id_producto']], **d}
+                for d in detalles_para_insertar
+            ]
 
             conn.commit() # Confirmar todas las transacciones
 
-            response_data = {**pedido_creado, 'detalles': detalles_respuesta}
+            response_data = {'id_pedido': id_pedido, **pedido_creado, 'detalles': detalles_respuesta}
             return api_response(data=response_data, message="Pedido creado exitosamente.", status_code=201)
 
-    except pymysql.Error as db_error:
-        conn.rollback() # En caso de error de DB, revertir
-        print(f"DEBUG_PEDIDO_DB_ERROR: {db_error}")
-        return api_response(message="Error de base de datos al crear el pedido.", status_code=500, error=str(db_error))
+    except DBError:
+        # db_session() ya hizo rollback y devolvió la conexión al pool
+        logger.exception("Error de base de datos al crear el pedido")
+        return api_response(message="Error de base de datos al crear el pedido.", status_code=500)
     except Exception as e:
         # Aquí no se necesita rollback porque db_session() lo maneja si no hay commit
         print(f"DEBUG_PEDIDO_CREATE_ERROR: {e}")
@@ -218,10 +416,27 @@ def crear_pedido():
 @jwt_required()
 def obtener_mis_pedidos():
     """
-    Obtiene todos los pedidos realizados por el cliente autenticado, incluyendo sus detalles.
+    Obtiene los pedidos realizados por el cliente autenticado, incluyendo sus detalles,
+    del más reciente al más antiguo y paginados por cursor.
     ---
     security:
       - Bearer: []
+    parameters:
+      - in: query
+        name: before
+        type: string
+        required: false
+        description: Fecha ISO del último pedido recibido (cursor de la página siguiente).
+      - in: query
+        name: before_id
+        type: integer
+        required: false
+        description: ID del último pedido recibido (desempata pedidos con la misma fecha).
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: Cantidad máxima de pedidos a devolver (por defecto 50, máximo 200).
     responses:
       200:
         description: Lista de pedidos obtenida exitosamente
@@ -229,6 +444,8 @@ def obtener_mis_pedidos():
           type: array
           items:
             $ref: '#/definitions/PedidoCreado'
+      400:
+        description: Parámetros de paginación inválidos
       401:
         description: No autorizado
       404:
@@ -239,31 +456,27 @@ def obtener_mis_pedidos():
     current_user_id = get_jwt_identity()
 
     try:
-        with db_session() as (conn, cursor):
-            cursor.execute("SELECT id_cliente FROM clientes WHERE id_usuario = %s", (current_user_id,))
-            cliente_info = cursor.fetchone()
-            if not cliente_info:
+        fecha, before_id, limite = _leer_parametros_paginacion()
+    except ValueError as e:
+        return api_response(message=str(e), status_code=400)
+
+    try:
+        with db_session(readonly=True, isolation='RC') as (conn, cursor):
+            id_cliente = _obtener_id_cliente(cursor, current_user_id)
+            if id_cliente is None:
                 return api_response(message="Perfil de cliente no encontrado. Por favor, complete su perfil.", status_code=404)
-            id_cliente = cliente_info['id_cliente']
 
-            # Obtener pedidos principales
-            cursor.execute("SELECT * FROM pedidos WHERE id_cliente = %s ORDER BY fecha_pedido DESC", (id_cliente,))
+            # Obtener pedidos principales (una página)
+            filtro, params_filtro = _filtro_keyset(fecha, before_id)
+            cursor.execute(SQL_PEDIDOS_DE_CLIENTE.format(filtro=filtro), (id_cliente, *params_filtro, limite))
             pedidos = cursor.fetchall()
 
-            for pedido in pedidos:
-                # Obtener detalles para cada pedido
-                cursor.execute(
-                    """
-                    SELECT dp.id_detalle_pedido, dp.id_producto, dp.cantidad, dp.precio_unitario, p.nombre AS nombre_producto
-                    FROM detalle_pedidos dp
-                    JOIN productos p ON dp.id_producto = p.id_producto
-                    WHERE dp.id_pedido = %s
-                    """,
-                    (pedido['id_pedido'],)
-                )
-                pedido['detalles'] = cursor.fetchall()
-
-            return api_response(data=pedidos, message="Pedidos obtenidos exitosamente.", status_code=200)
+            # Obtener los detalles de todos los pedidos en una sola consulta
+            _adjuntar_detalles(cursor, pedidos)
+
+            siguiente = _siguiente_cursor(pedidos[-1] if pedidos else None, len(pedidos), limite)
+            return api_response(data=pedidos, message="Pedidos obtenidos exitosamente.", status_code=200,
+                                paginacion={'next_cursor': siguiente})
 
     except Exception as e:
         print(f"DEBUG_PEDIDO_GET_ME_ERROR: {e}")
@@ -288,6 +501,8 @@ def obtener_detalle_mi_pedido(id_pedido):
         description: Detalles del pedido obtenidos exitosamente
         schema:
           $ref: '#/definitions/PedidoCreado'
+      304:
+        description: El pedido no cambió desde la versión indicada en If-None-Match
       400:
         description: ID de pedido inválido
       401:
@@ -302,33 +517,27 @@ def obtener_detalle_mi_pedido(id_pedido):
     current_user_id = get_jwt_identity()
 
     try:
-        with db_session() as (conn, cursor):
-            cursor.execute("SELECT id_cliente FROM clientes WHERE id_usuario = %s", (current_user_id,))
-            cliente_info = cursor.fetchone()
-            if not cliente_info:
+        with db_session(readonly=True, isolation='RC') as (conn, cursor):
+            id_cliente = _obtener_id_cliente(cursor, current_user_id)
+            if id_cliente is None:
                 return api_response(message="Perfil de cliente no encontrado.", status_code=404)
-            id_cliente = cliente_info['id_cliente']
 
             # Obtener el pedido y verificar que pertenezca al cliente autenticado
-            cursor.execute("SELECT * FROM pedidos WHERE id_pedido = %s AND id_cliente = %s", (id_pedido, id_cliente))
+            cursor.execute(SQL_PEDIDO_DE_CLIENTE, (id_pedido, id_cliente))
             pedido = cursor.fetchone()
 
             if not pedido:
                 return api_response(message="Pedido no encontrado o no tienes permiso para verlo.", status_code=404)
 
+            # Si el cliente ya tiene esta versión no hace falta leer los detalles
+            etag = _etag_pedido(pedido)
+            if etag_coincide(etag):
+                return respuesta_no_modificada(etag)
+
             # Obtener detalles del pedido
-            cursor.execute(
-                """
-                SELECT dp.id_detalle_pedido, dp.id_producto, dp.cantidad, dp.precio_unitario, p.nombre AS nombre_producto
-                FROM detalle_pedidos dp
-                JOIN productos p ON dp.id_producto = p.id_producto
-                WHERE dp.id_pedido = %s
-                """,
-                (id_pedido,)
-            )
-            pedido['detalles'] = cursor.fetchall()
-
-            return api_response(data=pedido, message="Detalles del pedido obtenidos exitosamente.", status_code=200)
+            _adjuntar_detalles(cursor, [pedido])
+
+            return con_etag(api_response(data=pedido, message="Detalles del pedido obtenidos exitosamente.", status_code=200), etag)
 
     except Exception as e:
         print(f"DEBUG_PEDIDO_GET_MY_ID_ERROR: {e}")
@@ -342,9 +551,26 @@ def obtener_detalle_mi_pedido(id_pedido):
 def obtener_todos_pedidos_admin():
     """
     Obtiene una lista de todos los pedidos del sistema, incluyendo sus detalles (Solo Administrador).
+    Los pedidos se devuelven del más reciente al más antiguo, paginados por cursor.
     ---
     security:
       - Bearer: []
+    parameters:
+      - in: query
+        name: before
+        type: string
+        required: false
+        description: Fecha ISO del último pedido recibido (cursor de la página siguiente).
+      - in: query
+        name: before_id
+        type: integer
+        required: false
+        description: ID del último pedido recibido (desempata pedidos con la misma fecha).
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: Cantidad máxima de pedidos a devolver (por defecto 50, máximo 200).
     responses:
       200:
         description: Lista de todos los pedidos obtenida exitosamente
@@ -360,22 +586,22 @@ def obtener_todos_pedidos_admin():
         description: Error interno del servidor
     """
     try:
-        with db_session() as (conn, cursor):
-            cursor.execute("SELECT * FROM pedidos ORDER BY fecha_pedido DESC")
+        fecha, before_id, limite = _leer_parametros_paginacion()
+    except ValueError as e:
+        return api_response(message=str(e), status_code=400)
+
+    try:
+        # Una sola conexión: la página (como mucho 200 pedidos) y luego sus detalles
+        # con un IN sobre los ids, sin retener una segunda conexión del pool
+        with db_session(readonly=True, isolation='RC') as (conn, cursor):
+            filtro, params_filtro = _filtro_keyset(fecha, before_id)
+            cursor.execute(SQL_PEDIDOS.format(filtro=filtro), (*params_filtro, limite))
             pedidos = cursor.fetchall()
+            _adjuntar_detalles(cursor, pedidos)
 
-            for pedido in pedidos:
-                cursor.execute(
-                    """
-                    SELECT dp.id_detalle_pedido, dp.id_producto, dp.cantidad, dp.precio_unitario, p.nombre AS nombre_producto
-                    FROM detalle_pedidos dp
-                    JOIN productos p ON dp.id_producto = p.id_producto
-                    WHERE dp.id_pedido = %s
-                    """,
-                    (pedido['id_pedido'],)
-                )
-                pedido['detalles'] = cursor.fetchall()
-            return api_response(data=pedidos, message="Todos los pedidos obtenidos exitosamente.", status_code=200)
+        siguiente = _siguiente_cursor(pedidos[-1] if pedidos else None, len(pedidos), limite)
+        return api_response(data=pedidos, message="Todos los pedidos obtenidos exitosamente.", status_code=200,
+                            paginacion={'next_cursor': siguiente})
 
     except Exception as e:
         print(f"DEBUG_PEDIDO_GET_ALL_ADMIN_ERROR: {e}")
@@ -401,6 +627,8 @@ def obtener_pedido_por_id_admin(id_pedido):
         description: Detalles del pedido obtenidos exitosamente
         schema:
           $ref: '#/definitions/PedidoCreado'
+      304:
+        description: El pedido no cambió desde la versión indicada en If-None-Match
       400:
         description: ID de pedido inválido
       401:
@@ -413,24 +641,17 @@ def obtener_pedido_por_id_admin(id_pedido):
         description: Error interno del servidor
     """
     try:
-        with db_session() as (conn, cursor):
-            cursor.execute("SELECT * FROM pedidos WHERE id_pedido = %s", (id_pedido,))
-            pedido = cursor.fetchone()
+        with db_session(readonly=True, isolation='RC') as (conn, cursor):
+            pedido = _obtener_pedido_con_detalles(cursor, id_pedido)
 
             if not pedido:
                 return api_response(message="Pedido no encontrado.", status_code=404)
 
-            cursor.execute(
-                """
-                SELECT dp.id_detalle_pedido, dp.id_producto, dp.cantidad, dp.precio_unitario, p.nombre AS nombre_producto
-                FROM detalle_pedidos dp
-                JOIN productos p ON dp.id_producto = p.id_producto
-                WHERE dp.id_pedido = %s
-                """,
-                (id_pedido,)
-            )
-            pedido['detalles'] = cursor.fetchall()
-            return api_response(data=pedido, message="Detalles del pedido obtenidos exitosamente.", status_code=200)
+            etag = _etag_pedido(pedido)
+            if etag_coincide(etag):
+                return respuesta_no_modificada(etag)
+
+            return con_etag(api_response(data=pedido, message="Detalles del pedido obtenidos exitosamente.", status_code=200), etag)
 
     except Exception as e:
         print(f"DEBUG_PEDIDO_GET_BY_ID_ADMIN_ERROR: {e}")
@@ -490,29 +711,12 @@ def actualizar_estado_pedido_admin(id_pedido):
 
     try:
         with db_session() as (conn, cursor):
-            # 1. Verificar si el pedido existe
-            cursor.execute("SELECT id_pedido FROM pedidos WHERE id_pedido = %s", (id_pedido,))
-            if not cursor.fetchone():
+            cursor.execute(SQL_ACTUALIZAR_ESTADO, (estado_pedido, id_pedido))
+            if cursor.rowcount == 0:
                 return api_response(message="Pedido no encontrado.", status_code=404)
-            
-            update_query = "UPDATE pedidos SET estado_pedido = %s WHERE id_pedido = %s"
-            cursor.execute(update_query, (estado_pedido, id_pedido))
-
-            # Obtener el pedido actualizado para devolverlo
-            cursor.execute("SELECT * FROM pedidos WHERE id_pedido = %s", (id_pedido,))
-            updated_pedido = cursor.fetchone()
-
-            # Obtener detalles del pedido para la respuesta completa
-            cursor.execute(
-                """
-                SELECT dp.id_detalle_pedido, dp.id_producto, dp.cantidad, dp.precio_unitario, p.nombre AS nombre_producto
-                FROM detalle_pedidos dp
-                JOIN productos p ON dp.id_producto = p.id_producto
-                WHERE dp.id_pedido = %s
-                """,
-                (id_pedido,)
-            )
-            updated_pedido['detalles'] = cursor.fetchall()
+
+            # Obtener el pedido actualizado y sus detalles en una sola consulta
+            updated_pedido = _obtener_pedido_con_detalles(cursor, id_pedido)
 
             return api_response(data=updated_pedido, message="Estado del pedido actualizado exitosamente.", status_code=200)
 
@@ -550,14 +754,10 @@ def eliminar_pedido_admin(id_pedido):
     """
     try:
         with db_session() as (conn, cursor):
-            # Verificar si el pedido existe
-            cursor.execute("SELECT id_pedido FROM pedidos WHERE id_pedido = %s", (id_pedido,))
-            if not cursor.fetchone():
-                return api_response(message="Pedido no encontrado.", status_code=404)
-            
             # La eliminación en cascada en `detalle_pedidos` se encargará de los detalles
-            delete_query = "DELETE FROM pedidos WHERE id_pedido = %s"
-            cursor.execute(delete_query, (id_pedido,))
+            cursor.execute(SQL_ELIMINAR_PEDIDO, (id_pedido,))
+            if cursor.rowcount == 0:
+                return api_response(message="Pedido no encontrado.", status_code=404)
 
             return api_response(message="Pedido eliminado exitosamente.", status_code=200)
 
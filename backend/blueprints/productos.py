@@ -1,394 +1,308 @@
-from flask import Blueprint, jsonify, request
-import pymysql.cursors
-from utils.db import conectar_db
-from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt # Importar get_jwt para depuración
+import gzip
+import brotli
+from flask import Blueprint, Response, request
+from flasgger import swag_from
+from decimal import Decimal
+from functools import lru_cache
+from pydantic import ValidationError
+from utils.db import ERROR_DUPLICADO, ERROR_FK_INEXISTENTE, IntegrityError
+from flask_jwt_extended import jwt_required
 from utils.auth_decorators import Administrador_requerido, Administrador_o_Empleado_requerido
-from utils.helpers import api_response, db_session, limpiar_string
+from utils.helpers import (api_response, api_response_crudo, api_response_stream, con_etag, db_session,
+                           etag_coincide, obtener_limite, respuesta_no_modificada)
+from utils.esquemas import ProductoIn, ProductoUpdateIn
+from utils.serializacion import a_json
+from utils.cache import (ALGORITMOS_CATALOGO, TTL_CATALOGO, clave_catalogo, clave_catalogo_comprimido, clave_detalle_producto, guardar,
+                         guardar_crudo, invalidar_catalogo, invalidar_producto, obtener, obtener_crudo, version_cache_productos,
+                         versiones_compartidas)
+
+# Filas que se traen del cursor por cada viaje al servidor al recorrer el catálogo
+TAMANO_LOTE_CATALOGO = 500
 
 # Define el Blueprint para productos
 productos_bp = Blueprint('productos_bp', __name__)
 
+def _etag_productos(version, id_producto):
+    """
+    ETag de una lectura de productos armada con `version` (la misma de su clave de
+    caché); None si no se conoce la versión o no es común a los workers (sin Redis).
+    """
+    if version is None or not versiones_compartidas():
+        return None
+    return f"{version}-{id_producto}"
+
+def _con_etag_productos(respuesta_api, etag):
+    return con_etag(respuesta_api, etag, max_age=0) if etag else respuesta_api
+
+# Sentencias SQL fijas, armadas una sola vez al importar el módulo
+_COLUMNAS_PRODUCTO = "id_producto, nombre_producto, descripcion, id_categoria, precio, stock, unidad_medida"
+# Las lecturas incluyen el nombre de la categoría para que el cliente no tenga que
+# pedir /categorias/<id> por cada producto. LEFT JOIN: un producto nunca desaparece del listado.
+_PRODUCTOS_CON_CATEGORIA = """
+    SELECT p.id_producto, p.nombre_producto, p.descripcion, p.id_categoria, c.nombre_categoria,
+           p.precio, p.stock, p.unidad_medida
+    FROM productos p
+    LEFT JOIN categorias c ON c.id_categoria = p.id_categoria
+"""
+SQL_PRODUCTOS = _PRODUCTOS_CON_CATEGORIA
+SQL_PAGINA_PRODUCTOS = _PRODUCTOS_CON_CATEGORIA + " WHERE p.id_producto > %s ORDER BY p.id_producto LIMIT %s"
+SQL_PRODUCTO_POR_ID = _PRODUCTOS_CON_CATEGORIA + " WHERE p.id_producto = %s"
+# Fila base para la respuesta del PUT (sin categoría: puede cambiar en el mismo PUT)
+SQL_PRODUCTO_A_ACTUALIZAR = f"SELECT {_COLUMNAS_PRODUCTO} FROM productos WHERE id_producto = %s"
+SQL_INSERTAR_PRODUCTO = """
+    INSERT INTO productos (nombre_producto, descripcion, id_categoria, precio, stock, unidad_medida)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+SQL_ELIMINAR_PRODUCTO = "DELETE FROM productos WHERE id_producto = %s"
+
+# Columnas que admite el PUT, en el orden de ProductoUpdateIn (model_dump respeta ese
+# orden): el bit i de la máscara indica la columna i. Cada UPDATE se arma la primera
+# vez que se usa su combinación de columnas; hay como mucho 2^6 - 1.
+_COLUMNAS_ACTUALIZABLES = tuple(ProductoUpdateIn.model_fields)
+_BIT_COLUMNA = {columna: 1 << i for i, columna in enumerate(_COLUMNAS_ACTUALIZABLES)}
+
+@lru_cache(maxsize=1 << len(_COLUMNAS_ACTUALIZABLES))
+def _sql_actualizar_producto(mascara):
+    asignaciones = ", ".join(f"{columna} = %s" for columna, bit in _BIT_COLUMNA.items() if mascara & bit)
+    return f"UPDATE productos SET {asignaciones} WHERE id_producto = %s"
+
+_MENSAJES_VALIDACION = {
+    "id_categoria": "El ID de categoría debe ser un número entero positivo.",
+    "precio": "El precio debe ser un número positivo.",
+    "stock": "El stock debe ser un número entero no negativo.",
+}
+_MENSAJE_REQUERIDOS = "Nombre del producto, ID de categoría, precio y stock son campos requeridos."
+
+def _mensaje_validacion(error, requeridos=False):
+    """Mensaje en español para el primer error de validación de un producto."""
+    errores = error.errors(include_url=False)
+    if errores[0]["type"] == "model_type":
+        return "El cuerpo de la solicitud debe ser un objeto JSON."
+    # Como antes, un campo obligatorio ausente, nulo o un nombre vacío se informan juntos
+    if requeridos and any(e["type"] == "missing" or e.get("input") is None or e["loc"] == ("nombre_producto",)
+                          for e in errores):
+        return _MENSAJE_REQUERIDOS
+    campo = errores[0]["loc"][0]
+    return _MENSAJES_VALIDACION.get(campo, f"El campo {campo} debe ser texto.")
+
 # --- Rutas para la gestión de productos ---
 
 @productos_bp.route('/', methods=['POST'])
 # @jwt_required() # Se elimina porque Administrador_o_Empleado_requerido() ya lo gestiona
 @Administrador_o_Empleado_requerido() # Administradores Y empleados pueden crear productos
+@swag_from('../openapi/productos/crear_producto.yml')
 def crear_producto():
-    """
-    Crea un nuevo producto.
-    ---
-    security:
-      - Bearer: []
-    parameters:
-      - in: body
-        name: body
-        schema:
-          id: NuevoProducto
-          required:
-            - nombre_producto
-            - id_categoria
-            - precio
-            - stock
-          properties:
-            nombre_producto:
-              type: string
-              description: Nombre del producto
-            descripcion:
-              type: string
-              description: Descripción del producto (opcional)
-            id_categoria:
-              type: integer
-              description: ID de la categoría a la que pertenece el producto
-            precio:
-              type: number
-              format: float
-              description: Precio del producto
-            stock:
-              type: integer
-              description: Cantidad en stock
-            unidad_medida:
-              type: string
-              description: Unidad de medida del producto (ej. kg, unidad, litro)
-    responses:
-      201:
-        description: Producto creado exitosamente
-        schema:
-          id: Producto
-          properties:
-            id_producto:
-              type: integer
-            nombre_producto:
-              type: string
-            descripcion:
-              type: string
-            id_categoria:
-              type: integer
-            precio:
-              type: number
-              format: float
-            stock:
-              type: integer
-            unidad_medida:
-              type: string
-      400:
-        description: Error de validación o campos requeridos (ej. categoría no existente)
-      401:
-        description: No autorizado (token JWT inválido)
-      403:
-        description: Acceso denegado (no es Administrador o Empleado)
-      409:
-        description: Conflicto, ya existe un producto con ese nombre.
-      500:
-        description: Error interno del servidor
-    """
+    """Crea un nuevo producto."""
     try:
-        data = request.get_json()
-        nombre_producto = limpiar_string(data.get('nombre_producto'))
-        descripcion = limpiar_string(data.get('descripcion')) if data.get('descripcion') is not None else None
-        id_categoria = data.get('id_categoria')
-        precio = data.get('precio') # Usamos 'precio' como en la BD
-        stock = data.get('stock')
-        unidad_medida = limpiar_string(data.get('unidad_medida')) if data.get('unidad_medida') is not None else None
-
-        # Validaciones de campos requeridos
-        if not all([nombre_producto, id_categoria is not None, precio is not None, stock is not None]):
-            return api_response(message="Nombre del producto, ID de categoría, precio y stock son campos requeridos.", status_code=400)
-
-        # Validaciones adicionales de tipos y valores
-        if not isinstance(id_categoria, int) or id_categoria <= 0:
-            return api_response(message="El ID de categoría es obligatorio y debe ser un número entero positivo.", status_code=400)
-        if not isinstance(precio, (int, float)) or precio <= 0:
-            return api_response(message="El precio debe ser un número positivo.", status_code=400)
-        if not isinstance(stock, int) or stock < 0:
-            return api_response(message="El stock debe ser un número entero no negativo.", status_code=400)
-        # Puedes añadir validación para unidad_medida si es un campo con valores fijos
-
-        with db_session() as (conn, cursor):
-            # 1. Verificar si el nombre del producto ya existe
-            check_name_query = "SELECT id_producto FROM productos WHERE nombre_producto = %s"
-            cursor.execute(check_name_query, (nombre_producto,))
-            if cursor.fetchone():
+        producto = ProductoIn.model_validate(request.get_json())
+    except ValidationError as e:
+        return api_response(message=_mensaje_validacion(e, requeridos=True), status_code=400)
+    nombre_producto = producto.nombre_producto
+    descripcion = producto.descripcion
+    id_categoria = producto.id_categoria
+    stock = producto.stock
+    unidad_medida = producto.unidad_medida
+    # El precio se guarda como DECIMAL(10, 2); se redondea igual para la respuesta
+    precio = Decimal(str(producto.precio)).quantize(Decimal('0.01'))
+
+    with db_session() as (conn, cursor):
+        # INSERTAR el nuevo producto. El nombre duplicado (UNIQUE) y la categoría
+        # inexistente (FOREIGN KEY) los rechaza la propia base de datos.
+        try:
+            cursor.execute(SQL_INSERTAR_PRODUCTO, (nombre_producto, descripcion, id_categoria, precio, stock, unidad_medida))
+        except IntegrityError as e:
+            if e.args[0] == ERROR_DUPLICADO:
                 return api_response(message="Ya existe un producto con ese nombre.", status_code=409)
-
-            # 2. Verificar si la id_categoria existe en la tabla categorias
-            check_category_query = "SELECT id_categoria FROM categorias WHERE id_categoria = %s"
-            cursor.execute(check_category_query, (id_categoria,))
-            if not cursor.fetchone():
+            if e.args[0] == ERROR_FK_INEXISTENTE:
                 return api_response(message="La categoría especificada no existe.", status_code=400)
-
-            # 3. INSERTAR el nuevo producto con todas las columnas
-            insert_query = """
-                INSERT INTO productos (nombre_producto, descripcion, id_categoria, precio, stock, unidad_medida)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """
-            cursor.execute(insert_query, (nombre_producto, descripcion, id_categoria, precio, stock, unidad_medida))
-            new_product_id = cursor.lastrowid
-
-            # 4. OBTENER y devolver los datos del producto recién creado
-            query_new_product = """
-                SELECT id_producto, nombre_producto, descripcion, id_categoria, precio, stock, unidad_medida
-                FROM productos WHERE id_producto = %s
-            """
-            cursor.execute(query_new_product, (new_product_id,))
-            new_product_data = cursor.fetchone()
-
-            return api_response(data=new_product_data, message="Producto creado exitosamente.", status_code=201)
-
-    except Exception as e:
-        print(f"DEBUG_PRODUCT_CREATE_ERROR: {e}")
-        return api_response(message="Error interno del servidor al crear el producto.", status_code=500, error=str(e))
+            raise
+
+        # Los datos del producto recién creado ya se conocen; no hace falta releerlos
+        new_product_data = {
+            "id_producto": cursor.lastrowid,
+            "nombre_producto": nombre_producto,
+            "descripcion": descripcion,
+            "id_categoria": id_categoria,
+            "precio": precio,
+            "stock": stock,
+            "unidad_medida": unidad_medida
+        }
+
+    # La caché se invalida una vez confirmada la transacción
+    invalidar_catalogo()
+    return api_response(data=new_product_data, message="Producto creado exitosamente.", status_code=201)
 
 # --- GET (obtener todos los productos) ---
 @productos_bp.route('/', methods=['GET'])
 @jwt_required() # Requiere autenticación para listar productos
+@swag_from('../openapi/productos/obtener_productos.yml')
 def obtener_productos():
     """
     Obtiene una lista de todos los productos disponibles.
-    ---
-    security:
-      - Bearer: []
-    responses:
-      200:
-        description: Lista de productos obtenida
-        schema:
-          type: array
-          items:
-            $ref: '#/definitions/Producto'
-      401:
-        description: No autorizado (token JWT inválido)
-      500:
-        description: Error interno del servidor
+    Con ?after_id y/o ?limit devuelve una página ordenada por ID (paginación por cursor).
+    """
+    mensaje = "Lista de productos obtenida exitosamente."
+    if 'after_id' in request.args or 'limit' in request.args:
+        return _obtener_pagina_productos(mensaje)
+    # Una sola lectura de la versión, antes que los datos, para la clave de caché y el
+    # ETag: el cuerpo guardado bajo una versión se leyó después de que esa versión
+    # existiera, así que nunca es anterior a ella. Si una escritura termina entremedio,
+    # el cuerpo queda bajo la versión vieja y el ETag viejo solo provoca otra petición.
+    version = version_cache_productos()
+    etag = _etag_productos(version, "all")
+    if etag and etag_coincide(etag):
+        return respuesta_no_modificada(etag, max_age=0)
+
+    # La caché guarda el arreglo ya serializado: se devuelve sin pasar por objetos Python
+    catalogo = obtener_crudo(clave_catalogo(version)) if version is not None else None
+    if catalogo is not None:
+        algoritmo = request.accept_encodings.best_match(ALGORITMOS_CATALOGO)
+        if algoritmo:
+            return _con_etag_productos(_catalogo_comprimido(version, catalogo, mensaje, algoritmo), etag)
+        return _con_etag_productos(api_response_crudo(catalogo, message=mensaje, status_code=200), etag)
+
+    def filas():
+        # Cursor del lado del servidor: las filas se leen por lotes mientras se envían
+        with db_session(readonly=True, server_side=True) as (conn, cursor):
+            cursor.execute(SQL_PRODUCTOS)
+            while True:
+                lote = cursor.fetchmany(TAMANO_LOTE_CATALOGO)
+                if not lote:
+                    break
+                yield from lote
+
+    guardar_catalogo = None
+    if version is not None:
+        guardar_catalogo = lambda datos: guardar_crudo(clave_catalogo(version), datos, TTL_CATALOGO)
+    respuesta = api_response_stream(filas(), message=mensaje, status_code=200, al_terminar=guardar_catalogo)
+    return _con_etag_productos(respuesta, etag)
+
+_COMPRESORES = {
+    "br": lambda datos: brotli.compress(datos, quality=4),
+    "gzip": lambda datos: gzip.compress(datos, compresslevel=4),
+}
+
+def _catalogo_comprimido(version, catalogo, mensaje, algoritmo):
     """
+    Respuesta del catálogo comprimida con `algoritmo`. El resultado se guarda en caché
+    junto al catálogo (misma versión), así que solo se comprime una vez por cada invalidación.
+    Como ya trae Content-Encoding, Flask-Compress la deja pasar sin tocarla.
+    """
+    clave = clave_catalogo_comprimido(version, algoritmo)
+    cuerpo = obtener_crudo(clave)
+    if cuerpo is None:
+        cuerpo = _COMPRESORES[algoritmo](b'{"data":' + catalogo + b',"mensaje":' + a_json(mensaje) + b'}')
+        guardar_crudo(clave, cuerpo, TTL_CATALOGO)
+    respuesta = Response(cuerpo, mimetype='application/json')
+    respuesta.headers['Content-Encoding'] = algoritmo
+    respuesta.vary.add('Accept-Encoding')
+    return respuesta, 200
+
+def _obtener_pagina_productos(mensaje):
+    """Página del catálogo por cursor: recorre la clave primaria, sin leer la tabla completa."""
     try:
-        with db_session() as (conn, cursor):
-            # Selecciona todas las columnas relevantes
-            query = "SELECT id_producto, nombre_producto, descripcion, id_categoria, precio, stock, unidad_medida FROM productos"
-            cursor.execute(query)
-            productos = cursor.fetchall()
-            return api_response(data=productos, message="Lista de productos obtenida exitosamente.", status_code=200)
+        after_id = int(request.args.get('after_id') or 0)
+        limite = obtener_limite(request.args.get('limit'))
+    except ValueError:
+        return api_response(message="Los parámetros 'after_id' y 'limit' deben ser números enteros.", status_code=400)
+
+    etag = _etag_productos(version_cache_productos(), f"all:{after_id}:{limite}")
+    if etag and etag_coincide(etag):
+        return respuesta_no_modificada(etag, max_age=0)
+
+    with db_session(readonly=True) as (conn, cursor):
+        cursor.execute(SQL_PAGINA_PRODUCTOS, (after_id, limite))
+        productos = cursor.fetchall()
 
-    except Exception as e:
-        print(f"DEBUG_PRODUCT_GET_ALL_ERROR: {e}")
-        return api_response(message="Error interno del servidor al obtener productos.", status_code=500, error=str(e))
+    siguiente = {'after_id': productos[-1]['id_producto']} if len(productos) == limite else None
+    return _con_etag_productos(api_response(data=productos, message=mensaje, status_code=200,
+                                            paginacion={'next_cursor': siguiente}), etag)
 
 # --- GET por ID (obtener un producto específico) ---
 @productos_bp.route('/<int:id_producto>', methods=['GET'])
 @jwt_required() # Requiere autenticación para ver un producto específico
+@swag_from('../openapi/productos/obtener_producto_por_id.yml')
 def obtener_producto_por_id(id_producto):
-    """
-    Obtiene los detalles de un producto específico por su ID.
-    ---
-    security:
-      - Bearer: []
-    parameters:
-      - in: path
-        name: id_producto
-        type: integer
-        required: true
-        description: ID del producto a obtener
-    responses:
-      200:
-        description: Detalles del producto obtenidos
-        schema:
-          $ref: '#/definitions/Producto'
-      401:
-        description: No autorizado (token JWT inválido)
-      404:
-        description: Producto no encontrado
-      500:
-        description: Error interno del servidor
-    """
-    try:
-        with db_session() as (conn, cursor):
-            # Selecciona todas las columnas relevantes
-            query = "SELECT id_producto, nombre_producto, descripcion, id_categoria, precio, stock, unidad_medida FROM productos WHERE id_producto = %s"
-            cursor.execute(query, (id_producto,))
+    """Obtiene los detalles de un producto específico por su ID."""
+    # Como en el catálogo, una sola versión leída antes que los datos para el ETag y la clave
+    version = version_cache_productos()
+    etag = _etag_productos(version, id_producto)
+    if etag and etag_coincide(etag):
+        return respuesta_no_modificada(etag, max_age=0)
+
+    clave = clave_detalle_producto(version, id_producto) if version is not None else None
+    producto = obtener(clave) if clave else None
+    if producto is None:
+        with db_session(readonly=True) as (conn, cursor):
+            cursor.execute(SQL_PRODUCTO_POR_ID, (id_producto,))
             producto = cursor.fetchone()
+        if producto and clave:
+            guardar(clave, producto, TTL_CATALOGO)
 
-            if producto:
-                return api_response(data=producto, message="Producto obtenido exitosamente.", status_code=200)
-            else:
-                return api_response(message="Producto no encontrado.", status_code=404)
-
-    except Exception as e:
-        print(f"DEBUG_PRODUCT_GET_BY_ID_ERROR: {e}")
-        return api_response(message="Error interno del servidor al obtener el producto.", status_code=500, error=str(e))
+    if producto:
+        return _con_etag_productos(api_response(data=producto, message="Producto obtenido exitosamente.", status_code=200), etag)
+    else:
+        return api_response(message="Producto no encontrado.", status_code=404)
 
 # --- PUT (actualizar un producto) ---
 @productos_bp.route('/<int:id_producto>', methods=['PUT'])
 # @jwt_required() # Se elimina porque Administrador_requerido() ya lo gestiona
 @Administrador_requerido() # Solo administradores pueden actualizar productos
+@swag_from('../openapi/productos/actualizar_producto.yml')
 def actualizar_producto(id_producto):
-    """
-    Actualiza los detalles de un producto existente.
-    ---
-    security:
-      - Bearer: []
-    parameters:
-      - in: path
-        name: id_producto
-        type: integer
-        required: true
-        description: ID del producto a actualizar
-      - in: body
-        name: body
-        schema:
-          id: ActualizarProducto
-          properties:
-            nombre_producto:
-              type: string
-              description: Nuevo nombre del producto
-            descripcion:
-              type: string
-              description: Nueva descripción del producto
-            id_categoria:
-              type: integer
-              description: Nuevo ID de la categoría a la que pertenece el producto
-            precio:
-              type: number
-              format: float
-              description: Nuevo precio del producto
-            stock:
-              type: integer
-              description: Nueva cantidad en stock
-            unidad_medida:
-              type: string
-              description: Nueva unidad de medida del producto (ej. kg, unidad, litro)
-    responses:
-      200:
-        description: Producto actualizado exitosamente
-        schema:
-          $ref: '#/definitions/Producto'
-      400:
-        description: Error de validación o no hay campos para actualizar
-      401:
-        description: No autorizado (token JWT inválido)
-      403:
-        description: Acceso denegado (no es Administrador)
-      404:
-        description: Producto no encontrado
-      409:
-        description: Conflicto, ya existe un producto con el nombre proporcionado.
-      500:
-        description: Error interno del servidor
-    """
-    data = request.get_json()
-    nombre_producto = limpiar_string(data.get('nombre_producto')) if data.get('nombre_producto') is not None else None
-    descripcion = limpiar_string(data.get('descripcion')) if data.get('descripcion') is not None else None
-    id_categoria = data.get('id_categoria')
-    precio = data.get('precio') # Usamos 'precio' como en la BD
-    stock = data.get('stock')
-    unidad_medida = limpiar_string(data.get('unidad_medida')) if data.get('unidad_medida') is not None else None
-
-    update_fields = []
-    update_values = []
-
-    if nombre_producto is not None:
-        update_fields.append("nombre_producto = %s")
-        update_values.append(nombre_producto)
-    if descripcion is not None:
-        update_fields.append("descripcion = %s")
-        update_values.append(descripcion)
-    if id_categoria is not None:
-        if not isinstance(id_categoria, int) or id_categoria <= 0:
-            return api_response(message="El ID de categoría debe ser un número entero positivo.", status_code=400)
-        update_fields.append("id_categoria = %s")
-        update_values.append(id_categoria)
-    if precio is not None:
-        if not isinstance(precio, (int, float)) or precio <= 0:
-            return api_response(message="El precio debe ser un número positivo.", status_code=400)
-        update_fields.append("precio = %s") # Nombre de columna 'precio'
-        update_values.append(precio)
-    if stock is not None:
-        if not isinstance(stock, int) or stock < 0:
-            return api_response(message="El stock debe ser un número entero no negativo.", status_code=400)
-        update_fields.append("stock = %s")
-        update_values.append(stock)
-    if unidad_medida is not None:
-        update_fields.append("unidad_medida = %s")
-        update_values.append(unidad_medida)
-
-    if not update_fields:
+    """Actualiza los detalles de un producto existente."""
+    try:
+        # Los campos ausentes o en null no se modifican
+        cambios = ProductoUpdateIn.model_validate(request.get_json()).model_dump(exclude_none=True)
+    except ValidationError as e:
+        return api_response(message=_mensaje_validacion(e), status_code=400)
+    if 'precio' in cambios:
+        # Redondeado como lo guarda la columna DECIMAL(10, 2)
+        cambios['precio'] = Decimal(str(cambios['precio'])).quantize(Decimal('0.01'))
+
+    if not cambios:
         return api_response(message="No hay campos para actualizar.", status_code=400)
 
-    try:
-        with db_session() as (conn, cursor):
-            # 1. Verificar si el producto existe
-            check_product_query = "SELECT id_producto FROM productos WHERE id_producto = %s"
-            cursor.execute(check_product_query, (id_producto,))
-            if not cursor.fetchone():
-                return api_response(message="Producto no encontrado.", status_code=404)
-
-            # 2. Si se está actualizando el nombre, verificar que no haya duplicados (excluyendo el propio producto)
-            if nombre_producto:
-                check_name_query = "SELECT id_producto FROM productos WHERE nombre_producto = %s AND id_producto != %s"
-                cursor.execute(check_name_query, (nombre_producto, id_producto))
-                if cursor.fetchone():
-                    return api_response(message="Ya existe otro producto con ese nombre.", status_code=409)
-
-            # 3. Si se está actualizando la id_categoria, verificar que exista
-            if id_categoria is not None:
-                check_category_query = "SELECT id_categoria FROM categorias WHERE id_categoria = %s"
-                cursor.execute(check_category_query, (id_categoria,))
-                if not cursor.fetchone():
-                    return api_response(message="La categoría especificada no existe.", status_code=400)
-
-            update_query = "UPDATE productos SET " + ", ".join(update_fields) + " WHERE id_producto = %s"
-            update_values.append(id_producto)
-
-            cursor.execute(update_query, tuple(update_values))
-
-            # Obtener el producto actualizado para devolverlo en la respuesta
-            query_updated = """
-                SELECT id_producto, nombre_producto, descripcion, id_categoria, precio, stock, unidad_medida
-                FROM productos WHERE id_producto = %s
-            """
-            cursor.execute(query_updated, (id_producto,))
-            updated_product = cursor.fetchone()
-
-            return api_response(data=updated_product, message="Producto actualizado exitosamente.", status_code=200)
-
-    except Exception as e:
-        print(f"DEBUG_PRODUCT_UPDATE_ERROR: {e}")
-        return api_response(message="Error interno del servidor al actualizar el producto.", status_code=500, error=str(e))
+    mascara = sum(_BIT_COLUMNA[columna] for columna in cambios)
+    update_values = (*cambios.values(), id_producto)
+
+    with db_session() as (conn, cursor):
+        # 1. Verificar si el producto existe (la fila se usa también para la respuesta)
+        cursor.execute(SQL_PRODUCTO_A_ACTUALIZAR, (id_producto,))
+        updated_product = cursor.fetchone()
+        if not updated_product:
+            return api_response(message="Producto no encontrado.", status_code=404)
+
+        # 2. Actualizar. El nombre duplicado (UNIQUE) y la categoría inexistente
+        # (FOREIGN KEY) los rechaza la propia base de datos.
+        try:
+            cursor.execute(_sql_actualizar_producto(mascara), update_values)
+        except IntegrityError as e:
+            if e.args[0] == ERROR_DUPLICADO:
+                return api_response(message="Ya existe otro producto con ese nombre.", status_code=409)
+            if e.args[0] == ERROR_FK_INEXISTENTE:
+                return api_response(message="La categoría especificada no existe.", status_code=400)
+            raise
+
+        # El producto actualizado es la fila leída más los cambios aplicados
+        updated_product.update(cambios)
+
+    # La caché se invalida una vez confirmada la transacción
+    invalidar_producto(id_producto)
+    return api_response(data=updated_product, message="Producto actualizado exitosamente.", status_code=200)
 
 # --- DELETE (eliminar un producto) ---
 @productos_bp.route('/<int:id_producto>', methods=['DELETE'])
 @Administrador_requerido() # Solo administradores pueden eliminar productos
+@swag_from('../openapi/productos/eliminar_producto.yml')
 def eliminar_producto(id_producto):
-    """
-    Elimina un producto del sistema por su ID.
-    ---
-    security:
-      - Bearer: []
-    parameters:
-      - in: path
-        name: id_producto
-        type: integer
-        required: true
-        description: ID del producto a eliminar
-    responses:
-      200:
-        description: Producto eliminado exitosamente
-      401:
-        description: No autorizado (token JWT inválido)
-      403:
-        description: Acceso denegado (no es Administrador)
-      404:
-        description: Producto no encontrado
-      500:
-        description: Error interno del servidor
-    """
-    try:
-        with db_session() as (conn, cursor):
-            delete_query = "DELETE FROM productos WHERE id_producto = %s"
-            cursor.execute(delete_query, (id_producto,))
+    """Elimina un producto del sistema por su ID."""
+    with db_session() as (conn, cursor):
+        cursor.execute(SQL_ELIMINAR_PRODUCTO, (id_producto,))
 
-            if cursor.rowcount == 0:
-                return api_response(message="Producto no encontrado.", status_code=404)
+        if cursor.rowcount == 0:
+            return api_response(message="Producto no encontrado.", status_code=404)
 
-            return api_response(message="Producto eliminado exitosamente.", status_code=200)
+    invalidar_producto(id_producto)
+    return api_response(message="Producto eliminado exitosamente.", status_code=200)
 
-    except Exception as e:
-        print(f"DEBUG_PRODUCT_DELETE_ERROR: {e}")
-        return api_response(message="Error interno del servidor al eliminar el producto.", status_code=500, error=str(e))
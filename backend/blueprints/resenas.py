@@ -1,13 +1,167 @@
+import logging
+from datetime import datetime
 from flask import Blueprint, jsonify, request
-import pymysql.cursors
-from utils.db import conectar_db  # Asegurate de que esto esta bien configurado
+from utils.db import DBError
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from utils.auth_decorators import Administrador_requerido
-from utils.helpers import api_response, db_session, limpiar_string
+from pydantic import ValidationError
+from utils.esquemas import ActualizarResenaIn, AprobarResenaIn, CrearResenaIn
+from utils.helpers import (api_response, api_response_crudo, api_response_stream, con_etag, db_session, etag_coincide,
+                           obtener_limite, respuesta_no_modificada)
+from utils.serializacion import a_json
+from utils.cache import (TTL_RESENAS, clave_resenas_producto, invalidar_resenas,
+                         obtener_o_construir_crudo, version_resenas, versiones_compartidas)
+
+logger = logging.getLogger(__name__)
 
 # Define el Blueprint para resenas de productos
 resenas_bp = Blueprint('resenas_bp', __name__)
 
+# Consultas SQL del modulo, definidas una sola vez al importarlo.
+
+# id_cliente del usuario, existencia del producto y resena previa del cliente, en un viaje.
+# Sin fila: el usuario no tiene perfil de cliente.
+SQL_VERIFICAR_NUEVA_RESENA = """
+    SELECT c.id_cliente,
+           EXISTS(SELECT 1 FROM productos WHERE id_producto = %s) AS producto_existe,
+           EXISTS(SELECT 1 FROM resenas_productos rp
+                  WHERE rp.id_producto = %s AND rp.id_cliente = c.id_cliente) AS resena_duplicada
+    FROM clientes c
+    WHERE c.id_usuario = %s
+"""
+
+# Columnas de una resena tal como las devuelven los endpoints de escritura
+_COLUMNAS_RESENA = ('id_resena', 'id_producto', 'id_cliente', 'calificacion', 'comentario', 'fecha_resena', 'aprobada')
+
+SQL_RESENA_POR_ID = f"SELECT {', '.join(_COLUMNAS_RESENA)} FROM resenas_productos WHERE id_resena = %s"
+
+# Sin fila: el usuario no tiene perfil; id_resena NULL: la resena no existe o es de otro cliente
+SQL_RESENA_DEL_USUARIO = """
+    SELECT c.id_cliente, rp.id_resena, rp.id_producto, rp.calificacion, rp.comentario, rp.fecha_resena, rp.aprobada
+    FROM clientes c
+    LEFT JOIN resenas_productos rp ON rp.id_cliente = c.id_cliente AND rp.id_resena = %s
+    WHERE c.id_usuario = %s
+"""
+
+# Columnas de los listados, en el mismo orden que sus SELECT: las filas se leen
+# como tuplas y se arman los objetos una sola vez con estos nombres
+_COLUMNAS_MIS_RESENAS = ('id_resena', 'id_producto', 'calificacion', 'comentario', 'fecha_resena', 'aprobada',
+                         'nombre_producto', 'nombre_cliente', 'username_cliente')
+_COLUMNAS_RESENAS_PRODUCTO = ('id_resena', 'id_producto', 'calificacion', 'comentario', 'fecha_resena', 'aprobada',
+                              'nombre_cliente', 'username_cliente')
+_COLUMNAS_RESENAS_ADMIN = _COLUMNAS_MIS_RESENAS
+
+def _filas_a_dicts(columnas, filas):
+    return [dict(zip(columnas, fila)) for fila in filas]
+
+SQL_MIS_RESENAS = """
+    SELECT rp.id_resena, rp.id_producto, rp.calificacion, rp.comentario, rp.fecha_resena, rp.aprobada,
+           p.nombre AS nombre_producto, c.nombre AS nombre_cliente, u.usuario AS username_cliente
+    FROM clientes c
+    JOIN usuarios u ON c.id_usuario = u.id_usuario
+    LEFT JOIN resenas_productos rp ON rp.id_cliente = c.id_cliente
+    LEFT JOIN productos p ON rp.id_producto = p.id_producto
+    WHERE c.id_usuario = %s
+    ORDER BY rp.fecha_resena DESC
+"""
+
+SQL_INSERTAR_RESENA = """
+    INSERT INTO resenas_productos (id_producto, id_cliente, calificacion, comentario, fecha_resena, aprobada)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+# Actualizacion y lectura de la resena en un solo envio (dos conjuntos de resultados).
+# Un NULL en calificacion o comentario conserva el valor actual (campo no enviado); el
+# UPDATE solo alcanza resenas del usuario y el SELECT posterior ya ve la fila actualizada.
+SQL_ACTUALIZAR_RESENA = """
+    UPDATE resenas_productos rp
+    JOIN clientes c ON rp.id_cliente = c.id_cliente
+    SET rp.calificacion = COALESCE(%s, rp.calificacion), rp.comentario = COALESCE(%s, rp.comentario)
+    WHERE rp.id_resena = %s AND c.id_usuario = %s;
+""" + SQL_RESENA_DEL_USUARIO
+
+SQL_APROBAR_RESENA = "UPDATE resenas_productos SET aprobada = %s WHERE id_resena = %s;\n" + SQL_RESENA_POR_ID
+SQL_ELIMINAR_RESENA = "DELETE FROM resenas_productos WHERE id_resena = %s"
+SQL_PRODUCTO_DE_RESENA = "SELECT id_producto FROM resenas_productos WHERE id_resena = %s"
+SQL_PRODUCTO_EXISTE = "SELECT 1 FROM productos WHERE id_producto = %s"
+
+# Verificacion y borrado en un solo envio (dos conjuntos de resultados): el SELECT
+# se ejecuta antes que el DELETE, asi que todavia ve la fila; si no la hay, el DELETE
+# no afecta nada. El del cliente solo borra resenas propias.
+SQL_ELIMINAR_RESENA_DEL_USUARIO = SQL_RESENA_DEL_USUARIO + """;
+    DELETE rp FROM resenas_productos rp
+    JOIN clientes c ON rp.id_cliente = c.id_cliente
+    WHERE rp.id_resena = %s AND c.id_usuario = %s
+"""
+SQL_ELIMINAR_RESENA_ADMIN = SQL_PRODUCTO_DE_RESENA + ";\n" + SQL_ELIMINAR_RESENA
+
+# Recorre idx_resenas_producto_aprobada_fecha (ver README); los JOIN son por clave primaria
+SQL_RESENAS_APROBADAS_PRODUCTO = """
+    SELECT rp.id_resena, rp.id_producto, rp.calificacion, rp.comentario, rp.fecha_resena, rp.aprobada,
+           c.nombre AS nombre_cliente, u.usuario AS username_cliente
+    FROM resenas_productos rp
+    JOIN clientes c ON rp.id_cliente = c.id_cliente
+    JOIN usuarios u ON c.id_usuario = u.id_usuario
+    WHERE rp.id_producto = %s AND rp.aprobada = 1
+    ORDER BY rp.fecha_resena DESC
+"""
+
+# Una pagina del listado del administrador; {filtro} es la condicion keyset (ver _filtro_keyset)
+SQL_RESENAS_ADMIN = """
+    SELECT rp.id_resena, rp.id_producto, rp.calificacion, rp.comentario, rp.fecha_resena, rp.aprobada,
+           p.nombre AS nombre_producto, c.nombre AS nombre_cliente, u.usuario AS username_cliente
+    FROM resenas_productos rp
+    JOIN productos p ON rp.id_producto = p.id_producto
+    JOIN clientes c ON rp.id_cliente = c.id_cliente
+    JOIN usuarios u ON c.id_usuario = u.id_usuario
+    WHERE {filtro}
+    ORDER BY rp.fecha_resena DESC, rp.id_resena DESC
+    LIMIT %s
+"""
+
+# Filas que se traen del cursor por cada viaje al servidor al recorrer el listado del administrador
+TAMANO_LOTE_RESENAS = 200
+
+_MENSAJES_VALIDACION = {
+    'id_producto': "ID de producto invalido.",
+    'calificacion': "Calificacion invalida. Debe ser un numero entero entre 1 y 5.",
+    'comentario': "El comentario debe ser un texto.",
+    'aprobada': "El valor de 'aprobada' debe ser 0 o 1.",
+}
+
+def _mensaje_validacion(error, requeridos=None):
+    """Mensaje para el primer error de validacion del cuerpo de una resena."""
+    errores = error.errors(include_url=False)
+    if errores[0]['type'] == 'model_type':
+        return "El cuerpo de la solicitud debe ser un objeto JSON."
+    # Como antes, un campo obligatorio ausente o nulo se informa con un solo mensaje
+    if requeridos and any(e['type'] == 'missing' or e.get('input') is None for e in errores):
+        return requeridos
+    return _MENSAJES_VALIDACION[errores[0]['loc'][0]]
+
+def _leer_parametros_paginacion():
+    """
+    Lee ?before=<fecha ISO>&before_id=<id>&limit=<n> para la paginacion por
+    cursor (keyset) del listado. Lanza ValueError si algun valor es invalido.
+    """
+    before = request.args.get('before')
+    before_id = request.args.get('before_id')
+    limite = obtener_limite(request.args.get('limit'))
+    try:
+        fecha = datetime.fromisoformat(before) if before else None
+        before_id = int(before_id) if before_id else None
+    except ValueError:
+        raise ValueError("Los parametros 'before' (fecha ISO) y 'before_id' (entero) no son validos.")
+    return fecha, before_id, limite
+
+def _filtro_keyset(fecha, before_id):
+    """Condicion SQL y parametros para continuar despues de la ultima resena recibida."""
+    if fecha is None:
+        return "1 = 1", ()
+    if before_id is None:
+        return "rp.fecha_resena < %s", (fecha,)
+    return "(rp.fecha_resena < %s OR (rp.fecha_resena = %s AND rp.id_resena < %s))", (fecha, fecha, before_id)
+
 # --- Rutas para la gestion de resenas (Clientes) ---
 
 @resenas_bp.route('/', methods=['POST'])
@@ -69,63 +223,52 @@ def crear_resena():
         description: Error interno del servidor
     """
     current_user_id = get_jwt_identity()
-    data = request.get_json()
-
-    id_producto = data.get('id_producto')
-    calificacion = data.get('calificacion')
-    comentario = limpiar_string(data.get('comentario'))
-
-    if not all([id_producto, calificacion is not None]):
-        return api_response(message="ID de producto y calificacion son requeridos.", status_code=400)
-    
-    if not isinstance(id_producto, int) or id_producto <= 0:
-        return api_response(message="ID de producto invalido.", status_code=400)
-    
-    if not isinstance(calificacion, int) or not (1 <= calificacion <= 5):
-        return api_response(message="Calificacion invalida. Debe ser un numero entero entre 1 y 5.", status_code=400)
+    try:
+        resena = CrearResenaIn.model_validate(request.get_json())
+    except ValidationError as e:
+        return api_response(message=_mensaje_validacion(e, requeridos="ID de producto y calificacion son requeridos."), status_code=400)
+    id_producto = resena.id_producto
+    calificacion = resena.calificacion
+    comentario = resena.comentario
 
     try:
         with db_session() as (conn, cursor):
-            # 1. Obtener id_cliente del usuario actual
-            cursor.execute("SELECT id_cliente FROM clientes WHERE id_usuario = %s", (current_user_id,))
-            cliente_info = cursor.fetchone()
-            if not cliente_info:
+            # 1. En una sola consulta: id_cliente del usuario actual, si el producto existe
+            # y si el cliente ya reseno este producto (para evitar duplicados)
+            cursor.execute(SQL_VERIFICAR_NUEVA_RESENA, (id_producto, id_producto, current_user_id))
+            verificacion = cursor.fetchone()
+            if not verificacion:
                 return api_response(message="Perfil de cliente no encontrado. Por favor, complete su perfil.", status_code=404)
-            id_cliente = cliente_info['id_cliente']
+            id_cliente = verificacion['id_cliente']
 
             # 2. Verificar si el producto existe
-            cursor.execute("SELECT id_producto FROM productos WHERE id_producto = %s", (id_producto,))
-            if not cursor.fetchone():
+            if not verificacion['producto_existe']:
                 return api_response(message=f"Producto con ID {id_producto} no encontrado.", status_code=400)
-            
-            # Opcional: Verificar si el cliente ya ha resenado este producto (para evitar duplicados)
-            cursor.execute("SELECT id_resena FROM resenas_productos WHERE id_producto = %s AND id_cliente = %s", (id_producto, id_cliente))
-            if cursor.fetchone():
+
+            if verificacion['resena_duplicada']:
                 return api_response(message="Ya has resenado este producto.", status_code=409)
 
-            # 3. Insertar la resena 
-            insert_resena_query = """
-                INSERT INTO resenas_productos (id_producto, id_cliente, calificacion, comentario, aprobada)
-                VALUES (%s, %s, %s, %s, 0)
-            """
-            cursor.execute(insert_resena_query, (id_producto, id_cliente, calificacion, comentario))
-            id_resena = cursor.lastrowid
-            conn.commit()
-
-            # 4. Obtener la resena recien creada para la respuesta
-            cursor.execute("SELECT id_resena, id_producto, id_cliente, calificacion, comentario, fecha_resena, aprobada FROM resenas_productos WHERE id_resena = %s", (id_resena,))
-            resena_creada = cursor.fetchone()
-            
-            return api_response(data=resena_creada, message="Resena creada exitosamente. Pendiente de aprobacion.", status_code=201)
-
-    except pymysql.Error as db_error:
-        conn.rollback()
-        print(f"DEBUG_RESENA_DB_ERROR: {db_error}")
-        return api_response(message="Error de base de datos al crear la resena.", status_code=500, error=str(db_error))
-    except Exception as e:
-        print(f"DEBUG_RESENA_CREATE_ERROR: {e}")
-        conn.rollback()
-        return api_response(message="Error interno del servidor al crear la resena.", status_code=500, error=str(e))
+            # 3. Insertar la resena. La fecha se envia explicitamente para armar la respuesta sin releer la fila
+            resena_creada = {
+                'id_producto': id_producto,
+                'id_cliente': id_cliente,
+                'calificacion': calificacion,
+                'comentario': comentario,
+                'fecha_resena': datetime.now().replace(microsecond=0),
+                'aprobada': 0
+            }
+            cursor.execute(SQL_INSERTAR_RESENA, tuple(resena_creada.values()))
+            resena_creada = {'id_resena': cursor.lastrowid, **resena_creada}
+
+        # Las resenas nuevas no estan aprobadas: no cambia ningun listado en cache
+        return api_response(data=resena_creada, message="Resena creada exitosamente. Pendiente de aprobacion.", status_code=201)
+
+    except DBError:
+        logger.exception("Error de base de datos al crear la resena")
+        return api_response(message="Error de base de datos al crear la resena.", status_code=500)
+    except Exception:
+        logger.exception("Error al crear la resena")
+        return api_response(message="Error interno del servidor al crear la resena.", status_code=500)
 
 @resenas_bp.route('/producto/<int:id_producto>', methods=['GET'])
 def obtener_resenas_por_producto(id_producto):  # Aquí se espera 'id_producto' como argumento
@@ -145,35 +288,49 @@ def obtener_resenas_por_producto(id_producto):  # Aquí se espera 'id_producto'
           type: array
           items:
             $ref: '#/definitions/ResenaCreada'
+      304:
+        description: El listado no cambio desde la version indicada en If-None-Match
       404:
         description: Producto no encontrado
       500:
         description: Error interno del servidor
     """
-    try:
-        with db_session() as (conn, cursor):
-            # Verificar si el producto existe
-            cursor.execute("SELECT id_producto FROM productos WHERE id_producto = %s", (id_producto,))
+    # La version del listado cambia con cada escritura sobre sus resenas: si el cliente
+    # ya tiene la actual se responde 304 sin consultar la cache ni la base de datos.
+    # Se lee una sola vez, antes que los datos, para el ETag y la clave de cache: un
+    # listado armado antes de una escritura queda bajo la version anterior. Sin Redis
+    # no hay version comun a los workers y se responde sin ETag
+    version = version_resenas(id_producto)
+    etag = f"{version}-{id_producto}" if version is not None and versiones_compartidas() else None
+    if etag and etag_coincide(etag):
+        return respuesta_no_modificada(etag, max_age=0)
+
+    def construir():
+        with db_session(readonly=True, tuplas=True) as (conn, cursor):
+            # Verificar si el producto existe (None: no se guarda en cache y se responde 404)
+            cursor.execute(SQL_PRODUCTO_EXISTE, (id_producto,))
             if not cursor.fetchone():
-                return api_response(message=f"Producto con ID {id_producto} no encontrado.", status_code=404)
+                return None
 
             # Seleccionar solo resenas aprobadas (aprobada = 1)
-            query = """
-                SELECT rp.id_resena, rp.id_producto, rp.calificacion, rp.comentario, rp.fecha_resena, rp.aprobada,
-                       c.nombre AS nombre_cliente, u.usuario AS username_cliente
-                FROM resenas_productos rp
-                JOIN clientes c ON rp.id_cliente = c.id_cliente
-                JOIN usuarios u ON c.id_usuario = u.id_usuario
-                WHERE rp.id_producto = %s AND rp.aprobada = 1
-                ORDER BY rp.fecha_resena DESC
-            """
-            cursor.execute(query, (id_producto,))
-            resenas = cursor.fetchall()
-            return api_response(data=resenas, message="Resenas obtenidas exitosamente.", status_code=200)
-
-    except Exception as e:
-        print(f"DEBUG_RESENA_GET_BY_PRODUCT_ERROR: {e}")
-        return api_response(message="Error interno del servidor al obtener las resenas del producto.", status_code=500, error=str(e))
+            cursor.execute(SQL_RESENAS_APROBADAS_PRODUCTO, (id_producto,))
+            return a_json(_filas_a_dicts(_COLUMNAS_RESENAS_PRODUCTO, cursor.fetchall()))
+
+    try:
+        # El listado se guarda ya serializado y se devuelve tal cual desde la cache;
+        # sin version conocida (Redis no responde) se consulta directamente
+        if version is None:
+            resenas = construir()
+        else:
+            resenas = obtener_o_construir_crudo(clave_resenas_producto(version, id_producto), TTL_RESENAS, construir)
+        if resenas is None:
+            return api_response(message=f"Producto con ID {id_producto} no encontrado.", status_code=404)
+        respuesta = api_response_crudo(resenas, message="Resenas obtenidas exitosamente.", status_code=200)
+        return con_etag(respuesta, etag, max_age=0) if etag else respuesta
+
+    except Exception:
+        logger.exception("Error al obtener las resenas del producto")
+        return api_response(message="Error interno del servidor al obtener las resenas del producto.", status_code=500)
 
 @resenas_bp.route('/my_reviews', methods=['GET'])
 @jwt_required()
@@ -200,30 +357,18 @@ def obtener_mis_resenas():
     current_user_id = get_jwt_identity()
 
     try:
-        with db_session() as (conn, cursor):
-            cursor.execute("SELECT id_cliente FROM clientes WHERE id_usuario = %s", (current_user_id,))
-            cliente_info = cursor.fetchone()
-            if not cliente_info:
+        with db_session(readonly=True, tuplas=True) as (conn, cursor):
+            # Partiendo de clientes: sin filas no hay perfil; una fila sin id_resena es un cliente sin resenas
+            cursor.execute(SQL_MIS_RESENAS, (current_user_id,))
+            filas = cursor.fetchall()
+            if not filas:
                 return api_response(message="Perfil de cliente no encontrado. Por favor, complete su perfil.", status_code=404)
-            id_cliente = cliente_info['id_cliente']
-
-            query = """
-                SELECT rp.id_resena, rp.id_producto, rp.calificacion, rp.comentario, rp.fecha_resena, rp.aprobada,
-                       p.nombre AS nombre_producto, c.nombre AS nombre_cliente, u.usuario AS username_cliente
-                FROM resenas_productos rp
-                JOIN productos p ON rp.id_producto = p.id_producto
-                JOIN clientes c ON rp.id_cliente = c.id_cliente
-                JOIN usuarios u ON c.id_usuario = u.id_usuario
-                WHERE rp.id_cliente = %s
-                ORDER BY rp.fecha_resena DESC
-            """
-            cursor.execute(query, (id_cliente,))
-            resenas = cursor.fetchall()
+            resenas = _filas_a_dicts(_COLUMNAS_MIS_RESENAS, (fila for fila in filas if fila[0] is not None))
             return api_response(data=resenas, message="Tus resenas obtenidas exitosamente.", status_code=200)
 
-    except Exception as e:
-        print(f"DEBUG_RESENA_GET_ME_ALL_ERROR: {e}")
-        return api_response(message="Error interno del servidor al obtener tus resenas.", status_code=500, error=str(e))
+    except Exception:
+        logger.exception("Error al obtener las resenas del cliente")
+        return api_response(message="Error interno del servidor al obtener tus resenas.", status_code=500)
 
 @resenas_bp.route('/my_reviews/<int:id_resena>', methods=['PUT'])
 @jwt_required()
@@ -268,65 +413,39 @@ def actualizar_mi_resena(id_resena):
         description: Error interno del servidor
     """
     current_user_id = get_jwt_identity()
-    data = request.get_json()
-
-    calificacion = data.get('calificacion')
-    comentario = limpiar_string(data.get('comentario'))
+    try:
+        cambios = ActualizarResenaIn.model_validate(request.get_json())
+    except ValidationError as e:
+        return api_response(message=_mensaje_validacion(e), status_code=400)
+    calificacion = cambios.calificacion
+    comentario = cambios.comentario
 
-    if calificacion is not None and (not isinstance(calificacion, int) or not (1 <= calificacion <= 5)):
-        return api_response(message="Calificacion invalida. Debe ser un numero entero entre 1 y 5.", status_code=400)
-    
     if calificacion is None and comentario is None:
         return api_response(message="Al menos la calificacion o el comentario deben ser proporcionados para actualizar.", status_code=400)
 
     try:
-        with db_session() as (conn, cursor):
-            # 1. Obtener id_cliente del usuario actual
-            cursor.execute("SELECT id_cliente FROM clientes WHERE id_usuario = %s", (current_user_id,))
-            cliente_info = cursor.fetchone()
-            if not cliente_info:
+        with db_session(lotes=True) as (conn, cursor):
+            # Actualizar la resena (solo si es del usuario) y leerla ya actualizada, en un solo viaje.
+            # La lectura distingue un usuario sin perfil de una resena inexistente o ajena.
+            cursor.execute(SQL_ACTUALIZAR_RESENA, (calificacion, comentario, id_resena, current_user_id,
+                                                   id_resena, current_user_id))
+            cursor.nextset()
+            propiedad = cursor.fetchone()
+            if not propiedad:
                 return api_response(message="Perfil de cliente no encontrado.", status_code=404)
-            id_cliente = cliente_info['id_cliente']
-
-            # 2. Verificar que la resena existe y pertenece al cliente autenticado
-            cursor.execute("SELECT id_resena FROM resenas_productos WHERE id_resena = %s AND id_cliente = %s", (id_resena, id_cliente))
-            if not cursor.fetchone():
+            if propiedad['id_resena'] is None:
                 return api_response(message="Resena no encontrada o no tienes permiso para actualizarla.", status_code=404)
-            
-            # 3. Construir la consulta de actualizacion dinamicamente
-            update_fields = []
-            update_values = []
-
-            if calificacion is not None:
-                update_fields.append("calificacion = %s")
-                update_values.append(calificacion)
-            if comentario is not None:
-                update_fields.append("comentario = %s")
-                update_values.append(comentario)
-            
-            if not update_fields:
-                return api_response(message="No hay campos validos para actualizar.", status_code=400)
-
-            update_query = f"UPDATE resenas_productos SET {', '.join(update_fields)} WHERE id_resena = %s"
-            update_values.append(id_resena)
-
-            cursor.execute(update_query, tuple(update_values))
-            conn.commit()
-
-            # 4. Obtener la resena actualizada para la respuesta
-            cursor.execute("SELECT id_resena, id_producto, id_cliente, calificacion, comentario, fecha_resena, aprobada FROM resenas_productos WHERE id_resena = %s", (id_resena,))
-            updated_resena = cursor.fetchone()
+            updated_resena = {columna: propiedad[columna] for columna in _COLUMNAS_RESENA}
 
-            return api_response(data=updated_resena, message="Resena actualizada exitosamente.", status_code=200)
+        invalidar_resenas(updated_resena['id_producto'])
+        return api_response(data=updated_resena, message="Resena actualizada exitosamente.", status_code=200)
 
-    except pymysql.Error as db_error:
-        conn.rollback()
-        print(f"DEBUG_RESENA_UPDATE_DB_ERROR: {db_error}")
-        return api_response(message="Error de base de datos al actualizar la resena.", status_code=500, error=str(db_error))
-    except Exception as e:
-        print(f"DEBUG_RESENA_UPDATE_ERROR: {e}")
-        conn.rollback()
-        return api_response(message="Error interno del servidor al actualizar la resena.", status_code=500, error=str(e))
+    except DBError:
+        logger.exception("Error de base de datos al actualizar la resena")
+        return api_response(message="Error de base de datos al actualizar la resena.", status_code=500)
+    except Exception:
+        logger.exception("Error al actualizar la resena")
+        return api_response(message="Error interno del servidor al actualizar la resena.", status_code=500)
 
 @resenas_bp.route('/my_reviews/<int:id_resena>', methods=['DELETE'])
 @jwt_required()
@@ -357,34 +476,25 @@ def eliminar_mi_resena(id_resena):
     current_user_id = get_jwt_identity()
 
     try:
-        with db_session() as (conn, cursor):
-            # 1. Obtener id_cliente del usuario actual
-            cursor.execute("SELECT id_cliente FROM clientes WHERE id_usuario = %s", (current_user_id,))
-            cliente_info = cursor.fetchone()
-            if not cliente_info:
+        with db_session(lotes=True) as (conn, cursor):
+            # Verificar el perfil y la propiedad de la resena y eliminarla, en un solo viaje
+            cursor.execute(SQL_ELIMINAR_RESENA_DEL_USUARIO, (id_resena, current_user_id, id_resena, current_user_id))
+            propiedad = cursor.fetchone()
+            cursor.nextset()
+            if not propiedad:
                 return api_response(message="Perfil de cliente no encontrado.", status_code=404)
-            id_cliente = cliente_info['id_cliente']
-
-            # 2. Verificar que la resena existe y pertenece al cliente autenticado
-            cursor.execute("SELECT id_resena FROM resenas_productos WHERE id_resena = %s AND id_cliente = %s", (id_resena, id_cliente))
-            if not cursor.fetchone():
+            if propiedad['id_resena'] is None:
                 return api_response(message="Resena no encontrada o no tienes permiso para eliminarla.", status_code=404)
-            
-            # 3. Eliminar la resena
-            delete_query = "DELETE FROM resenas_productos WHERE id_resena = %s"
-            cursor.execute(delete_query, (id_resena,))
-            conn.commit()
 
-            return api_response(message="Resena eliminada exitosamente.", status_code=200)
+        invalidar_resenas(propiedad['id_producto'])
+        return api_response(message="Resena eliminada exitosamente.", status_code=200)
 
-    except pymysql.Error as db_error:
-        conn.rollback()
-        print(f"DEBUG_RESENA_DELETE_DB_ERROR: {db_error}")
-        return api_response(message="Error de base de datos al eliminar la resena.", status_code=500, error=str(db_error))
-    except Exception as e:
-        print(f"DEBUG_RESENA_DELETE_ERROR: {e}")
-        conn.rollback()
-        return api_response(message="Error interno del servidor al eliminar la resena.", status_code=500, error=str(e))
+    except DBError:
+        logger.exception("Error de base de datos al eliminar la resena")
+        return api_response(message="Error de base de datos al eliminar la resena.", status_code=500)
+    except Exception:
+        logger.exception("Error al eliminar la resena")
+        return api_response(message="Error interno del servidor al eliminar la resena.", status_code=500)
 
 
 # --- Rutas para la gestion de resenas (Administrador) ---
@@ -395,10 +505,26 @@ def eliminar_mi_resena(id_resena):
 def obtener_resenas():
     """
     Obtiene una lista de todas las resenas de productos en el sistema (Solo Administrador).
-    Incluye resenas aprobadas y no aprobadas.
+    Incluye resenas aprobadas y no aprobadas, de la mas reciente a la mas antigua, paginadas por cursor.
     ---
     security:
       - Bearer: []
+    parameters:
+      - in: query
+        name: before
+        type: string
+        required: false
+        description: Fecha ISO de la ultima resena recibida (cursor de la pagina siguiente).
+      - in: query
+        name: before_id
+        type: integer
+        required: false
+        description: ID de la ultima resena recibida (desempata resenas con la misma fecha).
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: Cantidad maxima de resenas a devolver (por defecto 50, maximo 200).
     responses:
       200:
         description: Lista de resenas obtenida exitosamente
@@ -406,6 +532,8 @@ def obtener_resenas():
           type: array
           items:
             $ref: '#/definitions/ResenaCreada'
+      400:
+        description: Parametros de paginacion invalidos
       401:
         description: No autorizado
       403:
@@ -414,23 +542,38 @@ def obtener_resenas():
         description: Error interno del servidor
     """
     try:
-        with db_session() as (conn, cursor):
-            query = """
-                SELECT rp.id_resena, rp.id_producto, rp.calificacion, rp.comentario, rp.fecha_resena, rp.aprobada,
-                       p.nombre AS nombre_producto, c.nombre AS nombre_cliente, u.usuario AS username_cliente
-                FROM resenas_productos rp
-                JOIN productos p ON rp.id_producto = p.id_producto
-                JOIN clientes c ON rp.id_cliente = c.id_cliente
-                JOIN usuarios u ON c.id_usuario = u.id_usuario
-                ORDER BY rp.fecha_resena DESC
-            """
-            cursor.execute(query)
-            resenas = cursor.fetchall()
-            return api_response(data=resenas, message="Lista de todas las resenas obtenida exitosamente.", status_code=200)
-
-    except Exception as e:
-        print(f"DEBUG_RESENA_GET_ALL_ADMIN_ERROR: {e}")
-        return api_response(message="Error interno del servidor al obtener todas las resenas.", status_code=500, error=str(e))
+        fecha, before_id, limite = _leer_parametros_paginacion()
+    except ValueError as e:
+        return api_response(message=str(e), status_code=400)
+
+    filtro, params_filtro = _filtro_keyset(fecha, before_id)
+    enviadas = {'cantidad': 0, 'ultima': None}
+
+    def generar_resenas():
+        # Las filas se leen del servidor por lotes y se envian a medida que llegan
+        with db_session(readonly=True, server_side=True, tuplas=True) as (conn, cursor):
+            cursor.execute(SQL_RESENAS_ADMIN.format(filtro=filtro), (*params_filtro, limite))
+            while True:
+                lote = cursor.fetchmany(TAMANO_LOTE_RESENAS)
+                if not lote:
+                    break
+                enviadas['cantidad'] += len(lote)
+                enviadas['ultima'] = lote[-1]
+                yield from _filas_a_dicts(_COLUMNAS_RESENAS_ADMIN, lote)
+
+    def paginacion():
+        ultima = enviadas['ultima']
+        if ultima is None or enviadas['cantidad'] < limite:
+            return {'next_cursor': None}
+        return {'next_cursor': {'before': ultima[4].isoformat(), 'before_id': ultima[0]}}
+
+    try:
+        return api_response_stream(generar_resenas(), message="Lista de todas las resenas obtenida exitosamente.",
+                                   status_code=200, paginacion=paginacion)
+
+    except Exception:
+        logger.exception("Error al obtener todas las resenas")
+        return api_response(message="Error interno del servidor al obtener todas las resenas.", status_code=500)
 
 @resenas_bp.route('/admin/<int:id_resena>/aprobar', methods=['PUT'])
 @jwt_required()
@@ -473,33 +616,26 @@ def aprobar_resena(id_resena):
       500:
         description: Error interno del servidor
     """
-    data = request.get_json()
-    estado_aprobacion = data.get('aprobada')
-
-    if estado_aprobacion is None or not isinstance(estado_aprobacion, int) or estado_aprobacion not in [0, 1]:
-        return api_response(message="El valor de 'aprobada' debe ser 0 o 1.", status_code=400)
+    try:
+        estado_aprobacion = AprobarResenaIn.model_validate(request.get_json()).aprobada
+    except ValidationError as e:
+        return api_response(message=_mensaje_validacion(e), status_code=400)
     
     try:
-        with db_session() as (conn, cursor):
-            # 1. Verificar si la resena existe
-            cursor.execute("SELECT id_resena FROM resenas_productos WHERE id_resena = %s", (id_resena,))
-            if not cursor.fetchone():
-                return api_response(message="Resena no encontrada.", status_code=404)
-            
-            update_query = "UPDATE resenas_productos SET aprobada = %s WHERE id_resena = %s"
-            cursor.execute(update_query, (estado_aprobacion, id_resena))
-            conn.commit()
-
-            # Obtener la resena actualizada para la respuesta
-            cursor.execute("SELECT id_resena, id_producto, id_cliente, calificacion, comentario, fecha_resena, aprobada FROM resenas_productos WHERE id_resena = %s", (id_resena,))
+        with db_session(lotes=True) as (conn, cursor):
+            # Actualizar y leer la resena ya actualizada en un solo viaje (sin fila: no existe)
+            cursor.execute(SQL_APROBAR_RESENA, (estado_aprobacion, id_resena, id_resena))
+            cursor.nextset()
             updated_resena = cursor.fetchone()
+            if not updated_resena:
+                return api_response(message="Resena no encontrada.", status_code=404)
 
-            return api_response(data=updated_resena, message="Estado de aprobacion de la resena actualizado exitosamente.", status_code=200)
+        invalidar_resenas(updated_resena['id_producto'])
+        return api_response(data=updated_resena, message="Estado de aprobacion de la resena actualizado exitosamente.", status_code=200)
 
-    except Exception as e:
-        print(f"DEBUG_RESENA_APROBAR_ADMIN_ERROR: {e}")
-        conn.rollback()
-        return api_response(message="Error interno del servidor al actualizar el estado de aprobacion de la resena.", status_code=500, error=str(e))
+    except Exception:
+        logger.exception("Error al actualizar la aprobacion de la resena")
+        return api_response(message="Error interno del servidor al actualizar el estado de aprobacion de la resena.", status_code=500)
 
 @resenas_bp.route('/admin/<int:id_resena>', methods=['DELETE'])
 @jwt_required()
@@ -529,22 +665,20 @@ def eliminar_resena(id_resena):
         description: Error interno del servidor
     """
     try:
-        with db_session() as (conn, cursor):
-            # Verificar si la resena existe
-            cursor.execute("SELECT id_resena FROM resenas_productos WHERE id_resena = %s", (id_resena,))
-            if not cursor.fetchone():
+        with db_session(lotes=True) as (conn, cursor):
+            # Leer el producto de la resena (para invalidar su listado) y eliminarla, en un solo viaje
+            cursor.execute(SQL_ELIMINAR_RESENA_ADMIN, (id_resena, id_resena))
+            resena = cursor.fetchone()
+            cursor.nextset()
+            if not resena:
                 return api_response(message="Resena no encontrada.", status_code=404)
-            
-            delete_query = "DELETE FROM resenas_productos WHERE id_resena = %s"
-            cursor.execute(delete_query, (id_resena,))
-            conn.commit()
 
-            return api_response(message="Resena eliminada exitosamente.", status_code=200)
+        invalidar_resenas(resena['id_producto'])
+        return api_response(message="Resena eliminada exitosamente.", status_code=200)
 
-    except Exception as e:
-        print(f"DEBUG_RESENA_DELETE_ADMIN_ERROR: {e}")
-        conn.rollback()
-        return api_response(message="Error interno del servidor al eliminar la resena.", status_code=500, error=str(e))
+    except Exception:
+        logger.exception("Error al eliminar la resena (admin)")
+        return api_response(message="Error interno del servidor al eliminar la resena.", status_code=500)
 
 definitions = {
     "CrearResena": {
@@ -1,52 +1,110 @@
-from flask import Blueprint, jsonify, request
-import pymysql.cursors
-import bcrypt
+import logging
+from flask import Blueprint, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
-from utils.db import conectar_db
-from utils.auth_decorators import Administrador_requerido, Administrador_o_Empleado_requerido, jwt_auth_required
-from utils.helpers import api_response, db_session, limpiar_string, es_email_valido
+from utils.cache import CacheTTL
+from utils.contrasenas import LONGITUD_MAXIMA, hash_contrasena, necesita_rehash, verificar_contrasena
+from utils.db import ERROR_DUPLICADO, ERROR_FK_INEXISTENTE, IntegrityError
+from utils.auth_decorators import (Administrador_requerido, Administrador_o_Empleado_requerido, get_user_role_from_db,
+                                   jwt_auth_required)
+from utils.helpers import (ErrorDominio, api_response, api_response_stream, con_etag, cuerpo_json, db_session, etag_coincide,
+                           limpiar_string, es_email_valido, obtener_id_cliente, respuesta_no_modificada, valor_etag)
 
 
+logger = logging.getLogger(__name__)
+
 usuarios_bp = Blueprint('usuarios_bp', __name__)
 
-SALT_ROUNDS = 12
+# Sentencias SQL fijas, armadas una sola vez al importar el módulo
+# Perfil público de los usuarios, tal como lo devuelven los endpoints
+SQL_USUARIOS = """
+    SELECT u.id_usuario, u.nombre, u.usuario, u.telefono, r.nombre_rol AS rol
+    FROM usuarios u
+    JOIN roles r ON u.id_rol = r.id_rol
+"""
+SQL_PERFIL_USUARIO = SQL_USUARIOS + "    WHERE u.id_usuario = %s\n"
+# El nombre del rol se toma del mapa de roles en memoria (_mapa_roles), sin JOIN a roles
+SQL_LOGIN = """
+    SELECT u.id_usuario, u.nombre, u.contrasena, u.id_rol, c.id_cliente
+    FROM usuarios u
+    LEFT JOIN clientes c ON c.id_usuario = u.id_usuario
+    WHERE u.usuario = %s
+"""
+# El id del rol 'Cliente' se resuelve en el mismo INSERT
+SQL_INSERTAR_CLIENTE = """
+    INSERT INTO usuarios (nombre, usuario, contrasena, telefono, id_rol)
+    SELECT %s, %s, %s, %s, id_rol FROM roles WHERE nombre_rol = 'Cliente'
+"""
+SQL_ELIMINAR_USUARIO = "DELETE FROM usuarios WHERE id_usuario = %s"
+SQL_CONTRASENA_USUARIO = "SELECT contrasena FROM usuarios WHERE id_usuario = %s"
+SQL_ACTUALIZAR_CONTRASENA = "UPDATE usuarios SET contrasena = %s WHERE id_usuario = %s"
+# Solo si el hash guardado sigue siendo el que se verificó
+SQL_CAMBIAR_CONTRASENA = SQL_ACTUALIZAR_CONTRASENA + " AND contrasena = %s"
+# UPDATE del rol y perfil actualizado en un solo envío (dos conjuntos de resultados)
+SQL_ACTUALIZAR_ROL = "UPDATE usuarios SET id_rol = %s WHERE id_usuario = %s;" + SQL_PERFIL_USUARIO
+SQL_ROLES = "SELECT id_rol, nombre_rol FROM roles"
+
+# Filas que se traen del cursor por cada viaje al servidor al recorrer la lista de usuarios
+TAMANO_LOTE_USUARIOS = 500
+
+# UPDATE del perfil y perfil actualizado en un solo envío, una variante por cada
+# combinación no vacía de campos; el bit i de la máscara corresponde a _CAMPOS_PERFIL[i]
+_CAMPOS_PERFIL = ("nombre", "usuario", "telefono")
+SQL_ACTUALIZAR_PERFIL = {
+    mascara: "UPDATE usuarios SET "
+             + ", ".join(f"{campo} = %s" for i, campo in enumerate(_CAMPOS_PERFIL) if mascara & (1 << i))
+             + " WHERE id_usuario = %s;" + SQL_PERFIL_USUARIO
+    for mascara in range(1, 1 << len(_CAMPOS_PERFIL))
+}
 
 # Funciones Auxiliares para Roles 
-def obtener_nombre_de_rol_por_id(id_rol):
-    conn = None
-    cursor = None
-    try:
-        conn = conectar_db()
-        cursor = conn.cursor(pymysql.cursors.DictCursor)
-        query = "SELECT nombre_rol FROM roles WHERE id_rol = %s"
-        cursor.execute(query, (id_rol,))
-        result = cursor.fetchone()
-        return result['nombre_rol'] if result else None
-    except Exception as e:
-        print(f"Error al obtener nombre de rol por ID {id_rol}: {e}")
-        return None
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
-
-def obtener_identificación_de_rol_por_nombre(nombre_rol):
-    conn = None
-    cursor = None
-    try:
-        conn = conectar_db()
-        cursor = conn.cursor(pymysql.cursors.DictCursor)
-        query = "SELECT id_rol FROM roles WHERE nombre_rol = %s"
-        cursor.execute(query, (nombre_rol,))
-        result = cursor.fetchone()
-        return result['id_rol'] if result else None
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+# La tabla roles es pequeña y casi nunca cambia: se lee completa una vez y se
+# guarda en memoria del proceso; el TTL acota cuánto tarda en verse un cambio.
+TTL_ROLES = 300
+_cache_roles = CacheTTL(maxsize=1, ttl=TTL_ROLES)
+# Segundos que el navegador puede reutilizar la lista de roles sin revalidarla
+MAX_AGE_ROLES = 60
+
+def _mapa_roles():
+    """Devuelve ({nombre_rol: id_rol}, {id_rol: nombre_rol}), de la caché o de la base de datos."""
+    mapas = _cache_roles.obtener("roles")
+    if mapas is None:
+        with db_session(readonly=True) as (conn, cursor):
+            cursor.execute(SQL_ROLES)
+            filas = cursor.fetchall()
+        mapas = ({fila['nombre_rol']: fila['id_rol'] for fila in filas},
+                 {fila['id_rol']: fila['nombre_rol'] for fila in filas})
+        _cache_roles.guardar("roles", mapas)
+    return mapas
+
+def _nombre_rol(id_rol):
+    """Nombre del rol; si no está en la caché (rol creado hace poco) se recarga una vez."""
+    nombre = _mapa_roles()[1].get(id_rol)
+    if nombre is None:
+        _cache_roles.invalidar("roles")
+        nombre = _mapa_roles()[1].get(id_rol)
+    return nombre
+
+def _crear_token(id_usuario, rol_nombre, id_cliente):
+    """
+    Token de acceso con el rol (claim 'roles', en el que confían los decoradores de
+    autorización) y el id_cliente, que viaja en el token para no consultarlo en cada petición.
+    """
+    claims = {"roles": [rol_nombre]}
+    if id_cliente is not None:
+        claims["id_cliente"] = id_cliente
+    return create_access_token(identity=str(id_usuario), additional_claims=claims)
 
+def _actualizar_hash(id_usuario, contrasena):
+    """
+    Reemplaza un hash antiguo (bcrypt o argon2 con otros parámetros) por uno actual
+    tras un inicio de sesión correcto. Un fallo aquí no impide iniciar sesión.
+    """
+    try:
+        nuevo_hash = hash_contrasena(contrasena)
+        with db_session() as (conn, cursor):
+            cursor.execute(SQL_ACTUALIZAR_CONTRASENA, (nuevo_hash, id_usuario))
+    except Exception:
+        logger.exception("No se pudo actualizar el hash de la contraseña del usuario %s", id_usuario)
 
 # Definir Rutas
 @usuarios_bp.route('/registro', methods=['POST'])
@@ -99,52 +157,45 @@ def registro_usuario():
       500:
         description: Error interno del servidor
     """
-    data = request.get_json()
-    nombre = limpiar_string(data.get('nombre'))
-    usuario = limpiar_string(data.get('usuario'))
-    contrasena = data.get('contrasena')
-    telefono = limpiar_string(data.get('telefono'))
+    nombre, usuario, contrasena, telefono = map(cuerpo_json().get, ('nombre', 'usuario', 'contrasena', 'telefono'))
+    nombre, usuario, telefono = map(limpiar_string, (nombre, usuario, telefono))
 
     if not all([nombre, usuario, contrasena, telefono]):
         return api_response(message="Nombre, usuario, contraseña y teléfono son campos requeridos.", status_code=400)
 
+    if not all(isinstance(campo, str) for campo in (nombre, usuario, contrasena, telefono)):
+        return api_response(message="Nombre, usuario, contraseña y teléfono deben ser texto.", status_code=400)
     if not es_email_valido(usuario):
           return api_response(message="El formato del nombre de usuario (email) no es válido.", status_code=400)
     if len(contrasena) < 8:
         return api_response(message="La contraseña debe tener al menos 8 caracteres.", status_code=400)
-
-    try:
-        with db_session() as (conn, cursor):
-            check_user_query = "SELECT id_usuario FROM usuarios WHERE usuario = %s"
-            cursor.execute(check_user_query, (usuario,))
-            if cursor.fetchone():
-                return api_response(message="El nombre de usuario ya está registrado.", status_code=400)
-
-            # bcrypt para la contraseña
-            hashed_password = bcrypt.hashpw(contrasena.encode('utf-8'), bcrypt.gensalt(SALT_ROUNDS)).decode('utf-8')
-
-            id_rol_cliente = get_role_id_by_name("Cliente")
-            if not id_rol_cliente:
-                return api_response(message="Error: Rol 'Cliente' no encontrado en la base de datos.", status_code=500)
-
-            insert_query = """
-                INSERT INTO usuarios (nombre, usuario, contrasena, telefono, id_rol)
-                VALUES (%s, %s, %s, %s, %s)
-            """
-            cursor.execute(insert_query, (nombre, usuario, hashed_password, telefono, id_rol_cliente))
-            user_id = cursor.lastrowid
-
-            query_new_user = """
-                SELECT u.id_usuario, u.nombre, u.usuario, u.telefono, r.nombre_rol AS rol
-                FROM usuarios u JOIN roles r ON u.id_rol = r.id_rol WHERE u.id_usuario = %s
-            """
-            cursor.execute(query_new_user, (user_id,))
-            new_user_data = cursor.fetchone()
-
-            return api_response(data=new_user_data, message="Usuario registrado exitosamente.", status_code=201)
-
-    except Exception as e:
-        return api_response(message="Error interno del servidor al registrar usuario.", status_code=500, error=str(e))
+    if len(contrasena) > LONGITUD_MAXIMA:
+        return api_response(message=f"La contraseña no puede tener más de {LONGITUD_MAXIMA} caracteres.", status_code=400)
+
+    # Hash de la contraseña (antes de tomar una conexión del pool)
+    hashed_password = hash_contrasena(contrasena)
+
+    with db_session() as (conn, cursor):
+        # El usuario duplicado lo rechaza el índice UNIQUE de usuarios.usuario
+        try:
+            cursor.execute(SQL_INSERTAR_CLIENTE, (nombre, usuario, hashed_password, telefono))
+        except IntegrityError as e:
+            if e.args[0] == ERROR_DUPLICADO:
+                raise ErrorDominio("El nombre de usuario ya está registrado.", 400)
+            raise
+        if cursor.rowcount == 0:
+            raise ErrorDominio("Error: Rol 'Cliente' no encontrado en la base de datos.", 500)
+        user_id = cursor.lastrowid
+
+    # Todos los datos del usuario nuevo ya se conocen; no hace falta releerlos
+    new_user_data = {
+        "id_usuario": user_id,
+        "nombre": nombre,
+        "usuario": usuario,
+        "telefono": telefono,
+        "rol": "Cliente"
+    }
+    return api_response(data=new_user_data, message="Usuario registrado exitosamente.", status_code=201)
 
 # ruta de inicio de sesion de usuario 
 @usuarios_bp.route('/login', methods=['POST'])
@@ -192,42 +243,84 @@ def iniciar_sesion():
       500:
         description: Error interno del servidor
     """
-    data = request.get_json()
-    usuario = limpiar_string(data.get('usuario'))
-    contrasena = data.get('contrasena')
+    usuario, contrasena = map(cuerpo_json().get, ('usuario', 'contrasena'))
+    usuario = limpiar_string(usuario)
 
     if not all([usuario, contrasena]):
         return api_response(message="Usuario y contraseña son campos requeridos.", status_code=400)
+    # Ninguna contraseña guardada supera LONGITUD_MAXIMA: se rechaza sin calcular el hash
+    if not isinstance(usuario, str) or not isinstance(contrasena, str) or len(contrasena) > LONGITUD_MAXIMA:
+        return api_response(message="Credenciales inválidas.", status_code=401)
+
+    with db_session() as (conn, cursor):
+        cursor.execute(SQL_LOGIN, (usuario,))
+        user = cursor.fetchone()
+
+    # Verificar la contraseña contra el hash guardado, ya con la conexión devuelta al pool.
+    # Sin usuario se verifica igual contra un hash de relleno (mismo tiempo de respuesta)
+    if verificar_contrasena(contrasena, user['contrasena'] if user else None):
+        if necesita_rehash(user['contrasena']):
+            _actualizar_hash(user['id_usuario'], contrasena)
+        rol_nombre = _nombre_rol(user['id_rol'])
+        access_token = _crear_token(user['id_usuario'], rol_nombre, user['id_cliente'])
+
+        return api_response(data={
+            "id_usuario": user['id_usuario'],
+            "nombre": user['nombre'],
+            "rol": rol_nombre,
+            "token": access_token
+        }, message="Inicio de sesión exitoso.", status_code=200)
+    else:
+        return api_response(message="Credenciales inválidas.", status_code=401)
+
+# ruta para renovar el token con el rol actual del usuario
+@usuarios_bp.route('/refresh-claims', methods=['POST'])
+@jwt_required()
+def renovar_claims():
+    """
+    Emite un token nuevo con el rol actual del usuario autenticado. Los permisos se
+    leen del token, así que tras un cambio de rol el usuario debe llamar a esta ruta
+    (o volver a iniciar sesión) para que el cambio tenga efecto.
+    ---
+    security:
+      - Bearer: []
+    responses:
+      200:
+        description: Token renovado
+        schema:
+          properties:
+            mensaje:
+              type: string
+            data:
+              type: object
+              properties:
+                id_usuario:
+                  type: integer
+                rol:
+                  type: string
+                token:
+                  type: string
+      401:
+        description: No autorizado
+      404:
+        description: Usuario no encontrado
+      500:
+        description: Error interno del servidor
+    """
+    current_user_id = get_jwt_identity()
 
-    try:
-        with db_session() as (conn, cursor):
-            query = """
-                SELECT u.id_usuario, u.nombre, u.contrasena, r.nombre_rol, r.id_rol
-                FROM usuarios u
-                JOIN roles r ON u.id_rol = r.id_rol
-                WHERE u.usuario = %s
-            """
-            cursor.execute(query, (usuario,))
-            user = cursor.fetchone()
-
-            # Usamos bcrypt para verificar la contraseña
-            if user and bcrypt.checkpw(contrasena.encode('utf-8'), user['contrasena'].encode('utf-8')):
-                rol_nombre = user['nombre_rol']
-
-                access_token = create_access_token(identity=str(user['id_usuario']),
-                                                   additional_claims={"roles": [rol_nombre]})
-
-                return api_response(data={
-                    "id_usuario": user['id_usuario'],
-                    "nombre": user['nombre'],
-                    "rol": rol_nombre,
-                    "token": access_token
-                }, message="Inicio de sesión exitoso.", status_code=200)
-            else:
-                return api_response(message="Credenciales inválidas.", status_code=401)
-
-    except Exception as e:
-        return api_response(message="Error interno del servidor al iniciar sesión.", status_code=500, error=str(e))
+    # El rol se lee de la base para reflejar un cambio reciente
+    rol_nombre = get_user_role_from_db(current_user_id)
+    if rol_nombre is None:
+        raise ErrorDominio("Usuario no encontrado.", 404)
+    with db_session(readonly=True) as (conn, cursor):
+        id_cliente = obtener_id_cliente(cursor, current_user_id)
+
+    return api_response(data={
+        "id_usuario": int(current_user_id),
+        "rol": rol_nombre,
+        "token": _crear_token(current_user_id, rol_nombre, id_cliente)
+    }, message="Token renovado.", status_code=200)
 
 # ruta para obtner el perfil del usuario
 @usuarios_bp.route('/me', methods=['GET'])
@@ -263,24 +356,14 @@ def obtener_perfil():
     """
     current_user_id = get_jwt_identity()
 
-    try:
-        with db_session() as (conn, cursor):
-            query = """
-                SELECT u.id_usuario, u.nombre, u.usuario, u.telefono, r.nombre_rol AS rol
-                FROM usuarios u
-                JOIN roles r ON u.id_rol = r.id_rol
-                WHERE u.id_usuario = %s
-            """
-            cursor.execute(query, (current_user_id,))
-            user_profile = cursor.fetchone()
-
-            if user_profile:
-                return api_response(data=user_profile, message="Perfil de usuario obtenido.", status_code=200)
-            else:
-                return api_response(message="Perfil de usuario no encontrado.", status_code=404)
+    with db_session() as (conn, cursor):
+        cursor.execute(SQL_PERFIL_USUARIO, (current_user_id,))
+        user_profile = cursor.fetchone()
 
-    except Exception as e:
-        return api_response(message="Error interno del servidor al obtener perfil de usuario.", status_code=500, error=str(e))
+        if user_profile:
+            return api_response(data=user_profile, message="Perfil de usuario obtenido.", status_code=200)
+        else:
+            raise ErrorDominio("Perfil de usuario no encontrado.", 404)
 
 
 @usuarios_bp.route('/usuarios', methods=['GET'])
@@ -306,20 +389,17 @@ def Lista_usuarios():
       500:
         description: Error interno del servidor
     """
-    try:
-        with db_session() as (conn, cursor):
-            query = """
-                SELECT u.id_usuario, u.nombre, u.usuario, u.telefono, r.nombre_rol AS rol
-                FROM usuarios u
-                JOIN roles r ON u.id_rol = r.id_rol
-            """
-            cursor.execute(query)
-            users = cursor.fetchall()
-
-            return api_response(data=users, message="Lista de usuarios obtenida.", status_code=200)
+    def filas():
+        # Cursor del lado del servidor: las filas se leen por lotes mientras se envían
+        with db_session(readonly=True, server_side=True) as (conn, cursor):
+            cursor.execute(SQL_USUARIOS)
+            while True:
+                lote = cursor.fetchmany(TAMANO_LOTE_USUARIOS)
+                if not lote:
+                    break
+                yield from lote
 
-    except Exception as e:
-        return api_response(message="Error interno del servidor al obtener todos los usuarios.", status_code=500, error=str(e))
+    return api_response_stream(filas(), message="Lista de usuarios obtenida.", status_code=200)
 
 
 @usuarios_bp.route('/usuarios/<int:id_usuario>', methods=['PUT'])
@@ -360,56 +440,43 @@ def actualiza_perfil(id_usuario):
           500:
             description: Error interno del servidor
         """
-    data = request.get_json()
-    nombre = limpiar_string(data.get('nombre'))
-    usuario_name = limpiar_string(data.get('usuario'))
-    telefono = limpiar_string(data.get('telefono')) if data.get('telefono') else None
+    campos = tuple(map(cuerpo_json().get, ('nombre', 'usuario', 'telefono')))
 
     current_user_id = get_jwt_identity()
     claims = get_jwt()
     user_roles = claims.get("roles", [])
 
-    if current_user_id != id_usuario and "Admin" not in user_roles:
+    # La identidad del token es texto; el id de la ruta, entero
+    if str(current_user_id) != str(id_usuario) and "Administrador" not in user_roles:
         return api_response(message="Acceso denegado: No tienes permiso para actualizar este perfil.", status_code=403)
 
-    try:
-        with db_session() as (conn, cursor):
-            update_fields = []
-            update_values = []
-            if nombre:
-                update_fields.append("nombre = %s")
-                update_values.append(nombre)
-            if usuario_name:
-                update_fields.append("usuario = %s")
-                update_values.append(usuario_name)
-            if telefono is not None:
-                update_fields.append("telefono = %s")
-                update_values.append(telefono)
-
-            if not update_fields:
-                return api_response(message="No hay campos para actualizar.", status_code=400)
-
-            update_query = "UPDATE usuarios SET " + ", ".join(update_fields) + " WHERE id_usuario = %s"
-            update_values.append(id_usuario)
-
-            cursor.execute(update_query, tuple(update_values))
-
-            if cursor.rowcount == 0:
-                return api_response(message="Usuario no encontrado o no se realizaron cambios.", status_code=404)
-
-            query_updated = """
-                SELECT u.id_usuario, u.nombre, u.usuario, u.telefono, r.nombre_rol AS rol
-                FROM usuarios u
-                JOIN roles r ON u.id_rol = r.id_rol
-                WHERE u.id_usuario = %s
-            """
-            cursor.execute(query_updated, (id_usuario,))
-            updated_user = cursor.fetchone()
-
-            return api_response(data=updated_user, message="Perfil de usuario actualizado exitosamente.", status_code=200)
-
-    except Exception as e:
-        return api_response(message="Error interno del servidor al actualizar usuario.", status_code=500, error=str(e))
+    if not all(campo is None or isinstance(campo, str) for campo in campos):
+        return api_response(message="Nombre, usuario y teléfono deben ser texto.", status_code=400)
+    nombre, usuario_name, telefono = map(limpiar_string, campos)
+    telefono = telefono or None
+    if usuario_name and not es_email_valido(usuario_name):
+        return api_response(message="El formato del nombre de usuario (email) no es válido.", status_code=400)
+
+    # Variante precompilada según los campos enviados (bit 1: nombre, 2: usuario, 4: telefono)
+    valores = (nombre or None, usuario_name or None, telefono)
+    mascara = sum(1 << i for i, valor in enumerate(valores) if valor is not None)
+    if not mascara:
+        return api_response(message="No hay campos para actualizar.", status_code=400)
+
+    with db_session(lotes=True) as (conn, cursor):
+        try:
+            cursor.execute(SQL_ACTUALIZAR_PERFIL[mascara],
+                           (*(valor for valor in valores if valor is not None), id_usuario, id_usuario))
+        except IntegrityError as e:
+            if e.args[0] == ERROR_DUPLICADO:
+                raise ErrorDominio("El nombre de usuario ya está registrado.", 400)
+            raise
+        cursor.nextset()
+        updated_user = cursor.fetchone()
+        if not updated_user:
+            raise ErrorDominio("Usuario no encontrado o no se realizaron cambios.", 404)
+
+        return api_response(data=updated_user, message="Perfil de usuario actualizado exitosamente.", status_code=200)
 
 # ruta eliminar usuario
 @usuarios_bp.route('/usuarios/<int:id_usuario>', methods=['DELETE'])
@@ -437,18 +504,13 @@ def elimina_usuario(id_usuario):
       500:
         description: Error interno del servidor
     """
-    try:
-        with db_session() as (conn, cursor):
-            delete_query = "DELETE FROM usuarios WHERE id_usuario = %s"
-            cursor.execute(delete_query, (id_usuario,))
-
-            if cursor.rowcount == 0:
-                return api_response(message="Usuario no encontrado.", status_code=404)
+    with db_session() as (conn, cursor):
+        cursor.execute(SQL_ELIMINAR_USUARIO, (id_usuario,))
 
-            return api_response(message="Usuario eliminado exitosamente.", status_code=200)
+        if cursor.rowcount == 0:
+            raise ErrorDominio("Usuario no encontrado.", 404)
 
-    except Exception as e:
-        return api_response(message="Error interno del servidor al eliminar usuario.", status_code=500, error=str(e))
+    return api_response(message="Usuario eliminado exitosamente.", status_code=200)
 
 # ruta para actualizar la contraseña el usuario 
 @usuarios_bp.route('/usuarios/<int:id_usuario>/contrasena', methods=['PUT'])
@@ -487,53 +549,61 @@ def actualiza_contrasena(id_usuario):
         description: Acceso denegado
       404:
         description: Usuario no encontrado
+      409:
+        description: La contraseña cambió mientras se procesaba la solicitud
       500:
         description: Error interno del servidor
     """
-    data = request.get_json()
-    current_password = data.get('contrasena_actual')
-    new_password = data.get('nueva_contrasena')
+    current_password, new_password = map(cuerpo_json().get, ('contrasena_actual', 'nueva_contrasena'))
 
     if not new_password:
         return api_response(message="Nueva contraseña es requerida.", status_code=400)
+    if not isinstance(new_password, str) or (current_password is not None and not isinstance(current_password, str)):
+        return api_response(message="Las contraseñas deben ser texto.", status_code=400)
 
     if len(new_password) < 8:
         return api_response(message="La nueva contraseña debe tener al menos 8 caracteres.", status_code=400)
+    if len(new_password) > LONGITUD_MAXIMA:
+        return api_response(message=f"La nueva contraseña no puede tener más de {LONGITUD_MAXIMA} caracteres.", status_code=400)
 
     current_user_id = get_jwt_identity()
     claims = get_jwt()
-    user_roles = claims.get("roles", [])
-
-    try:
-        with db_session() as (conn, cursor):
-            query = "SELECT contrasena FROM usuarios WHERE id_usuario = %s"
-            cursor.execute(query, (id_usuario,))
-            user = cursor.fetchone()
-
-            if not user:
-                return api_response(message="Usuario no encontrado.", status_code=404)
-
-            if "Admin" not in user_roles:
-                if current_user_id != id_usuario:
-                    return api_response(message="Acceso denegado: No tienes permiso para cambiar la contraseña de otro usuario.", status_code=403)
+    # La identidad del token es texto; el id de la ruta, entero
+    es_admin = "Administrador" in claims.get("roles", [])
 
-                # bcrypt para verificar la contraseña actual
-                if not current_password or not bcrypt.checkpw(current_password.encode('utf-8'), user['contrasena'].encode('utf-8')):
-                    return api_response(message="Contraseña actual incorrecta.", status_code=400)
-
-            # Hashear la nueva contraseña con bcrypt
-            hashed_new_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt(SALT_ROUNDS)).decode('utf-8')
-
-            update_query = "UPDATE usuarios SET contrasena = %s WHERE id_usuario = %s"
-            cursor.execute(update_query, (hashed_new_password, id_usuario))
+    if not es_admin and str(current_user_id) != str(id_usuario):
+        return api_response(message="Acceso denegado: No tienes permiso para cambiar la contraseña de otro usuario.", status_code=403)
 
+    if es_admin:
+        # El administrador no necesita la contraseña actual: un solo UPDATE,
+        # y rowcount indica si el usuario existe
+        hashed_new_password = hash_contrasena(new_password)
+        with db_session() as (conn, cursor):
+            cursor.execute(SQL_ACTUALIZAR_CONTRASENA, (hashed_new_password, id_usuario))
             if cursor.rowcount == 0:
-                return api_response(message="No se pudo actualizar la contraseña.", status_code=500)
-
-            return api_response(message="Contraseña actualizada exitosamente.", status_code=200)
-
-    except Exception as e:
-        return api_response(message="Error interno del servidor al actualizar contraseña.", status_code=500, error=str(e))
+                raise ErrorDominio("Usuario no encontrado.", 404)
+        return api_response(message="Contraseña actualizada exitosamente.", status_code=200)
+
+    # Lectura en la principal: una réplica atrasada haría fallar el UPDATE condicional
+    with db_session() as (conn, cursor):
+        cursor.execute(SQL_CONTRASENA_USUARIO, (id_usuario,))
+        user = cursor.fetchone()
+    if not user:
+        return api_response(message="Usuario no encontrado.", status_code=404)
+
+    # Verificar la contraseña actual y hashear la nueva sin retener una conexión
+    if not current_password or not verificar_contrasena(current_password, user['contrasena']):
+        return api_response(message="Contraseña actual incorrecta.", status_code=400)
+    hashed_new_password = hash_contrasena(new_password)
+
+    with db_session() as (conn, cursor):
+        # Solo se actualiza si el hash no cambió desde que se verificó (evita pisar
+        # un cambio concurrente sin mantener la fila bloqueada durante el hash)
+        cursor.execute(SQL_CAMBIAR_CONTRASENA, (hashed_new_password, id_usuario, user['contrasena']))
+        if cursor.rowcount == 0:
+            raise ErrorDominio("La contraseña cambió durante la solicitud; intenta de nuevo.", 409)
+
+    return api_response(message="Contraseña actualizada exitosamente.", status_code=200)
 
 # ruta para actualizar los roles de los usuarios 
 @usuarios_bp.route('/usuarios/<int:id_usuario>/rol', methods=['PUT'])
@@ -574,38 +644,26 @@ def actualiza_rol(id_usuario):
       500:
         description: Error interno del servidor
     """
-    data = request.get_json()
-    id_rol = data.get('id_rol')
+    id_rol = cuerpo_json().get('id_rol')
 
     if not id_rol:
         return api_response(message="ID del rol es requerido.", status_code=400)
 
-    try:
-        with db_session() as (conn, cursor):
-            cursor.execute("SELECT id_usuario FROM usuarios WHERE id_usuario = %s", (id_usuario,))
-            if not cursor.fetchone():
-                return api_response(message="Usuario no encontrado.", status_code=404)
-
-            cursor.execute("SELECT id_rol FROM roles WHERE id_rol = %s", (id_rol,))
-            if not cursor.fetchone():
-                return api_response(message="ID de rol no válido.", status_code=400)
-
-            update_query = "UPDATE usuarios SET id_rol = %s WHERE id_usuario = %s"
-            cursor.execute(update_query, (id_rol, id_usuario))
-
-            query_updated = """
-                SELECT u.id_usuario, u.nombre, u.usuario, u.telefono, r.nombre_rol AS rol
-                FROM usuarios u
-                JOIN roles r ON u.id_rol = r.id_rol
-                WHERE u.id_usuario = %s
-            """
-            cursor.execute(query_updated, (id_usuario,))
-            updated_user = cursor.fetchone()
-
-            return api_response(data=updated_user, message="Rol de usuario actualizado exitosamente.", status_code=200)
-
-    except Exception as e:
-        return api_response(message="Error interno del servidor al actualizar rol de usuario.", status_code=500, error=str(e))
+    with db_session(lotes=True) as (conn, cursor):
+        # UPDATE y perfil actualizado en un solo viaje. La FK usuarios.id_rol -> roles
+        # rechaza un rol inexistente; sin perfil, el usuario no existe
+        try:
+            cursor.execute(SQL_ACTUALIZAR_ROL, (id_rol, id_usuario, id_usuario))
+        except IntegrityError as e:
+            if e.args[0] == ERROR_FK_INEXISTENTE:
+                raise ErrorDominio("ID de rol no válido.", 400)
+            raise
+        cursor.nextset()
+        updated_user = cursor.fetchone()
+        if not updated_user:
+            raise ErrorDominio("Usuario no encontrado.", 404)
+
+    return api_response(data=updated_user, message="Rol de usuario actualizado exitosamente.", status_code=200)
 
 # ruta para obtener la lista de todos los roles de usuarios disponible 
 @usuarios_bp.route('/roles', methods=['GET'])
@@ -633,16 +691,16 @@ def lista_roles():
         description: No autorizado
       403:
         description: Acceso denegado (solo Admin)
+      304:
+        description: La lista de roles no cambió desde la versión indicada en If-None-Match
       500:
         description: Error interno del servidor
     """
-    try:
-        with db_session() as (conn, cursor):
-            query = "SELECT id_rol, nombre_rol FROM roles"
-            cursor.execute(query)
-            roles = cursor.fetchall()
-
-            return api_response(data=roles, message="Lista de roles obtenida.", status_code=200)
-
-    except Exception as e:
-        return api_response(message="Error interno del servidor al obtener roles.", status_code=500, error=str(e))
+    # Los roles casi nunca cambian: se sirven desde la caché de roles del proceso y el
+    # ETag (derivado del contenido) permite al cliente revalidar con un 304 sin cuerpo
+    roles = [{"id_rol": id_rol, "nombre_rol": nombre_rol} for id_rol, nombre_rol in sorted(_mapa_roles()[1].items())]
+    etag = valor_etag(*(f"{rol['id_rol']}:{rol['nombre_rol']}" for rol in roles))
+    if etag_coincide(etag):
+        return respuesta_no_modificada(etag, max_age=MAX_AGE_ROLES)
+
+    return con_etag(api_response(data=roles, message="Lista de roles obtenida.", status_code=200), etag, max_age=MAX_AGE_ROLES)
@@ -1,20 +1,113 @@
+import logging
+from datetime import date
 from flask import Blueprint, jsonify, request
-import pymysql.cursors
-from utils.db import conectar_db
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from utils.auth_decorators import Administrador_requerido
-from utils.helpers import api_response, db_session, limpiar_string
+from utils.cache import TTL_VENTAS_ADMIN, clave_ventas_admin, invalidar_ventas, obtener_o_construir_crudo, version_ventas
+from utils.helpers import api_response, api_response_cuerpo, db_session, limpiar_string, obtener_limite
+from utils.serializacion import a_json, desde_json
+
+logger = logging.getLogger(__name__)
 
 # Define el Blueprint para ventas
 ventas_bp = Blueprint('ventas_bp', __name__)
 
-# --- Rutas para la gestión de ventas ---
+# Venta con sus datos relacionados y sus detalles de productos en una sola consulta:
+# la subconsulta arma el arreglo JSON de detalles en el servidor (JSON_ARRAYAGG), así
+# un listado no necesita una segunda consulta. Los DECIMAL se convierten a texto para
+# conservar el mismo formato ("12.50") que el resto de la API. Los listados completan
+# el WHERE y el ORDER BY.
+SQL_VENTAS = """
+    SELECT v.id_venta, v.id_cliente, v.id_usuario, v.fecha, v.total,
+           ev.nombre_estado AS estado_venta,
+           de.direccion AS direccion_envio, dv.direccion AS direccion_facturacion,
+           v.id_direccion_envio, v.id_direccion_facturacion,
+           cl.nombre AS nombre_cliente, u.usuario AS email_cliente,
+           (SELECT JSON_ARRAYAGG(JSON_OBJECT(
+                       'id_detalle_venta', dtv.id_detalle_venta, 'id_producto', dtv.id_producto,
+                       'nombre_producto', p.nombre_producto, 'cantidad', dtv.cantidad,
+                       'precio_unitario', CAST(dtv.precio_unitario AS CHAR),
+                       'subtotal', CAST(dtv.subtotal AS CHAR)))
+            FROM detalles_venta dtv
+            JOIN productos p ON dtv.id_producto = p.id_producto
+            WHERE dtv.id_venta = v.id_venta) AS detalles_productos
+    FROM ventas v
+    JOIN estados_venta ev ON v.id_estado_venta = ev.id_estado_venta
+    LEFT JOIN direcciones de ON v.id_direccion_envio = de.id_direccion
+    LEFT JOIN direcciones dv ON v.id_direccion_facturacion = dv.id_direccion
+    JOIN clientes cl ON v.id_cliente = cl.id_cliente
+    JOIN usuarios u ON v.id_usuario = u.id_usuario
+"""
+SQL_VENTA_POR_ID = SQL_VENTAS + " WHERE v.id_venta = %s"
+
+# rowcount del UPDATE cuenta filas encontradas (FOUND_ROWS): 0 solo si la venta o el
+# estado no existen, aunque el estado sea el mismo que ya tenía
+SQL_ACTUALIZAR_ESTADO_VENTA = """
+    UPDATE ventas v
+    JOIN estados_venta ev ON ev.id_estado_venta = %s
+    SET v.id_estado_venta = ev.id_estado_venta
+    WHERE v.id_venta = %s;
+""" + SQL_VENTA_POR_ID
+
+# Registro de una venta desde un pedido: dos sentencias INSERT ... SELECT, sin leer
+# antes el pedido, sus detalles ni el id del estado 'Completado'
+SQL_INSERTAR_VENTA_DESDE_PEDIDO = """
+    INSERT INTO ventas (id_cliente, id_usuario, fecha, total, id_estado_venta,
+                        id_direccion_envio, id_direccion_facturacion)
+    SELECT p.id_cliente, cl.id_usuario, CURDATE(), p.total_pedido, ev.id_estado_venta, NULL, NULL
+    FROM pedidos p
+    JOIN clientes cl ON p.id_cliente = cl.id_cliente
+    JOIN estados_venta ev ON ev.nombre_estado = 'Completado'
+    WHERE p.id_pedido = %s
+"""
+SQL_INSERTAR_DETALLES_DESDE_PEDIDO = """
+    INSERT INTO detalles_venta (id_venta, id_producto, cantidad, precio_unitario, subtotal)
+    SELECT %s, id_producto, cantidad, precio_unitario, cantidad * precio_unitario
+    FROM detalle_pedidos
+    WHERE id_pedido = %s
+"""
+
+# --- Funciones auxiliares ---
+
+def _decodificar_detalles(ventas):
+    """
+    Convierte el arreglo JSON 'detalles_productos' de cada venta en una lista
+    (vacía si la venta no tiene detalles). Devuelve la misma lista de ventas.
+    """
+    for venta in ventas:
+        detalles = venta['detalles_productos']
+        venta['detalles_productos'] = desde_json(detalles) if detalles is not None else []
+    return ventas
 
-# Nota: La creación de una 'venta' se dispararía lógicamente
-# después de que un 'pedido' es pagado y completado.
-# Por lo tanto, no hay una ruta POST directa aquí para 'ventas'.
-# Las ventas se registran implícitamente a través del proceso de pedidos/pagos.
-# Aquí nos centramos en la consulta y gestión de ventas ya existentes.
+def _leer_parametros_paginacion():
+    """
+    Lee ?before=<fecha YYYY-MM-DD>&before_id=<id>&limit=<n> para la paginación por
+    cursor (keyset) del listado. Lanza ValueError si algún valor es inválido.
+    """
+    before = request.args.get('before')
+    before_id = request.args.get('before_id')
+    limite = obtener_limite(request.args.get('limit'))
+    try:
+        fecha = date.fromisoformat(before) if before else None
+        before_id = int(before_id) if before_id else None
+    except ValueError:
+        raise ValueError("Los parámetros 'before' (fecha YYYY-MM-DD) y 'before_id' (entero) no son válidos.")
+    return fecha, before_id, limite
+
+def _filtro_keyset(fecha, before_id):
+    """Condición SQL y parámetros para continuar después de la última venta recibida."""
+    if fecha is None:
+        return "1 = 1", ()
+    if before_id is None:
+        return "v.fecha < %s", (fecha,)
+    return "(v.fecha < %s OR (v.fecha = %s AND v.id_venta < %s))", (fecha, fecha, before_id)
+
+def _siguiente_cursor(ventas, limite):
+    """Cursor de la página siguiente, o None si esta fue la última."""
+    if len(ventas) < limite:
+        return None
+    ultima = ventas[-1]
+    return {'before': ultima['fecha'].isoformat(), 'before_id': ultima['id_venta']}
 
 @ventas_bp.route('/me', methods=['GET'])
 @jwt_required()
@@ -84,7 +177,7 @@ def obtener_mis_ventas():
     current_user_id = get_jwt_identity()
 
     try:
-        with db_session() as (conn, cursor):
+        with db_session(readonly=True) as (conn, cursor):
             # Obtener id_cliente del usuario actual
             cursor.execute("SELECT id_cliente FROM clientes WHERE id_usuario = %s", (current_user_id,))
             cliente_info = cursor.fetchone()
@@ -93,41 +186,14 @@ def obtener_mis_ventas():
             id_cliente = cliente_info['id_cliente']
 
             # Obtener las ventas del cliente autenticado
-            query_ventas = """
-                SELECT v.id_venta, v.id_cliente, v.id_usuario, v.fecha, v.total,
-                       ev.nombre_estado AS estado_venta,
-                       de.direccion AS direccion_envio, dv.direccion AS direccion_facturacion,
-                       v.id_direccion_envio, v.id_direccion_facturacion,
-                       cl.nombre AS nombre_cliente, u.usuario AS email_cliente
-                FROM ventas v
-                JOIN estados_venta ev ON v.id_estado_venta = ev.id_estado_venta
-                LEFT JOIN direcciones de ON v.id_direccion_envio = de.id_direccion
-                LEFT JOIN direcciones dv ON v.id_direccion_facturacion = dv.id_direccion
-                JOIN clientes cl ON v.id_cliente = cl.id_cliente
-                JOIN usuarios u ON v.id_usuario = u.id_usuario
-                WHERE v.id_cliente = %s
-                ORDER BY v.fecha DESC
-            """
-            cursor.execute(query_ventas, (id_cliente,))
-            ventas = cursor.fetchall()
-
-            for venta in ventas:
-                # Obtener detalles de productos para cada venta
-                query_detalles = """
-                    SELECT dtv.id_detalle_venta, dtv.id_producto, p.nombre_producto, dtv.cantidad,
-                           dtv.precio_unitario, dtv.subtotal
-                    FROM detalles_venta dtv
-                    JOIN productos p ON dtv.id_producto = p.id_producto
-                    WHERE dtv.id_venta = %s
-                """
-                cursor.execute(query_detalles, (venta['id_venta'],))
-                venta['detalles_productos'] = cursor.fetchall()
+            cursor.execute(SQL_VENTAS + " WHERE v.id_cliente = %s ORDER BY v.fecha DESC", (id_cliente,))
+            ventas = _decodificar_detalles(cursor.fetchall())
 
             return api_response(data=ventas, message="Historial de ventas obtenido exitosamente.", status_code=200)
 
-    except Exception as e:
-        print(f"DEBUG_VENTAS_GET_ME_ERROR: {e}")
-        return api_response(message="Error interno del servidor al obtener el historial de ventas.", status_code=500, error=str(e))
+    except Exception:
+        logger.exception("Error al obtener el historial de ventas del cliente")
+        return api_response(message="Error interno del servidor al obtener el historial de ventas.", status_code=500)
 
 @ventas_bp.route('/<int:id_venta>', methods=['GET'])
 @jwt_required()
@@ -163,23 +229,9 @@ def obtener_detalle_venta(id_venta):
     user_roles = claims.get("roles", [])
 
     try:
-        with db_session() as (conn, cursor):
+        with db_session(readonly=True) as (conn, cursor):
             # Obtener información de la venta y los usuarios asociados
-            query_venta = """
-                SELECT v.id_venta, v.id_cliente, v.id_usuario, v.fecha, v.total,
-                       ev.nombre_estado AS estado_venta,
-                       de.direccion AS direccion_envio, dv.direccion AS direccion_facturacion,
-                       v.id_direccion_envio, v.id_direccion_facturacion,
-                       cl.nombre AS nombre_cliente, u.usuario AS email_cliente
-                FROM ventas v
-                JOIN estados_venta ev ON v.id_estado_venta = ev.id_estado_venta
-                LEFT JOIN direcciones de ON v.id_direccion_envio = de.id_direccion
-                LEFT JOIN direcciones dv ON v.id_direccion_facturacion = dv.id_direccion
-                JOIN clientes cl ON v.id_cliente = cl.id_cliente
-                JOIN usuarios u ON v.id_usuario = u.id_usuario
-                WHERE v.id_venta = %s
-            """
-            cursor.execute(query_venta, (id_venta,))
+            cursor.execute(SQL_VENTA_POR_ID, (id_venta,))
             venta = cursor.fetchone()
 
             if not venta:
@@ -188,30 +240,22 @@ def obtener_detalle_venta(id_venta):
             # Verificar permisos: Admin o dueño de la venta
             if "Administrador" not in user_roles and str(venta['id_usuario']) != current_user_id:
                 return api_response(message="Acceso denegado: No tienes permiso para ver esta venta.", status_code=403)
-            
-            # Obtener detalles de productos para la venta
-            query_detalles = """
-                SELECT dtv.id_detalle_venta, dtv.id_producto, p.nombre_producto, dtv.cantidad,
-                       dtv.precio_unitario, dtv.subtotal
-                FROM detalles_venta dtv
-                JOIN productos p ON dtv.id_producto = p.id_producto
-                WHERE dtv.id_venta = %s
-            """
-            cursor.execute(query_detalles, (id_venta,))
-            venta['detalles_productos'] = cursor.fetchall()
+
+            _decodificar_detalles([venta])
             
             return api_response(data=venta, message="Detalles de la venta obtenidos exitosamente.", status_code=200)
 
-    except Exception as e:
-        print(f"DEBUG_VENTAS_GET_BY_ID_ERROR: {e}")
-        return api_response(message="Error interno del servidor al obtener el detalle de la venta.", status_code=500, error=str(e))
+    except Exception:
+        logger.exception("Error al obtener el detalle de la venta")
+        return api_response(message="Error interno del servidor al obtener el detalle de la venta.", status_code=500)
 
 @ventas_bp.route('/admin', methods=['GET'])
 @jwt_required()
 @Administrador_requerido()
 def obtener_todas_las_ventas_admin():
     """
-    Obtiene una lista de todas las ventas registradas en el sistema (Solo Administrador).
+    Obtiene una lista de todas las ventas registradas en el sistema (Solo Administrador),
+    de la más reciente a la más antigua y paginada por cursor.
     Permite filtrar por id_cliente, id_estado_venta y fecha.
     ---
     security:
@@ -235,6 +279,22 @@ def obtener_todas_las_ventas_admin():
         type: string
         format: date
         description: Filtrar ventas hasta una fecha (YYYY-MM-DD).
+      - in: query
+        name: before
+        type: string
+        format: date
+        required: false
+        description: Fecha de la última venta recibida (cursor de la página siguiente).
+      - in: query
+        name: before_id
+        type: integer
+        required: false
+        description: ID de la última venta recibida (desempata ventas con la misma fecha).
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: Cantidad máxima de ventas a devolver (por defecto 50, máximo 200).
     responses:
       200:
         description: Lista de todas las ventas obtenida exitosamente
@@ -242,6 +302,8 @@ def obtener_todas_las_ventas_admin():
           type: array
           items:
             $ref: '#/definitions/DetalleVentaCompleto'
+      400:
+        description: Parámetros de paginación inválidos
       401:
         description: No autorizado
       403:
@@ -250,64 +312,58 @@ def obtener_todas_las_ventas_admin():
         description: Error interno del servidor
     """
     try:
-        with db_session() as (conn, cursor):
-            base_query = """
-                SELECT v.id_venta, v.id_cliente, v.id_usuario, v.fecha, v.total,
-                       ev.nombre_estado AS estado_venta,
-                       de.direccion AS direccion_envio, dv.direccion AS direccion_facturacion,
-                       v.id_direccion_envio, v.id_direccion_facturacion,
-                       cl.nombre AS nombre_cliente, u.usuario AS email_cliente
-                FROM ventas v
-                JOIN estados_venta ev ON v.id_estado_venta = ev.id_estado_venta
-                LEFT JOIN direcciones de ON v.id_direccion_envio = de.id_direccion
-                LEFT JOIN direcciones dv ON v.id_direccion_facturacion = dv.id_direccion
-                JOIN clientes cl ON v.id_cliente = cl.id_cliente
-                JOIN usuarios u ON v.id_usuario = u.id_usuario
-                WHERE 1=1
-            """
-            params = []
-            
-            id_cliente_filter = request.args.get('id_cliente')
-            if id_cliente_filter:
-                base_query += " AND v.id_cliente = %s"
-                params.append(id_cliente_filter)
-            
-            id_estado_filter = request.args.get('id_estado_venta')
-            if id_estado_filter:
-                base_query += " AND v.id_estado_venta = %s"
-                params.append(id_estado_filter)
-            
-            fecha_inicio_filter = request.args.get('fecha_inicio')
-            if fecha_inicio_filter:
-                base_query += " AND v.fecha >= %s"
-                params.append(fecha_inicio_filter)
-            
-            fecha_fin_filter = request.args.get('fecha_fin')
-            if fecha_fin_filter:
-                base_query += " AND v.fecha <= %s"
-                params.append(fecha_fin_filter)
-
-            base_query += " ORDER BY v.fecha DESC"
+        fecha, before_id, limite = _leer_parametros_paginacion()
+    except ValueError as e:
+        return api_response(message=str(e), status_code=400)
+    filtros = tuple(request.args.get(nombre) or None for nombre in ('id_cliente', 'id_estado_venta', 'fecha_inicio', 'fecha_fin'))
+    mensaje = "Lista de todas las ventas obtenida exitosamente."
+
+    def construir():
+        id_cliente_filter, id_estado_filter, fecha_inicio_filter, fecha_fin_filter = filtros
+        filtro_keyset, params = _filtro_keyset(fecha, before_id)
+        base_query = SQL_VENTAS + " WHERE " + filtro_keyset
+        params = list(params)
+
+        if id_cliente_filter:
+            base_query += " AND v.id_cliente = %s"
+            params.append(id_cliente_filter)
+
+        if id_estado_filter:
+            base_query += " AND v.id_estado_venta = %s"
+            params.append(id_estado_filter)
+
+        if fecha_inicio_filter:
+            base_query += " AND v.fecha >= %s"
+            params.append(fecha_inicio_filter)
+
+        if fecha_fin_filter:
+            base_query += " AND v.fecha <= %s"
+            params.append(fecha_fin_filter)
+
+        base_query += " ORDER BY v.fecha DESC, v.id_venta DESC LIMIT %s"
+        params.append(limite)
+        with db_session(readonly=True) as (conn, cursor):
             cursor.execute(base_query, tuple(params))
-            ventas = cursor.fetchall()
-
-            for venta in ventas:
-                # Obtener detalles de productos para cada venta
-                query_detalles = """
-                    SELECT dtv.id_detalle_venta, dtv.id_producto, p.nombre_producto, dtv.cantidad,
-                           dtv.precio_unitario, dtv.subtotal
-                    FROM detalles_venta dtv
-                    JOIN productos p ON dtv.id_producto = p.id_producto
-                    WHERE dtv.id_venta = %s
-                """
-                cursor.execute(query_detalles, (venta['id_venta'],))
-                venta['detalles_productos'] = cursor.fetchall()
-
-            return api_response(data=ventas, message="Lista de todas las ventas obtenida exitosamente.", status_code=200)
-
-    except Exception as e:
-        print(f"DEBUG_VENTAS_GET_ALL_ADMIN_ERROR: {e}")
-        return api_response(message="Error interno del servidor al obtener todas las ventas.", status_code=500, error=str(e))
+            ventas = _decodificar_detalles(cursor.fetchall())
+
+        # Se guarda el cuerpo completo: la página y su cursor van juntos
+        paginacion = {'next_cursor': _siguiente_cursor(ventas, limite)}
+        return a_json({"mensaje": mensaje, "data": ventas, "paginacion": paginacion})
+
+    try:
+        # Respuesta en caché por combinación de filtros y página; sin versión conocida
+        # (Redis no responde) se consulta directamente
+        version = version_ventas()
+        if version is None:
+            cuerpo = construir()
+        else:
+            clave = clave_ventas_admin(version, (*filtros, request.args.get('before'), before_id, limite))
+            cuerpo = obtener_o_construir_crudo(clave, TTL_VENTAS_ADMIN, construir)
+        return api_response_cuerpo(cuerpo, status_code=200)
+
+    except Exception:
+        logger.exception("Error al obtener todas las ventas")
+        return api_response(message="Error interno del servidor al obtener todas las ventas.", status_code=500)
 
 @ventas_bp.route('/<int:id_venta>/estado', methods=['PUT'])
 @jwt_required()
@@ -357,56 +413,28 @@ def actualizar_estado_venta_admin(id_venta):
         return api_response(message="ID de estado de venta inválido y requerido.", status_code=400)
     
     try:
-        with db_session() as (conn, cursor):
-            # 1. Verificar si la venta existe
-            cursor.execute("SELECT id_venta FROM ventas WHERE id_venta = %s", (id_venta,))
-            if not cursor.fetchone():
-                return api_response(message="Venta no encontrada.", status_code=404)
-            
-            # 2. Verificar si el nuevo estado de venta existe
-            cursor.execute("SELECT id_estado_venta FROM estados_venta WHERE id_estado_venta = %s", (new_id_estado_venta,))
-            if not cursor.fetchone():
-                return api_response(message="El ID de estado de venta proporcionado no existe.", status_code=400)
-
-            update_query = "UPDATE ventas SET id_estado_venta = %s WHERE id_venta = %s"
-            cursor.execute(update_query, (new_id_estado_venta, id_venta))
-            conn.commit()
-
-            # Obtener la venta actualizada para devolverla
-            query_updated = """
-                SELECT v.id_venta, v.id_cliente, v.id_usuario, v.fecha, v.total,
-                       ev.nombre_estado AS estado_venta,
-                       de.direccion AS direccion_envio, dv.direccion AS direccion_facturacion,
-                       v.id_direccion_envio, v.id_direccion_facturacion,
-                       cl.nombre AS nombre_cliente, u.usuario AS email_cliente
-                FROM ventas v
-                JOIN estados_venta ev ON v.id_estado_venta = ev.id_estado_venta
-                LEFT JOIN direcciones de ON v.id_direccion_envio = de.id_direccion
-                LEFT JOIN direcciones dv ON v.id_direccion_facturacion = dv.id_direccion
-                JOIN clientes cl ON v.id_cliente = cl.id_cliente
-                JOIN usuarios u ON v.id_usuario = u.id_usuario
-                WHERE v.id_venta = %s
-            """
-            cursor.execute(query_updated, (id_venta,))
+        # Una sola sentencia de escritura: en autocommit no hace falta el COMMIT aparte
+        with db_session(autocommit=True, lotes=True) as (conn, cursor):
+            # UPDATE y venta actualizada en un solo viaje. El JOIN con estados_venta
+            # hace que un estado inexistente no actualice nada
+            cursor.execute(SQL_ACTUALIZAR_ESTADO_VENTA, (new_id_estado_venta, id_venta, id_venta))
+            actualizada = cursor.rowcount > 0
+            cursor.nextset()
             updated_venta = cursor.fetchone()
 
-            # Obtener detalles de productos para la respuesta completa
-            query_detalles = """
-                SELECT dtv.id_detalle_venta, dtv.id_producto, p.nombre_producto, dtv.cantidad,
-                       dtv.precio_unitario, dtv.subtotal
-                FROM detalles_venta dtv
-                JOIN productos p ON dtv.id_producto = p.id_producto
-                WHERE dtv.id_venta = %s
-            """
-            cursor.execute(query_detalles, (id_venta,))
-            updated_venta['detalles_productos'] = cursor.fetchall()
+        # Sin venta: no existe. Con venta pero sin filas actualizadas: el estado no existe
+        if not updated_venta:
+            return api_response(message="Venta no encontrada.", status_code=404)
+        if not actualizada:
+            return api_response(message="El ID de estado de venta proporcionado no existe.", status_code=400)
 
-            return api_response(data=updated_venta, message="Estado de la venta actualizado exitosamente.", status_code=200)
+        invalidar_ventas()
+        _decodificar_detalles([updated_venta])
+        return api_response(data=updated_venta, message="Estado de la venta actualizado exitosamente.", status_code=200)
 
-    except Exception as e:
-        print(f"DEBUG_VENTAS_UPDATE_ADMIN_ERROR: {e}")
-        conn.rollback()
-        return api_response(message="Error interno del servidor al actualizar el estado de la venta.", status_code=500, error=str(e))
+    except Exception:
+        logger.exception("Error al actualizar el estado de la venta")
+        return api_response(message="Error interno del servidor al actualizar el estado de la venta.", status_code=500)
 
 
 # --- Función para registrar una venta desde un pedido completado ---
@@ -423,83 +451,31 @@ def registrar_venta_desde_pedido(id_pedido_origen, conn, cursor):
     Registra una venta en las tablas 'ventas' y 'detalles_venta'
     a partir de un pedido completado.
     Esta función debe ser llamada DENTRO de una sesión de base de datos existente.
+    Si devuelve True, quien llama debe ejecutar invalidar_ventas() después de
+    confirmar la transacción (al salir de db_session), como en las demás escrituras.
     """
     try:
-        # Obtener detalles del pedido que se va a convertir en venta
-        cursor.execute(
-            """
-            SELECT p.id_cliente, p.id_usuario, p.fecha_pedido, p.total_pedido,
-                   p.direccion_envio, p.ciudad_envio, p.telefono_contacto,
-                   cl.id_cliente, cl.id_usuario AS id_usuario_cliente
-            FROM pedidos p
-            JOIN clientes cl ON p.id_cliente = cl.id_cliente
-            WHERE p.id_pedido = %s
-            """,
-            (id_pedido_origen,)
-        )
-        pedido_origen = cursor.fetchone()
-
-        if not pedido_origen:
-            print(f"DEBUG_VENTA_REGISTRO_ERROR: Pedido ID {id_pedido_origen} no encontrado para registrar venta.")
+        # 1. Cabecera de la venta armada en el servidor a partir del pedido: el cliente,
+        # su usuario y el id del estado 'Completado' se resuelven en el mismo INSERT.
+        # Las direcciones quedan en NULL: el pedido guarda 'direccion_envio' y
+        # 'ciudad_envio' como texto plano, no como ids de la tabla 'direcciones'.
+        cursor.execute(SQL_INSERTAR_VENTA_DESDE_PEDIDO, (id_pedido_origen,))
+        if cursor.rowcount == 0:
+            logger.warning("Pedido ID %s no encontrado o estado 'Completado' inexistente en estados_venta: no se registró la venta.", id_pedido_origen)
             return False
-
-        # Obtener el ID del estado 'Completado'
-        cursor.execute("SELECT id_estado_venta FROM estados_venta WHERE nombre_estado = 'Completado'")
-        estado_completado_info = cursor.fetchone()
-        if not estado_completado_info:
-            print("DEBUG_VENTA_REGISTRO_ERROR: Estado 'Completado' no encontrado en la tabla estados_venta.")
-            return False
-        id_estado_completado = estado_completado_info['id_estado_venta']
-
-        # Opcional: Obtener IDs de dirección de la tabla 'direcciones' si las manejas separadamente
-        # Por ahora, asumimos que 'direccion_envio' y 'ciudad_envio' son texto plano del pedido.
-        # Si usas la tabla 'direcciones', deberías buscar o insertar aquí para obtener los IDs.
-        id_direccion_envio_venta = None # Lógica para obtener de la tabla 'direcciones'
-        id_direccion_facturacion_venta = None # Lógica para obtener de la tabla 'direcciones'
-
-        # Insertar en la tabla 'ventas'
-        insert_venta_query = """
-            INSERT INTO ventas (id_cliente, id_usuario, fecha, total, id_estado_venta,
-                                id_direccion_envio, id_direccion_facturacion)
-            VALUES (%s, %s, CURDATE(), %s, %s, %s, %s)
-        """
-        cursor.execute(insert_venta_query, (
-            pedido_origen['id_cliente'],
-            pedido_origen['id_usuario_cliente'], # El id_usuario asociado al cliente
-            pedido_origen['total_pedido'],
-            id_estado_completado,
-            id_direccion_envio_venta, # Usar el ID real de la tabla 'direcciones' si lo implementas
-            id_direccion_facturacion_venta # Usar el ID real de la tabla 'direcciones' si lo implementas
-        ))
         id_venta_generada = cursor.lastrowid
 
-        # Obtener detalles del pedido original
-        cursor.execute("SELECT id_producto, cantidad, precio_unitario FROM detalle_pedidos WHERE id_pedido = %s", (id_pedido_origen,))
-        detalles_pedido = cursor.fetchall()
-
-        # Insertar en la tabla 'detalles_venta'
-        for detalle in detalles_pedido:
-            subtotal_item = detalle['cantidad'] * detalle['precio_unitario']
-            insert_detalle_venta_query = """
-                INSERT INTO detalles_venta (id_venta, id_producto, cantidad, precio_unitario, subtotal)
-                VALUES (%s, %s, %s, %s, %s)
-            """
-            cursor.execute(insert_detalle_venta_query, (
-                id_venta_generada,
-                detalle['id_producto'],
-                detalle['cantidad'],
-                detalle['precio_unitario'],
-                subtotal_item
-            ))
-        
+        # 2. Detalles copiados de detalle_pedidos en una sola sentencia
+        cursor.execute(SQL_INSERTAR_DETALLES_DESDE_PEDIDO, (id_venta_generada, id_pedido_origen))
+
         # Opcional: Marcar el pedido como 'Convertido a Venta' o similar en la tabla 'pedidos'
         # Esto es para evitar procesar el mismo pedido dos veces como venta.
         # cursor.execute("UPDATE pedidos SET estado_pedido = 'Venta Registrada' WHERE id_pedido = %s", (id_pedido_origen,))
 
-        print(f"DEBUG_VENTA_REGISTRO_EXITOSO: Venta ID {id_venta_generada} registrada desde Pedido ID {id_pedido_origen}.")
+        logger.debug("Venta ID %s registrada desde Pedido ID %s.", id_venta_generada, id_pedido_origen)
         return True
 
-    except Exception as e:
-        print(f"DEBUG_VENTA_REGISTRO_ERROR: Error al registrar venta desde pedido {id_pedido_origen}: {e}")
+    except Exception:
+        logger.exception("Error al registrar venta desde pedido %s", id_pedido_origen)
         # El rollback debe ser manejado por la sesión que llama a esta función
         return False
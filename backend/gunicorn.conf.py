@@ -0,0 +1,30 @@
+# Configuración de gunicorn para producción: gunicorn app:app (lee este archivo solo).
+# Los workers gevent atienden muchas peticiones a la vez por proceso: mientras una
+# espera a MySQL o a Redis, el mismo worker sigue con las demás.
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", "4"))
+worker_class = "gevent"
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+# Cada worker importa la aplicación y crea su propio pool de conexiones; con
+# preload las conexiones abiertas en el proceso maestro quedarían compartidas.
+preload_app = False
+
+# mysqlclient es una extensión en C y bloquearía el worker entero en cada consulta;
+# con gevent se usa PyMySQL, cuyos sockets quedan cooperativos tras el monkey patching.
+os.environ.setdefault("DB_DRIVER", "pymysql")
+
+def post_worker_init(worker):
+    """
+    Abre las conexiones mínimas del pool en cada worker antes de su primera
+    petición. Se hace aquí y no en post_fork porque el worker gevent aplica el
+    monkey patching después de post_fork: los sockets abiertos antes no cederían
+    el control. Importar la aplicación (tests, CLI) ya no toca la base de datos.
+    """
+    from utils.db import obtener_pool
+    try:
+        obtener_pool()
+    except Exception as e:
+        worker.log.warning("No se pudo precalentar el pool de conexiones (se reintentará en la primera petición): %s", e)
@@ -0,0 +1,119 @@
+import unittest
+from unittest import mock
+
+from utils.db import DBError, PoolConexiones
+from utils.helpers import ErrorDominio, db_session
+
+
+class PoolConexionesTest(unittest.TestCase):
+
+    def crear_pool(self, **opciones):
+        self.abiertas = []
+
+        def conectar():
+            conn = mock.Mock()
+            self.abiertas.append(conn)
+            return conn
+
+        return PoolConexiones(min_conexiones=0, conectar=conectar, **opciones)
+
+    def test_conexion_liberada_se_reutiliza(self):
+        pool = self.crear_pool(max_conexiones=2)
+        conn = pool.obtener()
+        pool.liberar(conn)
+        self.assertIs(pool.obtener(), conn)
+        self.assertEqual(len(self.abiertas), 1)
+
+    def test_limite_alcanzado_espera_y_falla(self):
+        pool = self.crear_pool(max_conexiones=1, espera_maxima=0.01)
+        pool.obtener()
+        with self.assertRaises(DBError):
+            pool.obtener()
+
+    def test_descartar_libera_el_cupo(self):
+        pool = self.crear_pool(max_conexiones=1, espera_maxima=0.01)
+        conn = pool.obtener()
+        pool.descartar(conn)
+        conn.close.assert_called_once()
+        self.assertIsNot(pool.obtener(), conn)
+
+    def test_fallo_al_conectar_devuelve_el_cupo(self):
+        pool = PoolConexiones(min_conexiones=0, max_conexiones=1, espera_maxima=0.01,
+                              conectar=mock.Mock(side_effect=[DBError("sin servidor"), mock.Mock()]))
+        with self.assertRaises(DBError):
+            pool.obtener()
+        # El cupo del intento fallido quedó libre para el siguiente
+        pool.obtener()
+
+
+class DbSessionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = mock.Mock()
+        self.conn = mock.Mock()
+        self.conn.get_autocommit.return_value = False
+        parche = mock.patch('utils.helpers._obtener_conexion', return_value=(self.pool, self.conn))
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_escritura_confirma_y_devuelve_la_conexion(self):
+        with db_session() as (conn, cursor):
+            cursor.execute("UPDATE t SET x = 1")
+        self.conn.commit.assert_called_once()
+        self.conn.rollback.assert_not_called()
+        self.pool.liberar.assert_called_once_with(self.conn)
+
+    def test_excepcion_revierte_y_devuelve_la_conexion(self):
+        with self.assertLogs('utils.helpers', level='ERROR'), self.assertRaises(ValueError):
+            with db_session():
+                raise ValueError("falla")
+        self.conn.commit.assert_not_called()
+        self.conn.rollback.assert_called_once()
+        self.pool.liberar.assert_called_once_with(self.conn)
+        self.pool.descartar.assert_not_called()
+
+    def test_rollback_fallido_descarta_la_conexion(self):
+        self.conn.rollback.side_effect = DBError("conexión perdida")
+        with self.assertLogs('utils.helpers', level='ERROR'), self.assertRaises(ValueError):
+            with db_session():
+                raise ValueError("falla")
+        self.pool.descartar.assert_called_once_with(self.conn)
+        self.pool.liberar.assert_not_called()
+
+    def test_error_dominio_revierte_sin_registrar_error(self):
+        with self.assertNoLogs('utils.helpers', level='ERROR'), self.assertRaises(ErrorDominio):
+            with db_session():
+                raise ErrorDominio("No encontrado.", 404)
+        self.conn.rollback.assert_called_once()
+        self.pool.liberar.assert_called_once_with(self.conn)
+
+    def test_lectura_no_envia_commit(self):
+        with db_session(readonly=True):
+            pass
+        self.conn.commit.assert_not_called()
+        # En la principal (sin autocommit) se cierra la transacción implícita
+        self.conn.rollback.assert_called_once()
+
+    def test_lectura_en_autocommit_no_envia_nada(self):
+        self.conn.get_autocommit.return_value = True
+        with db_session(readonly=True):
+            pass
+        self.conn.commit.assert_not_called()
+        self.conn.rollback.assert_not_called()
+
+    def test_generador_cerrado_revierte_antes_de_devolver_la_conexion(self):
+        def filas():
+            with db_session(readonly=True, server_side=True):
+                yield 1
+                yield 2
+
+        generador = filas()
+        next(generador)
+        # El cliente se desconecta a mitad de la respuesta
+        generador.close()
+        self.conn.rollback.assert_called_once()
+        self.pool.liberar.assert_called_once_with(self.conn)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+from unittest import mock
+
+from flask_jwt_extended import create_access_token
+
+from app import app
+
+PRODUCTO = {'id_producto': 5, 'nombre_producto': 'Huevos', 'precio': '10.00'}
+
+
+class ObtenerProductoPorIdTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cliente = app.test_client()
+        with app.app_context():
+            token = create_access_token(identity='1', additional_claims={'roles': ['Cliente']})
+        self.cabeceras = {'Authorization': f'Bearer {token}'}
+        # Ninguno de estos casos debe llegar a la base de datos
+        parche = mock.patch('blueprints.productos.db_session', side_effect=AssertionError("consulta inesperada"))
+        parche.start()
+        self.addCleanup(parche.stop)
+        # Versiones comunes a los workers, como con Redis
+        parche = mock.patch('blueprints.productos.versiones_compartidas', return_value=True)
+        self.versiones_compartidas = parche.start()
+        self.addCleanup(parche.stop)
+
+    def obtener(self, **cabeceras):
+        return self.cliente.get('/productos/5', headers={**self.cabeceras, **cabeceras})
+
+    @mock.patch('blueprints.productos.obtener', return_value=PRODUCTO)
+    @mock.patch('blueprints.productos.version_cache_productos', return_value=7)
+    def test_respuesta_completa_lleva_etag_de_la_version_de_su_clave(self, _version, obtener):
+        respuesta = self.obtener()
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.headers['ETag'], 'W/"7-5"')
+        self.assertIn('must-revalidate', respuesta.headers['Cache-Control'])
+        obtener.assert_called_once_with('productos:7:5')
+
+    @mock.patch('blueprints.productos.obtener')
+    @mock.patch('blueprints.productos.version_cache_productos', return_value=7)
+    def test_etag_vigente_responde_304_sin_leer_la_cache(self, _version, obtener):
+        respuesta = self.obtener(**{'If-None-Match': 'W/"7-5"'})
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta.data, b'')
+        self.assertEqual(respuesta.headers['ETag'], 'W/"7-5"')
+        obtener.assert_not_called()
+
+    @mock.patch('blueprints.productos.obtener', return_value=PRODUCTO)
+    @mock.patch('blueprints.productos.version_cache_productos', return_value=8)
+    def test_etag_anterior_devuelve_el_producto(self, _version, _obtener):
+        respuesta = self.obtener(**{'If-None-Match': 'W/"7-5"'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.headers['ETag'], 'W/"8-5"')
+
+    @mock.patch('blueprints.productos.obtener', return_value=PRODUCTO)
+    def test_sin_redis_no_hay_etag_ni_304(self, _obtener):
+        self.versiones_compartidas.return_value = False
+        respuesta = self.obtener(**{'If-None-Match': '*'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotIn('ETag', respuesta.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+
+from flask_jwt_extended import create_access_token
+
+from app import app
+
+
+class ActualizaPerfilTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cliente = app.test_client()
+        with app.app_context():
+            token = create_access_token(identity='3', additional_claims={'roles': ['Cliente']})
+        self.cabeceras = {'Authorization': f'Bearer {token}'}
+        self.cursor = mock.Mock()
+
+        @contextmanager
+        def sesion_falsa(**opciones):
+            yield mock.Mock(), self.cursor
+
+        parche = mock.patch('blueprints.usuarios.db_session', side_effect=sesion_falsa)
+        self.db_session = parche.start()
+        self.addCleanup(parche.stop)
+
+    def actualizar(self, cuerpo, id_usuario=3):
+        return self.cliente.put(f'/auth/usuarios/{id_usuario}', json=cuerpo, headers=self.cabeceras)
+
+    def assert_rechazado(self, cuerpo, status_code=400):
+        respuesta = self.actualizar(cuerpo)
+        self.assertEqual(respuesta.status_code, status_code)
+        self.db_session.assert_not_called()
+        return respuesta
+
+    def test_campos_que_no_son_texto(self):
+        self.assert_rechazado({'nombre': ['Ana']})
+        self.assert_rechazado({'usuario': 42})
+        self.assert_rechazado({'telefono': {'numero': '123'}})
+
+    def test_usuario_con_email_invalido(self):
+        respuesta = self.assert_rechazado({'usuario': 'no-es-un-email'})
+        self.assertIn('email', respuesta.get_json()['mensaje'])
+
+    def test_sin_campos(self):
+        self.assert_rechazado({'nombre': '   '})
+
+    def test_perfil_ajeno(self):
+        respuesta = self.actualizar({'nombre': 'Ana'}, id_usuario=4)
+        self.assertEqual(respuesta.status_code, 403)
+        self.db_session.assert_not_called()
+
+    def test_actualizacion_valida(self):
+        perfil = {'id_usuario': 3, 'nombre': 'Ana Pérez', 'usuario': 'ana@example.com', 'telefono': None}
+        self.cursor.fetchone.return_value = perfil
+        respuesta = self.actualizar({'nombre': '  Ana   Pérez ', 'usuario': 'ana@example.com'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.get_json()['data'], perfil)
+        # Nombre normalizado y usuario, en el orden de la máscara, seguidos de los ids
+        _, parametros = self.cursor.execute.call_args.args
+        self.assertEqual(parametros, ('Ana Pérez', 'ana@example.com', 3, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
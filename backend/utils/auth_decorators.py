@@ -1,17 +1,52 @@
+import copy
+import hashlib
+import time
 from functools import wraps
 from flask import jsonify, request
-from flask_jwt_extended import verify_jwt_in_request, get_jwt, get_jwt_identity
+from flask_jwt_extended import JWTManager, verify_jwt_in_request, get_jwt
 
-from utils.db import conectar_db
-import pymysql.cursors
+from utils.cache import CacheTTL
+from utils.helpers import db_session
 
+# Tokens ya verificados: sha256(token)[:16] -> claims. Un token válido no deja de
+# serlo salvo por su expiración, que se vuelve a comprobar en cada acierto.
+TTL_JWT_VERIFICADO = 30
+_jwt_verificados = CacheTTL(maxsize=10000, ttl=TTL_JWT_VERIFICADO)
+
+class JWTManagerConCache(JWTManager):
+    """
+    JWTManager que recuerda por unos segundos los tokens cuya firma ya verificó,
+    para que las peticiones repetidas con el mismo token no vuelvan a decodificarlo.
+    Solo se cachea la verificación normal (sin CSRF ni tokens expirados permitidos).
+    """
+
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        if csrf_value is not None or allow_expired:
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+
+        clave = hashlib.sha256(encoded_token.encode('utf-8')).digest()[:16]
+        claims = _jwt_verificados.obtener(clave)
+        if claims is not None and claims.get('exp', float('inf')) > time.time():
+            # Copia: los decoradores de roles pueden modificar las claims de la petición
+            return copy.deepcopy(claims)
+
+        # Sin entrada o ya expirado: la verificación completa lanza el error que corresponda
+        claims = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+        _jwt_verificados.guardar(clave, copy.deepcopy(claims))
+        return claims
+
+# Los decoradores de roles confían en el claim 'roles' del token, que se fija al
+# iniciar sesión: un cambio de rol se aplica cuando el usuario obtiene un token
+# nuevo (login o POST /auth/refresh-claims). get_user_role_from_db solo lo usa ese
+# endpoint, que necesita el rol actual: se lee siempre de la base, sin caché.
 def get_user_role_from_db(user_id):
-    conn = None
-    cursor = None
-    rol_name = None
-    try:
-        conn = conectar_db()
-        cursor = conn.cursor(pymysql.cursors.DictCursor)
+    """
+    Nombre del rol actual del usuario, o None si el usuario no existe. Un error de
+    la base se propaga (500): no debe confundirse con un usuario inexistente.
+    """
+    # Conexión tomada del pool, como en el resto de la aplicación. Se lee una sola
+    # columna: cursor de tuplas, sin armar un diccionario por fila
+    with db_session(tuplas=True) as (conn, cursor):
         query = """
             SELECT r.nombre_rol
             FROM usuarios u
@@ -20,31 +55,27 @@ def get_user_role_from_db(user_id):
         """
         cursor.execute(query, (user_id,))
         result = cursor.fetchone()
-        if result:
-            rol_name = result['nombre_rol']
-    except Exception as e:
-        print(f"Error al obtener el rol del usuario {user_id} desde la DB: {e}")
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
-    return rol_name
+    return result[0] if result else None
+
+def _verificar_jwt():
+    """
+    Verifica el token solo si todavía no se hizo en esta petición: las rutas
+    protegidas suelen llevar @jwt_required() encima de estos decoradores y así
+    el JWT no se decodifica y valida dos veces.
+    """
+    try:
+        return get_jwt()
+    except RuntimeError:
+        verify_jwt_in_request()
+        return get_jwt()
 
 def Administrador_requerido():
     def wrapper(fn):
         @wraps(fn)
         def decorator(*args, **kwargs):
-            verify_jwt_in_request()
-            current_user_id = get_jwt_identity()
-            claims = get_jwt()
-            user_roles_from_jwt = claims.get("roles", [])
+            # El claim 'roles' del token es la fuente de verdad: no se consulta la base
+            user_roles_from_jwt = _verificar_jwt().get("roles", [])
 
-            if "Administrador" not in user_roles_from_jwt:
-                user_role_from_db = get_user_role_from_db(current_user_id)
-                if user_role_from_db == "Administrador":
-                    user_roles_from_jwt.append("Administrador")
-            
             if "Administrador" not in user_roles_from_jwt:
                 return jsonify({"mensaje": "Acceso denegado: Se requiere rol de Administrador."}), 403
 
@@ -56,15 +87,7 @@ def Administrador_o_Empleado_requerido():
     def wrapper(fn):
         @wraps(fn)
         def decorator(*args, **kwargs):
-            verify_jwt_in_request()
-            current_user_id = get_jwt_identity()
-            claims = get_jwt()
-            user_roles_from_jwt = claims.get("roles", [])
-
-            if not ("Administrador" in user_roles_from_jwt or "Empleado" in user_roles_from_jwt):
-                user_role_from_db = get_user_role_from_db(current_user_id)
-                if user_role_from_db in ["Administrador", "Empleado"]:
-                    user_roles_from_jwt.append(user_role_from_db)
+            user_roles_from_jwt = _verificar_jwt().get("roles", [])
 
             if not ("Administrador" in user_roles_from_jwt or "Empleado" in user_roles_from_jwt):
                 return jsonify({"mensaje": "Acceso denegado: Se requiere rol de Administrador o Empleado."}), 403
@@ -77,7 +100,7 @@ def jwt_auth_required():
     def wrapper(fn):
         @wraps(fn)
         def decorator(*args, **kwargs):
-            verify_jwt_in_request()
+            _verificar_jwt()
             return fn(*args, **kwargs)
         return decorator
     return wrapper
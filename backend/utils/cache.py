@@ -0,0 +1,334 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+from utils.serializacion import a_json, desde_json
+
+logger = logging.getLogger(__name__)
+
+# Tiempo de vida (segundos) de la información de productos en caché
+TTL_PRODUCTO = 60
+# Tiempo de vida (segundos) de las respuestas del catálogo de productos
+TTL_CATALOGO = 300
+# Tiempo de vida (segundos) de los listados de reseñas
+TTL_RESENAS = 300
+# Tiempo de vida (segundos) de la relación id_usuario -> id_cliente, que casi nunca cambia
+TTL_ID_CLIENTE = 3600
+# Tiempo de vida (segundos) de las respuestas del listado de ventas del administrador
+TTL_VENTAS_ADMIN = 60
+
+_cliente = None
+_cliente_lock = threading.Lock()
+_inicializado = False
+
+def obtener_cliente_redis():
+    """
+    Devuelve el cliente de Redis configurado en REDIS_URL, o None si la caché
+    está deshabilitada (variable no definida o paquete redis no instalado).
+    """
+    global _cliente, _inicializado
+    if not _inicializado:
+        with _cliente_lock:
+            if not _inicializado:
+                url = os.getenv("REDIS_URL")
+                if url and redis is not None:
+                    _cliente = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+                _inicializado = True
+    return _cliente
+
+# Caché local del proceso, usada cuando Redis no está configurado. Cada
+# entrada guarda (expira_en, valor serializado); la invalidación solo alcanza
+# a este proceso, así que el TTL acota cuánto puede durar un dato desactualizado.
+_local = {}
+_local_lock = threading.Lock()
+_MAX_ENTRADAS_LOCAL = 10000
+
+def _leer_local(claves):
+    ahora = time.monotonic()
+    valores = []
+    with _local_lock:
+        for clave in claves:
+            entrada = _local.get(clave)
+            valores.append(entrada[1] if entrada and entrada[0] > ahora else None)
+    return valores
+
+def _guardar_local(valores, ttl):
+    expira_en = time.monotonic() + ttl
+    with _local_lock:
+        if len(_local) + len(valores) > _MAX_ENTRADAS_LOCAL:
+            _local.clear()
+        for clave, valor in valores.items():
+            _local[clave] = (expira_en, valor)
+
+class CacheTTL:
+    """
+    Diccionario en memoria del proceso con expiración por entrada y tamaño
+    máximo. Pensado para búsquedas pequeñas y repetidas (L1); seguro entre hilos.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._datos = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            if entrada[0] <= time.monotonic():
+                del self._datos[clave]
+                return None
+            return entrada[1]
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            if len(self._datos) >= self.maxsize and clave not in self._datos:
+                # Se descarta la entrada más antigua (orden de inserción)
+                self._datos.pop(next(iter(self._datos)))
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+
+    def invalidar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+def clave_producto(id_producto):
+    return f"producto:info:{id_producto}"
+
+def clave_id_cliente(id_usuario):
+    return f"u2c:{id_usuario}"
+
+# El catálogo y el detalle de productos llevan la versión de los productos en la
+# clave (ver version_cache_productos): una lectura que termina después de una
+# escritura guarda su resultado bajo la versión anterior, que ya nadie consulta.
+def clave_catalogo(version):
+    return f"productos:all:{version}"
+
+# Respuestas completas del catálogo ya comprimidas, una por algoritmo (Content-Encoding)
+ALGORITMOS_CATALOGO = ("br", "gzip")
+
+def clave_catalogo_comprimido(version, algoritmo):
+    return f"{clave_catalogo(version)}:{algoritmo}"
+
+def clave_detalle_producto(version, id_producto):
+    return f"productos:{version}:{id_producto}"
+
+# Contadores que cambian con cada escritura y alimentan los ETag de los GET: uno
+# para los datos de productos y uno por producto para su listado de reseñas. Sin
+# Redis los contadores son del proceso (con un identificador del proceso delante):
+# sirven para las claves de la caché local, pero no para un ETag, porque una
+# escritura atendida por otro worker no cambia la versión de este y el cliente
+# recibiría 304 con datos viejos indefinidamente.
+CLAVE_VERSION_PRODUCTOS = "productos:etag"
+_ID_PROCESO = os.urandom(4).hex()
+_versiones_locales = {}
+
+def clave_version_resenas(id_producto):
+    return f"resenas:etag:{id_producto}"
+
+def _leer_version(clave):
+    cliente = obtener_cliente_redis()
+    if cliente is None:
+        with _local_lock:
+            return f"{_ID_PROCESO}.{_versiones_locales.get(clave, 0)}"
+    try:
+        valor = cliente.get(clave)
+    except Exception:
+        logger.warning("No se pudo leer la versión %s", clave, exc_info=True)
+        return None
+    return int(valor) if valor is not None else 0
+
+def _incrementar_versiones(*claves):
+    cliente = obtener_cliente_redis()
+    if cliente is None:
+        with _local_lock:
+            for clave in claves:
+                _versiones_locales[clave] = _versiones_locales.get(clave, 0) + 1
+        return
+    try:
+        pipe = cliente.pipeline(transaction=False)
+        for clave in claves:
+            pipe.incr(clave)
+        pipe.execute()
+    except Exception:
+        logger.warning("No se pudieron incrementar las versiones", exc_info=True)
+
+def versiones_compartidas():
+    """True si las versiones son comunes a todos los workers (Redis) y sirven de ETag."""
+    return obtener_cliente_redis() is not None
+
+def version_cache_productos():
+    """
+    Versión de los datos de productos para las claves de la caché y, con Redis, para
+    los ETag. Sin Redis es la del proceso (su caché local solo la invalidan sus
+    propias escrituras) y no sirve de ETag. None si no se puede leer: en ese caso no
+    se usa la caché ni se responde 304.
+    """
+    return _leer_version(CLAVE_VERSION_PRODUCTOS)
+
+def version_resenas(id_producto):
+    """
+    Versión del listado de reseñas aprobadas de un producto, para su clave de caché
+    y (con Redis) su ETag; sin Redis y con None, como en version_cache_productos.
+    """
+    return _leer_version(clave_version_resenas(id_producto))
+
+# Las respuestas del listado de ventas del administrador llevan la versión de las
+# ventas en la clave: invalidar es incrementarla (sin KEYS ni borrados por patrón) y
+# las entradas de versiones anteriores simplemente expiran.
+CLAVE_VERSION_VENTAS = "ventas:version"
+
+def version_ventas():
+    """Versión actual de los datos de ventas; None como en version_cache_productos."""
+    return _leer_version(CLAVE_VERSION_VENTAS)
+
+def clave_ventas_admin(version, filtros):
+    """Clave del listado de ventas para una versión y una tupla de valores de filtros."""
+    return f"ventas:admin:{version}:{hashlib.blake2b(a_json(filtros), digest_size=8).hexdigest()}"
+
+def invalidar_ventas():
+    """Invalida los listados de ventas en caché después de una escritura."""
+    _incrementar_versiones(CLAVE_VERSION_VENTAS)
+
+def invalidar_catalogo():
+    """Invalida el listado de productos; se llama después de confirmar un alta."""
+    _incrementar_versiones(CLAVE_VERSION_PRODUCTOS)
+
+def invalidar_producto(id_producto):
+    """Invalida todas las entradas que dependen de los datos de un producto."""
+    invalidar_productos([id_producto])
+
+def invalidar_productos(ids_productos):
+    """Como invalidar_producto, para varios productos a la vez (una sola escritura en la caché)."""
+    # El catálogo, los detalles y los listados de reseñas quedan invalidados al cambiar las versiones
+    invalidar(*(clave_producto(id_producto) for id_producto in ids_productos))
+    # Un producto eliminado deja sin listado de reseñas (404): también cambia su versión
+    _incrementar_versiones(CLAVE_VERSION_PRODUCTOS, *(clave_version_resenas(id_producto) for id_producto in ids_productos))
+
+def _leer_crudos(claves):
+    cliente = obtener_cliente_redis()
+    if cliente is None:
+        return _leer_local(claves)
+    try:
+        return cliente.mget(claves)
+    except Exception:
+        logger.warning("No se pudo leer de la caché", exc_info=True)
+        return [None] * len(claves)
+
+def clave_resenas_producto(version, id_producto):
+    # Con la versión en la clave, un listado armado antes de una escritura queda bajo la versión anterior
+    return f"resenas:prod:{id_producto}:{version}"
+
+def invalidar_resenas(id_producto):
+    """Invalida el listado de reseñas aprobadas de un producto después de una escritura."""
+    _incrementar_versiones(clave_version_resenas(id_producto))
+
+def obtener_muchos(claves):
+    """
+    Lee varias claves de la caché. Devuelve una lista alineada con `claves`
+    con None en cada fallo. Un error de Redis se trata como fallo de caché.
+    """
+    if not claves:
+        return []
+    return [desde_json(valor) if valor is not None else None for valor in _leer_crudos(claves)]
+
+def obtener(clave):
+    return obtener_muchos([clave])[0]
+
+def obtener_crudo(clave):
+    """Devuelve el JSON guardado en `clave` tal cual (bytes), sin deserializarlo."""
+    return _leer_crudos([clave])[0]
+
+def guardar_muchos(valores, ttl):
+    """Guarda un diccionario {clave: valor} en la caché con el TTL indicado."""
+    if not valores:
+        return
+    _guardar_crudos({clave: a_json(valor) for clave, valor in valores.items()}, ttl)
+
+def _guardar_crudos(serializados, ttl):
+    cliente = obtener_cliente_redis()
+    if cliente is None:
+        _guardar_local(serializados, ttl)
+        return
+    try:
+        pipe = cliente.pipeline(transaction=False)
+        for clave, valor in serializados.items():
+            pipe.set(clave, valor, ex=ttl)
+        pipe.execute()
+    except Exception:
+        logger.warning("No se pudo escribir en la caché", exc_info=True)
+
+def guardar(clave, valor, ttl):
+    guardar_muchos({clave: valor}, ttl)
+
+def guardar_crudo(clave, datos, ttl):
+    """Guarda JSON ya serializado (bytes) en `clave`."""
+    _guardar_crudos({clave: datos}, ttl)
+
+def invalidar(*claves):
+    if not claves:
+        return
+    cliente = obtener_cliente_redis()
+    if cliente is None:
+        with _local_lock:
+            for clave in claves:
+                _local.pop(clave, None)
+        return
+    try:
+        cliente.delete(*claves)
+    except Exception:
+        logger.warning("No se pudo invalidar la caché", exc_info=True)
+
+# Candado para reconstruir una entrada: si expira (p. ej. el worker murió) otro puede tomarlo
+_TTL_CANDADO = 10
+_ESPERA_CANDADO = 0.05
+_INTENTOS_CANDADO = 20
+
+def obtener_o_construir_crudo(clave, ttl, construir):
+    """
+    Cache-aside para JSON ya serializado. En un fallo, solo el worker que toma el
+    candado (SET NX en Redis) ejecuta `construir`; los demás esperan brevemente a
+    que aparezca el valor en vez de repetir la misma consulta (evita estampidas).
+    `construir` devuelve bytes, o None para no guardar nada (p. ej. un 404).
+    Sin Redis no hay candado: cada proceso construye su propia copia local.
+    """
+    datos = obtener_crudo(clave)
+    if datos is not None:
+        return datos
+
+    cliente = obtener_cliente_redis()
+    candado = f"lock:{clave}"
+    tengo_candado = False
+    if cliente is not None:
+        try:
+            tengo_candado = bool(cliente.set(candado, b"1", nx=True, ex=_TTL_CANDADO))
+        except Exception:
+            logger.warning("No se pudo tomar el candado de la caché", exc_info=True)
+            # Redis no responde: no tiene sentido esperar a otro worker
+            tengo_candado = None
+        if tengo_candado is False:
+            for _ in range(_INTENTOS_CANDADO):
+                time.sleep(_ESPERA_CANDADO)
+                datos = obtener_crudo(clave)
+                if datos is not None:
+                    return datos
+
+    try:
+        datos = construir()
+        if datos is not None:
+            guardar_crudo(clave, datos, ttl)
+        return datos
+    finally:
+        if tengo_candado:
+            try:
+                cliente.delete(candado)
+            except Exception:
+                logger.warning("No se pudo liberar el candado de la caché", exc_info=True)
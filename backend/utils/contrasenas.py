@@ -0,0 +1,75 @@
+import os
+from functools import lru_cache
+
+import bcrypt
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+
+try:
+    from gevent import get_hub
+    from gevent.monkey import is_module_patched
+except ImportError:
+    get_hub = None
+
+# Las contraseñas nuevas se guardan con argon2id (parámetros para ~100 ms por hash).
+# Los hashes bcrypt existentes ($2a$/$2b$) se siguen aceptando y se reemplazan por
+# uno argon2id la próxima vez que el usuario inicia sesión.
+_hasher = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=2)
+
+# Longitud máxima (caracteres) que se acepta para una contraseña: evita gastar un
+# hash completo en entradas absurdamente largas.
+LONGITUD_MAXIMA = 128
+# bcrypt solo usa los primeros 72 bytes; las versiones anteriores de la librería
+# truncaban en silencio, así que los hashes heredados se verifican igual.
+_LIMITE_BCRYPT = 72
+
+def _fuera_del_bucle(funcion, *args):
+    """
+    Ejecuta un cálculo costoso de hash. argon2 y bcrypt liberan el GIL, así que
+    con hilos normales no frenan a las demás peticiones; pero en un worker gevent
+    una llamada en C detiene el bucle de eventos entero. En ese caso se ejecuta en
+    el pool de hilos reales de gevent y solo espera esta petición.
+    """
+    if get_hub is not None and is_module_patched('threading'):
+        return get_hub().threadpool.apply(funcion, args)
+    return funcion(*args)
+
+def _a_bytes(hash_guardado):
+    # La columna puede devolver texto (VARCHAR) o bytes (VARBINARY); ambos son ASCII
+    return hash_guardado if isinstance(hash_guardado, bytes) else hash_guardado.encode('ascii')
+
+def _es_bcrypt(hash_guardado):
+    return _a_bytes(hash_guardado).startswith(b'$2')
+
+@lru_cache(maxsize=1)
+def _hash_ficticio():
+    """Hash argon2 de relleno, calculado una vez, para verificar cuando el usuario no existe."""
+    return _hasher.hash(os.urandom(16).hex())
+
+def _verificar(contrasena, hash_guardado):
+    if _es_bcrypt(hash_guardado):
+        return bcrypt.checkpw(contrasena.encode('utf-8')[:_LIMITE_BCRYPT], _a_bytes(hash_guardado))
+    try:
+        return _hasher.verify(hash_guardado, contrasena)
+    except (VerificationError, InvalidHashError):
+        return False
+
+def hash_contrasena(contrasena):
+    """Devuelve el hash (texto) que se guarda en usuarios.contrasena."""
+    return _fuera_del_bucle(_hasher.hash, contrasena)
+
+def verificar_contrasena(contrasena, hash_guardado):
+    """
+    True si `contrasena` corresponde a `hash_guardado` (argon2id o bcrypt). Con
+    `hash_guardado` None (usuario inexistente) se verifica contra un hash de relleno
+    y se devuelve False, para que la respuesta tarde lo mismo que con un usuario
+    real y no revele qué cuentas existen.
+    """
+    if hash_guardado is None:
+        _fuera_del_bucle(_verificar, contrasena, _hash_ficticio())
+        return False
+    return _fuera_del_bucle(_verificar, contrasena, hash_guardado)
+
+def necesita_rehash(hash_guardado):
+    """True si el hash es bcrypt o argon2 con parámetros distintos de los actuales."""
+    return _es_bcrypt(hash_guardado) or _hasher.check_needs_rehash(hash_guardado)
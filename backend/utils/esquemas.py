@@ -0,0 +1,53 @@
+from typing import Annotated, Literal, Optional
+
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field
+
+from utils.helpers import limpiar_string
+
+# Texto normalizado con limpiar_string antes de validarlo
+Texto = Annotated[str, BeforeValidator(limpiar_string)]
+
+class ProductoIn(BaseModel):
+    """Cuerpo de POST /productos. Modo estricto: no se aceptan números como texto ni viceversa."""
+    model_config = ConfigDict(strict=True)
+
+    nombre_producto: Annotated[Texto, Field(min_length=1)]
+    id_categoria: Annotated[int, Field(gt=0)]
+    precio: Annotated[float, Field(gt=0)]
+    stock: Annotated[int, Field(ge=0)]
+    descripcion: Optional[Texto] = None
+    unidad_medida: Optional[Texto] = None
+
+class ProductoUpdateIn(BaseModel):
+    """Cuerpo de PUT /productos/<id>. Los campos ausentes o en null no se modifican."""
+    model_config = ConfigDict(strict=True)
+
+    nombre_producto: Optional[Texto] = None
+    id_categoria: Optional[Annotated[int, Field(gt=0)]] = None
+    precio: Optional[Annotated[float, Field(gt=0)]] = None
+    stock: Optional[Annotated[int, Field(ge=0)]] = None
+    descripcion: Optional[Texto] = None
+    unidad_medida: Optional[Texto] = None
+
+Calificacion = Annotated[int, Field(ge=1, le=5)]
+
+class CrearResenaIn(BaseModel):
+    """Cuerpo de POST /resenas."""
+    model_config = ConfigDict(strict=True)
+
+    id_producto: Annotated[int, Field(gt=0)]
+    calificacion: Calificacion
+    comentario: Optional[Texto] = None
+
+class ActualizarResenaIn(BaseModel):
+    """Cuerpo de PUT /resenas/my_reviews/<id>. Los campos ausentes o en null no se modifican."""
+    model_config = ConfigDict(strict=True)
+
+    calificacion: Optional[Calificacion] = None
+    comentario: Optional[Texto] = None
+
+class AprobarResenaIn(BaseModel):
+    """Cuerpo de PUT /resenas/admin/<id>/aprobar."""
+    model_config = ConfigDict(strict=True)
+
+    aprobada: Literal[0, 1]
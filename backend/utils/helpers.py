@@ -1,28 +1,183 @@
+import hashlib
 import re
 from datetime import datetime
+import atexit
 import logging
-from flask import jsonify 
+import logging.handlers
+import queue
+from flask import Response, request, stream_with_context
 from contextlib import contextmanager 
-import pymysql.cursors 
+from functools import lru_cache
 
-from utils.db import conectar_db
+from utils.cache import CacheTTL, TTL_ID_CLIENTE, clave_id_cliente, guardar, invalidar, obtener
+from utils.serializacion import a_json
+from utils.db import Cursor, DictCursor, SSCursor, SSDictCursor, obtener_pool, obtener_pool_dedicado, obtener_pool_lectura
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def api_response(data=None, message="Operación exitosa.", status_code=200, error=None):
+_log_listener = None
+
+def iniciar_logging_en_cola():
+    """
+    Mueve los handlers del logger raíz detrás de una cola atendida por un hilo
+    en segundo plano, de modo que los hilos de las peticiones nunca se bloquean
+    escribiendo en stderr o en disco.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return
+
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    for handler in handlers:
+        root.removeHandler(handler)
+
+    cola = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(cola))
+    _log_listener = logging.handlers.QueueListener(cola, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+class ErrorDominio(Exception):
+    """
+    Resultado esperado que corta una operación (no encontrado, duplicado, conflicto).
+    Lanzada dentro de db_session revierte la transacción; el manejador de la
+    aplicación la convierte en api_response con su mensaje y código HTTP.
+    """
+
+    def __init__(self, mensaje, status_code=400):
+        super().__init__(mensaje)
+        self.mensaje = mensaje
+        self.status_code = status_code
+
+@lru_cache(maxsize=512)
+def _cuerpo_sin_datos(message):
+    """Cuerpo ya serializado de las respuestas sin datos (errores, 404, confirmaciones)."""
+    return a_json({"mensaje": message, "data": None})
+
+def api_response(data=None, message="Operación exitosa.", status_code=200, error=None, paginacion=None):
     """
     Estandariza las respuestas de la API en formato JSON.
-    Recibe datos, un mensaje, un código de estado HTTP y un error opcional.
+    Recibe datos, un mensaje, un código de estado HTTP, un error opcional y,
+    en los listados paginados, el cursor de la página siguiente.
     """
+    if data is None and not error and paginacion is None:
+        return Response(_cuerpo_sin_datos(message), mimetype='application/json'), status_code
     response_payload = {
         "mensaje": message,
         "data": data
     }
     if error:
         response_payload["error"] = error
-    return jsonify(response_payload), status_code
+    if paginacion is not None:
+        response_payload["paginacion"] = paginacion
+    return Response(a_json(response_payload), mimetype='application/json'), status_code
+
+def api_response_stream(filas, message="Operación exitosa.", status_code=200, paginacion=None, al_terminar=None):
+    """
+    Variante de api_response para listados grandes: serializa `filas` (un iterable)
+    elemento por elemento a medida que se envía, sin armar la lista completa en memoria.
+    El primer elemento se obtiene antes de responder para que los errores de la
+    consulta todavía puedan devolverse como un 500 normal. `paginacion`, si se indica,
+    es una función que se llama al terminar de recorrer las filas. `al_terminar`, si
+    se indica, recibe el arreglo "data" ya serializado (bytes) cuando el envío termina
+    completo, por ejemplo para guardarlo en caché.
+    """
+    filas = iter(filas)
+    primera = next(filas, None)
+
+    def generar():
+        partes = [] if al_terminar is not None else None
+        yield b'{"data":'
+        fragmento = b'['
+        if primera is not None:
+            fragmento += a_json(primera)
+            for fila in filas:
+                if partes is not None:
+                    partes.append(fragmento)
+                yield fragmento
+                fragmento = b',' + a_json(fila)
+        fragmento += b']'
+        if partes is not None:
+            partes.append(fragmento)
+            al_terminar(b''.join(partes))
+        yield fragmento
+        yield b',"mensaje":' + a_json(message)
+        if paginacion is not None:
+            yield b',"paginacion":' + a_json(paginacion())
+        yield b'}'
+
+    return Response(stream_with_context(generar()), status=status_code, mimetype='application/json')
+
+def api_response_crudo(data_json, message="Operación exitosa.", status_code=200):
+    """
+    Como api_response, pero con el campo "data" ya serializado (bytes), por
+    ejemplo leído de la caché, para no deserializarlo y volver a serializarlo.
+    """
+    cuerpo = b'{"data":' + data_json + b',"mensaje":' + a_json(message) + b'}'
+    return Response(cuerpo, mimetype='application/json'), status_code
+
+def api_response_cuerpo(cuerpo, status_code=200):
+    """
+    Respuesta con el cuerpo JSON completo ya serializado (bytes), con las mismas
+    claves que api_response; por ejemplo, una página guardada en la caché junto con su cursor.
+    """
+    return Response(cuerpo, mimetype='application/json'), status_code
+
+def valor_etag(*partes):
+    """Valor corto para un ETag, derivado de los datos que determinan la respuesta."""
+    return hashlib.blake2b('|'.join(str(parte) for parte in partes).encode('utf-8'), digest_size=8).hexdigest()
+
+def _agregar_cabeceras_cache(respuesta, etag, max_age):
+    respuesta.set_etag(etag, weak=True)
+    # Con max_age=0 el cliente debe revalidar siempre (If-None-Match) antes de usar su copia
+    respuesta.headers['Cache-Control'] = f'private, max-age={max_age}' + (', must-revalidate' if max_age == 0 else '')
+
+def etag_coincide(etag):
+    """True si el cliente ya tiene esta versión (If-None-Match, comparación débil)."""
+    return request.if_none_match.contains_weak(etag)
+
+def respuesta_no_modificada(etag, max_age=30):
+    """Respuesta 304 vacía con las mismas cabeceras de caché que la respuesta completa."""
+    respuesta = Response(status=304)
+    _agregar_cabeceras_cache(respuesta, etag, max_age)
+    return respuesta
+
+def con_etag(respuesta_api, etag, max_age=30):
+    """
+    Agrega ETag y Cache-Control a la tupla (respuesta, código) de api_response
+    o a la respuesta de api_response_stream.
+    """
+    if isinstance(respuesta_api, Response):
+        _agregar_cabeceras_cache(respuesta_api, etag, max_age)
+        return respuesta_api
+    respuesta, status_code = respuesta_api
+    _agregar_cabeceras_cache(respuesta, etag, max_age)
+    return respuesta, status_code
+
+def obtener_limite(valor, defecto=50, maximo=200):
+    """
+    Convierte el parámetro de consulta `limit` en un entero entre 1 y `maximo`.
+    Lanza ValueError si no es un número entero.
+    """
+    if valor is None or valor == '':
+        return defecto
+    try:
+        limite = int(valor)
+    except (TypeError, ValueError):
+        raise ValueError("El parámetro 'limit' debe ser un número entero.")
+    return max(1, min(limite, maximo))
+
+def cuerpo_json():
+    """
+    Devuelve el cuerpo JSON de la petición como diccionario. Un cuerpo ausente,
+    mal formado o que no es un objeto se trata como {} para que las validaciones
+    de campos requeridos respondan 400 en lugar de fallar con un 500.
+    """
+    data = request.get_json(silent=True)
+    return data if isinstance(data, dict) else {}
 
 def limpiar_string(cadena):
     """
@@ -31,14 +186,22 @@ def limpiar_string(cadena):
     """
     if not isinstance(cadena, str):
         return cadena
-    # Eliminar espacios extra y dejar solo uno entre palabras, luego trim
-    return re.sub(r'\s+', ' ', cadena).strip()
+    # Caso común (nombres, emails): texto ASCII sin controles ni espacios dobles. En
+    # ASCII isprintable() descarta todos los separadores salvo el espacio, así que
+    # la cadena ya está limpia y no hace falta partirla y volver a unirla.
+    recortada = cadena.strip()
+    if recortada.isascii() and recortada.isprintable() and '  ' not in recortada:
+        return recortada
+    # split() sin argumentos corta en cualquier secuencia de espacios (los mismos que \s)
+    # y descarta los de los extremos: equivale a re.sub(r'\s+', ' ', ...).strip() en un solo paso en C
+    return ' '.join(recortada.split())
+
+# Patrón de regex para una validación de email estándar, compilado una sola vez
+EMAIL_RE = re.compile(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}")
 
 def es_email_valido(email):
     """Verifica si una cadena tiene un formato de email básico válido."""
-    # Patrón de regex para una validación de email estándar
-    patron = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
-    return re.match(patron, email) is not None
+    return EMAIL_RE.fullmatch(email) is not None
 
 def formatear_fecha_hora(dt_obj, formato="%Y-%m-%d %H:%M:%S"):
     """Formatea un objeto datetime a una cadena de texto."""
@@ -55,27 +218,117 @@ def log_accion(tipo_accion, mensaje, nivel='info'):
     elif nivel == 'error':
         logger.error(f"{tipo_accion}: {mensaje}")
 
+# Sentencias de inicio de transacción según el nivel de aislamiento pedido
+_INICIO_TRANSACCION = {
+    'RC': ("SET TRANSACTION ISOLATION LEVEL READ COMMITTED", "START TRANSACTION READ ONLY"),
+}
+
+def _obtener_conexion(readonly, autocommit=False, lotes=False):
+    """Toma una conexión de una réplica si `readonly`; si falla o no hay réplicas, de la principal."""
+    if autocommit or lotes:
+        pool = obtener_pool_dedicado(autocommit, lotes)
+        return pool, pool.obtener()
+    if readonly:
+        pool = obtener_pool_lectura()
+        if pool is not None:
+            try:
+                return pool, pool.obtener()
+            except Exception as e:
+                logger.warning(f"Réplica de lectura no disponible, se usa la base principal: {e}")
+    pool = obtener_pool()
+    return pool, pool.obtener()
+
 @contextmanager
-def db_session():
+def db_session(readonly=False, server_side=False, isolation=None, tuplas=False, autocommit=False, lotes=False):
     """
     Proporciona una sesión de base de datos con manejo automático de conexión, cursor,
-    commit y rollback. Garantiza que la conexión se cierra siempre.
+    commit y rollback. La conexión se toma del pool y se devuelve al terminar.
+    Con readonly=True la sesión puede atenderse desde una réplica (REPLICA_URLS).
+    Con server_side=True el cursor no carga el resultado completo en memoria; las
+    filas se leen del servidor a medida que se recorren.
+    Con isolation='RC' la sesión abre una transacción de solo lectura en
+    READ COMMITTED, para lecturas que no necesitan una instantánea estable.
+    Con tuplas=True el cursor devuelve tuplas en lugar de diccionarios, para
+    listados que arman sus objetos con nombres de columna conocidos.
+    Una sesión readonly no envía COMMIT: en una réplica (autocommit) no hay
+    transacción que cerrar, y en la principal se hace rollback para liberar la
+    vista de lectura de la transacción implícita.
+    Con autocommit=True la conexión sale de un pool en modo autocommit: cada
+    sentencia se confirma sola y no se envía COMMIT. Solo para handlers cuya
+    escritura es una única sentencia (no hay nada que revertir en conjunto).
+    Con lotes=True la conexión acepta varias sentencias separadas por ';' en un
+    mismo execute (los resultados se recorren con cursor.nextset()). Las demás
+    conexiones no lo permiten.
     """
+    pool = None
     conn = None
     cursor = None
+    reutilizable = True
     try:
-        conn = conectar_db()
-        cursor = conn.cursor(pymysql.cursors.DictCursor) 
-        yield conn, cursor 
-        conn.commit() 
-    except Exception as e:
-        if conn:
+        pool, conn = _obtener_conexion(readonly, autocommit, lotes)
+        if isolation:
+            # SET TRANSACTION (sin SESSION) solo afecta a la transacción siguiente,
+            # así que la conexión vuelve al pool con el nivel por defecto.
+            with conn.cursor(DictCursor) as cursor_aislamiento:
+                for sentencia in _INICIO_TRANSACCION[isolation]:
+                    cursor_aislamiento.execute(sentencia)
+        if tuplas:
+            cursor = conn.cursor(SSCursor if server_side else Cursor)
+        else:
+            cursor = conn.cursor(SSDictCursor if server_side else DictCursor)
+        yield conn, cursor
+        if not (readonly or autocommit):
+            conn.commit()
+        elif isolation or not conn.get_autocommit():
             conn.rollback()
-        logger.error(f"Error en la sesión de base de datos: {e}")
+    except BaseException as e:
+        # BaseException: una sesión abierta dentro de un generador de respuesta recibe
+        # GeneratorExit si el cliente se desconecta, y la conexión no debe volver al
+        # pool con la transacción (o la vista de lectura) abierta
+        if conn:
+            try:
+                conn.rollback()
+            except Exception:
+                # La conexión quedó inservible; no se devuelve al pool
+                reutilizable = False
+        # Un ErrorDominio es un resultado esperado, y GeneratorExit no es un error:
+        # se revierte sin registrarlo
+        if isinstance(e, Exception) and not isinstance(e, ErrorDominio):
+            logger.exception("Error en la sesión de base de datos")
         raise
     finally:
         if cursor:
             cursor.close()
         if conn:
-            conn.close()
+            if reutilizable:
+                pool.liberar(conn)
+            else:
+                pool.descartar(conn)
+
+# id_usuario -> id_cliente. La relación solo cambia al eliminar el perfil de cliente.
+_ids_cliente = CacheTTL(maxsize=10000, ttl=300)
+
+def obtener_id_cliente(cursor, id_usuario):
+    """
+    Devuelve el id_cliente asociado a un usuario (o None si no tiene perfil de
+    cliente). Se memoriza en el proceso durante 5 minutos y en la caché
+    compartida (Redis) durante una hora, así los demás workers también lo ven.
+    """
+    id_usuario = int(id_usuario)
+    id_cliente = _ids_cliente.obtener(id_usuario)
+    if id_cliente is not None:
+        return id_cliente
+    id_cliente = obtener(clave_id_cliente(id_usuario))
+    if id_cliente is None:
+        cursor.execute("SELECT id_cliente FROM clientes WHERE id_usuario = %s", (id_usuario,))
+        cliente_info = cursor.fetchone()
+        if not cliente_info:
+            return None
+        id_cliente = cliente_info['id_cliente']
+        guardar(clave_id_cliente(id_usuario), id_cliente, TTL_ID_CLIENTE)
+    _ids_cliente.guardar(id_usuario, id_cliente)
+    return id_cliente
 
+def invalidar_id_cliente(id_usuario):
+    _ids_cliente.invalidar(int(id_usuario))
+    invalidar(clave_id_cliente(int(id_usuario)))
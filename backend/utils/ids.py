@@ -0,0 +1,30 @@
+import os
+import threading
+import uuid
+
+# Reserva de bytes aleatorios para generar UUID v4 sin una llamada a
+# os.urandom() (syscall) por cada pago.
+_TAMANO_UUID = 16
+_UUIDS_POR_RECARGA = 1024
+
+_uuid_pool = bytearray()
+_uuid_offset = 0
+_uuid_lock = threading.Lock()
+
+def siguiente_uuid_bytes():
+    """Devuelve 16 bytes de un UUID v4 (RFC 4122 §4.4) tomados de la reserva."""
+    global _uuid_pool, _uuid_offset
+    with _uuid_lock:
+        if _uuid_offset >= len(_uuid_pool):
+            _uuid_pool = bytearray(os.urandom(_TAMANO_UUID * _UUIDS_POR_RECARGA))
+            _uuid_offset = 0
+        inicio = _uuid_offset
+        _uuid_offset += _TAMANO_UUID
+    valor = _uuid_pool[inicio:inicio + _TAMANO_UUID]
+    valor[6] = (valor[6] & 0x0F) | 0x40  # versión 4
+    valor[8] = (valor[8] & 0x3F) | 0x80  # variante RFC 4122
+    return bytes(valor)
+
+def nuevo_transaccion_id():
+    """ID de transacción en el formato texto que guarda pagos.transaccion_id."""
+    return str(uuid.UUID(bytes=siguiente_uuid_bytes()))
@@ -0,0 +1,41 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import orjson
+from flask.json.provider import JSONProvider
+from werkzeug.http import http_date
+
+def _json_default(obj):
+    """Tipos que orjson no serializa por sí solo, con el mismo formato que usaba jsonify."""
+    if isinstance(obj, (datetime, date)):
+        return http_date(obj)
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (bytes, bytearray)):
+        return obj.decode('utf-8')
+    return str(obj)
+
+_OPCIONES_JSON = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+def a_json(obj):
+    """Serializa a JSON (bytes) con orjson."""
+    return orjson.dumps(obj, default=_json_default, option=_OPCIONES_JSON)
+
+def desde_json(datos):
+    return orjson.loads(datos)
+
+class ORJSONProvider(JSONProvider):
+    """
+    Proveedor JSON de Flask basado en orjson: lo usan jsonify, request.get_json
+    y los manejadores que no pasan por api_response. Mismo formato que a_json.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return a_json(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Se arma la respuesta con los bytes de orjson, sin pasar por str
+        return self._app.response_class(a_json(self._prepare_response_obj(args, kwargs)), mimetype='application/json')